@@ -2,6 +2,8 @@
 ASGI config for jualearn_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests to the notification stream are served by a dedicated server-sent
+events app; everything else goes to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -11,6 +13,22 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jualearn_backend.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jualearnbackend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up because it loads models
+from django.conf import settings  # noqa: E402
+from users.autocomplete import warm_in_background  # noqa: E402
+from users.events import notification_stream  # noqa: E402
+
+if settings.AUTOCOMPLETE_WARM_ON_STARTUP:
+    warm_in_background()
+
+NOTIFICATION_STREAM_PATH = '/api/notifications/stream/'
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == NOTIFICATION_STREAM_PATH:
+        return await notification_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -114,7 +114,7 @@ AUTHENTICATION_BACKENDS = [
 # Django REST Framework & JWT settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -122,6 +122,11 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Read requests authenticate from the token and a per-process cache of user state
+# that is re-read from the database at most this often (see users/authentication.py)
+JWT_USER_CACHE_SECONDS = float(os.getenv('JWT_USER_CACHE_SECONDS', '30'))
+JWT_USER_CACHE_SIZE = 10000
+
 # Djoser settings
 DJOSER = {
     'USER_CREATE_PASSWORD_RETYPE': True,
@@ -130,6 +135,64 @@ DJOSER = {
 
 CONTENT_FOLDER = os.path.join(BASE_DIR, 'content')
 
+# Max number of quiz answer keys kept in memory by each worker process
+ANSWER_KEY_CACHE_SIZE = int(os.getenv('ANSWER_KEY_CACHE_SIZE', '256'))
+
+# Quiz analytics are cached per quiz in the default cache; keys change with every
+# submission, the timeout only bounds how long retired entries linger
+ANALYTICS_CACHE_TIMEOUT = int(os.getenv('ANALYTICS_CACHE_TIMEOUT', '3600'))
+
+# Subject leaderboards: rows shown by default and at most (?limit=)
+LEADERBOARD_SIZE = 10
+LEADERBOARD_MAX_SIZE = 100
+
+# Cached catalog lists (users/catalog.py); keys change with every edit, the
+# timeout only bounds how long retired entries linger
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '3600'))
+
+# Rendered lesson bodies are cached by content hash, so they never go stale;
+# the timeout only frees the space of bodies nobody reads
+LESSON_BODY_CACHE_TIMEOUT = int(os.getenv('LESSON_BODY_CACHE_TIMEOUT', '86400'))
+
+# Offline subject bundles (users/bundles.py): versions a client can still get a
+# delta from, and how long encoded deltas stay cached
+BUNDLE_HISTORY = int(os.getenv('BUNDLE_HISTORY', '20'))
+BUNDLE_CACHE_TIMEOUT = int(os.getenv('BUNDLE_CACHE_TIMEOUT', '86400'))
+
+# Change feed (users/changes.py): events read per /api/sync/ page by default and at most (?limit=)
+SYNC_PAGE_SIZE = 500
+SYNC_MAX_PAGE_SIZE = 2000
+
+
+# Notification fan-out: 'thread' delivers in a background thread of the web worker,
+# 'worker' leaves jobs in the database queue for `manage.py notificationworker`
+NOTIFICATION_FANOUT_MODE = os.getenv('NOTIFICATION_FANOUT_MODE', 'thread')
+NOTIFICATION_FANOUT_CHUNK_SIZE = int(os.getenv('NOTIFICATION_FANOUT_CHUNK_SIZE', '1000'))
+
+# Server-sent events stream at /api/notifications/stream/ (served by asgi.py)
+NOTIFICATION_STREAM_BACKEND = 'users.events.DatabasePollingBackend'
+NOTIFICATION_STREAM_POLL_INTERVAL = float(os.getenv('NOTIFICATION_STREAM_POLL_INTERVAL', '2'))
+NOTIFICATION_STREAM_HEARTBEAT = float(os.getenv('NOTIFICATION_STREAM_HEARTBEAT', '15'))
+# Rows read per query: by each poll of the backend, and per page when replaying what a reconnecting client missed
+NOTIFICATION_STREAM_BATCH_SIZE = int(os.getenv('NOTIFICATION_STREAM_BATCH_SIZE', '500'))
+NOTIFICATION_STREAM_REPLAY_LIMIT = int(os.getenv('NOTIFICATION_STREAM_REPLAY_LIMIT', '100'))
+
+# Search: the backend is picked from the database unless SEARCH_BACKEND names one
+# (e.g. 'users.search.SimpleSearchBackend'); slower searches are cancelled
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND') or None
+SEARCH_TIMEOUT_MS = int(os.getenv('SEARCH_TIMEOUT_MS', '500'))
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+
+# Autocomplete: each worker keeps a prefix index of titles in memory, built at
+# startup, polled for other workers' changes and rebuilt to drop deleted rows
+AUTOCOMPLETE_WARM_ON_STARTUP = os.getenv('AUTOCOMPLETE_WARM_ON_STARTUP', 'true').lower() == 'true'
+AUTOCOMPLETE_REFRESH_SECONDS = float(os.getenv('AUTOCOMPLETE_REFRESH_SECONDS', '5'))
+AUTOCOMPLETE_REBUILD_SECONDS = float(os.getenv('AUTOCOMPLETE_REBUILD_SECONDS', '300'))
+AUTOCOMPLETE_MAX_SCAN = 2000
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_MAX_LIMIT = 20
+
 
 # CORS headers configuration
 CORS_ALLOWED_ORIGINS = [
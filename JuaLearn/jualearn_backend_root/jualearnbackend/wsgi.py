@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jualearnbackend.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.AUTOCOMPLETE_WARM_ON_STARTUP:
+    from users.autocomplete import warm_in_background
+    warm_in_background()
@@ -0,0 +1,242 @@
+"""
+Show the query plan of every hot view query with and without the indexes
+added by users 0026_hot_path_indexes.
+
+The script migrates a scratch database, seeds it with a realistic spread of
+rows (one million notifications by default, the other tables scaled from
+that), drops those indexes, prints EXPLAIN for each query, puts the indexes
+back and prints the plans again.
+
+    python scripts/explain_queries.py --database-url sqlite:////tmp/explain.sqlite3
+    python scripts/explain_queries.py --database-url postgres://localhost/jualearn_explain --rows 1000000
+
+Point it at a scratch database: it creates and fills tables there. Seeding is
+skipped when the database already has data, so later runs only compare plans.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jualearnbackend.settings')
+
+INDEX_MIGRATION = ('users', '0026_hot_path_indexes')
+BATCH_SIZE = 10_000
+
+
+def configure(database_url):
+    import dj_database_url
+    import django
+    from django.conf import settings
+    settings.DATABASES['default'] = dj_database_url.parse(database_url)
+    django.setup()
+
+
+def migrate():
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def hot_path_indexes():
+    """
+    (model, index) for each index the index migration added that the models still declare.
+    """
+    from django.apps import apps
+    from django.db.migrations.loader import MigrationLoader
+    from django.db.migrations.operations import AddIndex
+    migration = MigrationLoader(None, ignore_no_migrations=True).get_migration(*INDEX_MIGRATION)
+    for operation in migration.operations:
+        if isinstance(operation, AddIndex):
+            model = apps.get_model('users', operation.model_name)
+            if any(index.name == operation.index.name for index in model._meta.indexes):
+                yield model, operation.index
+
+
+def set_indexes(enabled):
+    from django.db import connection
+    with connection.schema_editor() as editor:
+        for model, index in hot_path_indexes():
+            if enabled:
+                editor.add_index(model, index)
+            else:
+                editor.remove_index(model, index)
+
+
+def bulk(model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def seed(rows):
+    """
+    Fill the database with `rows` notifications and proportional amounts of
+    everything else. Returns quickly if the database already has users.
+    """
+    from users.models import (
+        User, Subject, Enrollment, Quiz, QuizQuestion, QuizChoice, QuizResult,
+        StudentAnswer, Assignment, AssignmentSubmission, NotificationTemplate, Notification,
+    )
+    if User.objects.exists():
+        return False
+
+    rng = random.Random(42)
+    n_students = max(rows // 100, 10)
+    n_teachers = max(n_students // 50, 2)
+    n_subjects = max(n_teachers * 5, 5)
+    n_quizzes = n_subjects * 10
+
+    bulk(User, (User(username=f"teacher{i}", role='teacher', password='!') for i in range(n_teachers)))
+    bulk(User, (User(username=f"student{i}", role='student', password='!') for i in range(n_students)))
+    User.objects.create(username='admin', role='admin', is_staff=True, password='!')
+    teachers = list(User.objects.filter(role='teacher').values_list('id', flat=True))
+    students = list(User.objects.filter(role='student').values_list('id', flat=True))
+
+    bulk(Subject, (Subject(name=f"Subject {i}", created_by_id=teachers[i % len(teachers)],
+                           published=rng.random() < 0.7) for i in range(n_subjects)))
+    subjects = list(Subject.objects.values_list('id', 'created_by_id'))
+
+    enrollments = set()
+    for student in students:
+        for subject_id, _ in rng.sample(subjects, min(5, len(subjects))):
+            enrollments.add((student, subject_id))
+    bulk(Enrollment, (Enrollment(student_id=s, subject_id=sub) for s, sub in enrollments))
+
+    bulk(Quiz, (Quiz(title=f"Quiz {i}", subject_id=subjects[i % len(subjects)][0],
+                     created_by_id=subjects[i % len(subjects)][1], due_date=date(2030, 1, 1),
+                     published=rng.random() < 0.8) for i in range(n_quizzes)))
+    quizzes = list(Quiz.objects.values_list('id', flat=True))
+    bulk(QuizQuestion, (QuizQuestion(quiz_id=q, text=f"Question {i}") for q in quizzes for i in range(5)))
+    questions = list(QuizQuestion.objects.values_list('id', flat=True))
+    bulk(QuizChoice, (QuizChoice(question_id=q, text=f"Choice {i}", is_correct=i == 0)
+                      for q in questions for i in range(4)))
+    first_choice = dict(QuizChoice.objects.filter(is_correct=True).values_list('question_id', 'id'))
+
+    results = {(rng.choice(students), rng.choice(quizzes)) for _ in range(rows // 10)}
+    bulk(QuizResult, (QuizResult(student_id=s, quiz_id=q, grade=rng.randint(0, 100)) for s, q in results))
+    bulk(StudentAnswer, (
+        StudentAnswer(student_id=rng.choice(students), question_id=q, selected_choice_id=first_choice[q])
+        for q in (rng.choice(questions) for _ in range(rows // 2))
+    ))
+    bulk(Assignment, (
+        Assignment(title=f"Assignment {i}", subject_id=subjects[i % len(subjects)][0],
+                   created_by_id=subjects[i % len(subjects)][1], due_date=date(2030, 1, 1),
+                   published=rng.random() < 0.8)
+        for i in range(max(rows // 100, 1))
+    ))
+    assignments = list(Assignment.objects.values_list('id', flat=True))
+    submitted = {(rng.choice(assignments), rng.choice(students)) for _ in range(rows // 5)}
+    bulk(AssignmentSubmission, (
+        AssignmentSubmission(assignment_id=a, student_id=s, grade=rng.choice([None, rng.randint(0, 100)]))
+        for a, s in submitted
+    ))
+
+    bulk(NotificationTemplate, (NotificationTemplate(title=f"Notice {i}") for i in range(max(rows // 100, 1))))
+    templates = list(NotificationTemplate.objects.values_list('id', flat=True))
+    recipients = students + teachers
+    bulk(Notification, (Notification(recipient_id=rng.choice(recipients), template_id=rng.choice(templates),
+                                     is_read=rng.random() < 0.9) for _ in range(rows)))
+    return True
+
+
+def analyze():
+    from django.db import connection
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def view_queries():
+    """
+    (label, queryset) for the queries the views run, built through the views'
+    own get_queryset so the plans track the code.
+    """
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from users import views
+    from users.models import User, Quiz, Notification, NotificationJob
+    from users.notifications import audience_recipient_ids
+
+    student = User.objects.filter(role='student').order_by('id').first()
+    teacher = User.objects.filter(role='teacher').order_by('id').first()
+    admin = User.objects.filter(role='admin').first()
+    quiz = Quiz.objects.order_by('id').first()
+    factory = APIRequestFactory()
+
+    def listing(view_class, user, **kwargs):
+        view = view_class()
+        view.action_map = {'get': 'list'}
+        request = factory.get('/')
+        force_authenticate(request, user=user)
+        view.request = view.initialize_request(request)
+        view.args, view.kwargs, view.format_kwarg, view.action = (), kwargs, None, 'list'
+        return view.filter_queryset(view.get_queryset())[:20]
+
+    yield "subjects (student)", listing(views.SubjectViewSet, student)
+    yield "subjects (teacher)", listing(views.SubjectViewSet, teacher)
+    yield "assignments (student)", listing(views.AssignmentViewSet, student)
+    yield "assignment grades (student)", listing(views.StudentAssignmentGradesView, student)
+    yield "quizzes (student)", listing(views.QuizViewSet, student)
+    yield "students", listing(views.StudentListViewSet, admin)
+    yield "enrollments (teacher)", listing(views.EnrollmentViewSet, teacher)
+    yield "quiz results (student)", listing(views.QuizResultViewSet, student)
+    yield "quiz questions", listing(views.QuizQuestionViewSet, teacher, quiz_pk=quiz.id)
+    yield "notification inbox", listing(views.NotificationViewSet, student)
+    # What mark_all_read and recount_unread filter on
+    yield "unread notifications", Notification.objects.filter(recipient=student, is_read=False).order_by()
+    yield "student answers", student.studentanswer_set.filter(question__quiz=quiz)
+    job = NotificationJob(audience='all_students')
+    yield "fan-out recipients", audience_recipient_ids(job, after_id=0)[:500]
+
+
+def explain_all():
+    plans = {}
+    for label, queryset in view_queries():
+        started = time.perf_counter()
+        list(queryset)
+        elapsed = (time.perf_counter() - started) * 1000
+        plans[label] = (queryset.explain(), elapsed)
+    return plans
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--database-url', default=os.getenv('EXPLAIN_DATABASE_URL', 'sqlite:///explain.sqlite3'))
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Number of notifications to seed.")
+    args = parser.parse_args(argv)
+
+    configure(args.database_url)
+    migrate()
+    started = time.perf_counter()
+    if seed(args.rows):
+        print(f"Seeded {args.rows} notifications in {time.perf_counter() - started:.0f}s")
+
+    set_indexes(False)
+    try:
+        analyze()
+        before = explain_all()
+    finally:
+        set_indexes(True)
+    analyze()
+    after = explain_all()
+
+    for label, (plan, elapsed) in before.items():
+        new_plan, new_elapsed = after[label]
+        print(f"=== {label}: {elapsed:.1f} ms -> {new_elapsed:.1f} ms")
+        print("--- before")
+        print(plan)
+        print("--- after")
+        print(new_plan)
+        print()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,48 +1,237 @@
-import os
+"""
+Build content/lessons.json from the markdown files under content/lessons/.
+
+Every *.md file below the lessons folder is one lesson. The subject comes from
+a front-matter block at the top of the file:
+
+    ---
+    subject: Mathematics Secondary 4
+    title: Complex Numbers
+    ---
+
+or, without front-matter, from the top-level folder the file sits in
+(content/lessons/Mathematics Secondary 4/complex-numbers.md). The title falls
+back to the first "# " heading and then to the file name.
+
+Builds are incremental. A manifest next to the output remembers the mtime,
+size and hash of every source file together with the record it produced, so
+only new or edited files are parsed again (in a process pool when there are
+many of them) and the output is streamed to a temporary file and swapped in
+with one rename.
+
+    python scripts/generate_lessons_json.py [--format ndjson] [--full]
+"""
+import argparse
+import hashlib
 import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+CONTENT_DIR = Path(__file__).resolve().parent.parent / 'content'
+LESSONS_DIR = CONTENT_DIR / 'lessons'
+MANIFEST_NAME = '.lessons-manifest.json'
+# Bumped when parse_lesson() output changes, so cached records are re-parsed
+MANIFEST_VERSION = 2
+
+# Below this many changed files a process pool costs more than it saves
+PARALLEL_THRESHOLD = 16
+
+
+def split_front_matter(text):
+    """
+    Return (metadata, body) for a markdown file with an optional "---" block
+    of simple "key: value" lines at the top.
+    """
+    if not text.startswith('---'):
+        return {}, text
+    lines = text.splitlines(keepends=True)
+    if lines[0].strip() != '---':
+        return {}, text
+    meta = {}
+    for i, line in enumerate(lines[1:], start=1):
+        if line.strip() == '---':
+            return meta, ''.join(lines[i + 1:]).lstrip('\n')
+        key, sep, value = line.partition(':')
+        if sep:
+            meta[key.strip().lower()] = value.strip().strip('"\'')
+    # No closing marker: treat the whole file as content
+    return {}, text
+
+
+def title_from(body, path):
+    for line in body.splitlines():
+        if line.startswith('# '):
+            return line.lstrip('# ').strip()
+    return path.stem.replace('-', ' ').replace('_', ' ').title()
+
+
+def parse_lesson(path, relpath):
+    """
+    Parse one markdown file into a lessons.json record. Runs in pool workers,
+    so it only takes and returns plain picklable values.
+    """
+    raw = Path(path).read_bytes()
+    meta, body = split_front_matter(raw.decode('utf-8'))
+    parts = Path(relpath).parts
+    # The folder right under lessons/ names the subject, however deep the file is nested
+    subject = meta.get('subject') or (parts[0] if len(parts) > 1 else '')
+    record = {
+        'subjectName': subject,
+        'title': meta.get('title') or title_from(body, Path(relpath)),
+        'content': body,
+    }
+    return relpath, hashlib.sha256(raw).hexdigest(), record
+
+
+def discover(lessons_dir):
+    """
+    Map of relative path -> os.stat_result for every markdown file, in a stable order.
+    """
+    found = {}
+    for path in sorted(lessons_dir.rglob('*.md')):
+        if path.is_file():
+            found[path.relative_to(lessons_dir).as_posix()] = path.stat()
+    return found
+
+
+def load_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def atomic_write(path, write_items):
+    """
+    Stream the output into a temporary file in the same folder and rename it
+    over the old one, so readers never see a half-written file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            write_items(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_json_array(records):
+    def write(f):
+        f.write('[')
+        for i, record in enumerate(records):
+            f.write(',\n  ' if i else '\n  ')
+            f.write(json.dumps(record, ensure_ascii=False))
+        f.write('\n]\n' if records else ']\n')
+    return write
+
+
+def write_ndjson(records):
+    def write(f):
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write('\n')
+    return write
+
+
+def build(lessons_dir=LESSONS_DIR, output=None, fmt='json', full=False, workers=None, log=print):
+    """
+    Rebuild the lessons file and return a summary dict of what was done.
+    """
+    lessons_dir = Path(lessons_dir)
+    output = Path(output) if output else lessons_dir.parent / f'lessons.{fmt}'
+    manifest_path = output.parent / MANIFEST_NAME
+    manifest = {} if full else load_manifest(manifest_path)
+    previous = manifest.get('files', {})
 
-# Map filenames to subject names (adjust as needed)
-FILENAME_TO_SUBJECT = {
-    'math-secondary-4-complex-numbers.md': 'Mathematics Secondary 4',
-    'chemistry-secondary-4-identification-of-ions-and-gases.md': 'Chemistry Secondary 4',
-    'english-secondary-4-gender-issues.md': 'English Secondary 4',
-}
+    sources = discover(lessons_dir)
+    entries = {}
+    to_parse = []
+    touched = 0
+    for relpath, stat in sources.items():
+        entry = previous.get(relpath)
+        if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            entries[relpath] = entry
+        elif entry and entry['size'] == stat.st_size and entry['sha256'] == file_sha256(lessons_dir / relpath):
+            # Touched but not edited: keep the record, remember the new mtime
+            entries[relpath] = dict(entry, mtime_ns=stat.st_mtime_ns)
+            touched += 1
+        else:
+            to_parse.append(relpath)
 
-LESSONS_DIR = '../content/lessons'
-OUTPUT_FILE = '../content/lessons.json'
+    jobs = [(str(lessons_dir / relpath), relpath) for relpath in to_parse]
+    if len(jobs) >= PARALLEL_THRESHOLD and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(parse_lesson, *zip(*jobs), chunksize=max(1, len(jobs) // 32)))
+    else:
+        results = [parse_lesson(path, relpath) for path, relpath in jobs]
 
-def generate_lessons_json():
-    lessons = []
+    for relpath, sha, record in results:
+        stat = sources[relpath]
+        entries[relpath] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': sha, 'record': record}
 
-    for filename, subject_name in FILENAME_TO_SUBJECT.items():
-        filepath = os.path.join(LESSONS_DIR, filename)
-        if not os.path.isfile(filepath):
-            print(f"Warning: {filepath} not found, skipping.")
+    records = []
+    for relpath in sources:
+        record = entries[relpath]['record']
+        if not record['subjectName']:
+            log(f"Warning: {relpath} has no subject (add front-matter or move it into a subject folder), skipping.")
             continue
+        records.append(record)
 
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
+    removed = sorted(set(previous) - set(sources))
+    unchanged = (
+        not results and not removed and output.exists()
+        and manifest.get('output') == output.name
+    )
+    if not unchanged:
+        writer = write_ndjson if fmt == 'ndjson' else write_json_array
+        atomic_write(output, writer(records))
+    if not unchanged or touched:
+        # When only mtimes moved, refreshing them lets the next run skip the hashing
+        atomic_write(manifest_path, lambda f: json.dump(
+            {'version': MANIFEST_VERSION, 'output': output.name, 'files': dict(sorted(entries.items()))}, f))
 
-        # Extract title from first markdown heading if possible, else use filename
-        title = ''
-        for line in content.splitlines():
-            if line.startswith('# '):
-                title = line.lstrip('# ').strip()
-                break
-        if not title:
-            title = filename.replace('.md', '').replace('-', ' ').title()
+    summary = {
+        'lessons': len(records),
+        'parsed': len(results),
+        'reused': len(sources) - len(results),
+        'removed': len(removed),
+        'written': not unchanged,
+        'output': str(output),
+    }
+    if unchanged:
+        log(f"{output} is up to date ({len(records)} lessons)")
+    else:
+        log(f"Generated {len(records)} lessons in {output} "
+            f"({len(results)} parsed, {summary['reused']} reused, {len(removed)} removed)")
+    return summary
 
-        lesson_obj = {
-            'subjectName': subject_name,
-            'title': title,
-            'content': content
-        }
-        lessons.append(lesson_obj)
 
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(lessons, f, indent=2)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build lessons.json from the markdown lessons.")
+    parser.add_argument('--lessons-dir', default=LESSONS_DIR, type=Path)
+    parser.add_argument('--output', type=Path, help="Defaults to lessons.json (or lessons.ndjson) next to the lessons folder.")
+    parser.add_argument('--format', choices=('json', 'ndjson'), default='json')
+    parser.add_argument('--full', action='store_true', help="Ignore the manifest and re-parse every file.")
+    parser.add_argument('--workers', type=int, default=None, help="Process pool size (1 disables the pool).")
+    args = parser.parse_args(argv)
+    build(args.lessons_dir, args.output, args.format, args.full, args.workers)
 
-    print(f"Generated {len(lessons)} lessons in {OUTPUT_FILE}")
 
 if __name__ == '__main__':
-    generate_lessons_json()
+    main(sys.argv[1:])
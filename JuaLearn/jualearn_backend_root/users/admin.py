@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Subject, Assignment
+from .models import User, Subject, Assignment, AssignmentSubmission
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
@@ -11,18 +11,24 @@ class SubjectAdmin(admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
 
+class AssignmentSubmissionInline(admin.TabularInline):
+    model = AssignmentSubmission
+    raw_id_fields = ('student',)
+    extra = 0
+
 @admin.register(Assignment)
 class AssignmentAdmin(admin.ModelAdmin):
-    list_display = ('title', 'subject', 'created_by', 'assigned_to', 'due_date', 'grade')
+    list_display = ('title', 'subject', 'created_by', 'due_date', 'published')
     search_fields = ('title',)
-    list_filter = ('subject', 'created_by', 'assigned_to', 'due_date', 'grade')
-    raw_id_fields = ('created_by', 'assigned_to')
-    autocomplete_fields = ('created_by', 'assigned_to', 'subject')
+    list_filter = ('subject', 'created_by', 'due_date', 'published')
+    raw_id_fields = ('created_by',)
+    autocomplete_fields = ('subject',)
+    inlines = (AssignmentSubmissionInline,)
     list_per_page = 2
     date_hierarchy = 'due_date'
     ordering = ('due_date', 'title')
     fieldsets = (
         (None, {
-            'fields': ('title', 'description', 'subject', 'created_by', 'due_date', 'grade')
+            'fields': ('title', 'subject', 'created_by', 'due_date', 'published')
         }),
     )
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+Quiz analytics and subject gradebooks for teachers.
+
+Everything is aggregated in the database. Quiz statistics come from a
+histogram of exact grades (at most 101 rows, however big the class), which
+gives the average, median, spread and score bands without fetching every
+result; choice counts come from one GROUP BY over StudentAnswer.
+
+Quiz analytics are cached under (quiz, content_version, results_version).
+Saving or deleting a result bumps results_version, so the next request in any
+worker computes fresh numbers, the same way content_version retires cached
+answer keys. Results deleted along with their quiz leave nothing to bump.
+"""
+import math
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .cascades import cascaded
+from .models import (
+    User, Enrollment, Quiz, QuizQuestion, QuizChoice, QuizResult, StudentAnswer, Assignment, AssignmentSubmission,
+)
+
+BANDS = [(low, low + 9) for low in range(0, 90, 10)] + [(90, 100)]
+
+
+def grade_statistics(histogram):
+    """
+    Summary statistics from {grade: number of students}.
+    """
+    total = sum(histogram.values())
+    if not total:
+        return {'average': None, 'median': None, 'min': None, 'max': None, 'std_dev': None}
+    grades = sorted(histogram)
+    mean = sum(g * n for g, n in histogram.items()) / total
+    variance = sum(n * (g - mean) ** 2 for g, n in histogram.items()) / total
+
+    def nth(k):
+        seen = 0
+        for g in grades:
+            seen += histogram[g]
+            if seen > k:
+                return g
+
+    median = nth(total // 2) if total % 2 else (nth(total // 2 - 1) + nth(total // 2)) / 2
+    return {
+        'average': round(mean, 2),
+        'median': median,
+        'min': grades[0],
+        'max': grades[-1],
+        'std_dev': round(math.sqrt(variance), 2),
+    }
+
+
+def compute_quiz_analytics(quiz):
+    histogram = dict(QuizResult.objects.filter(quiz=quiz, grade__isnull=False)
+                     .values_list('grade').annotate(n=Count('id')).order_by())
+    enrolled = Enrollment.objects.filter(subject=quiz.subject_id).count()
+
+    questions = {}
+    for question_id, text in QuizQuestion.objects.filter(quiz=quiz).order_by('id').values_list('id', 'text'):
+        questions[question_id] = {'id': question_id, 'text': text, 'answered': 0, 'correct': 0,
+                                  'correct_rate': None, 'choices': []}
+    choices = {}
+    for choice_id, question_id, text, is_correct in (QuizChoice.objects.filter(question__quiz=quiz)
+                                                     .order_by('id').values_list('id', 'question_id', 'text', 'is_correct')):
+        choice = {'id': choice_id, 'text': text, 'is_correct': is_correct, 'selected': 0, 'selected_rate': None}
+        choices[choice_id] = choice
+        questions[question_id]['choices'].append(choice)
+
+    # grade_quiz() keeps one answer per student and question, their latest
+    for choice_id, n in (StudentAnswer.objects.filter(question_id__in=questions)
+                         .values_list('selected_choice').annotate(n=Count('student', distinct=True)).order_by()):
+        if choice_id in choices:
+            choices[choice_id]['selected'] = n
+
+    for question in questions.values():
+        answered = sum(c['selected'] for c in question['choices'])
+        question['answered'] = answered
+        question['correct'] = sum(c['selected'] for c in question['choices'] if c['is_correct'])
+        if answered:
+            question['correct_rate'] = round(question['correct'] / answered, 3)
+            for choice in question['choices']:
+                choice['selected_rate'] = round(choice['selected'] / answered, 3)
+
+    submissions = sum(histogram.values())
+    return {
+        'quiz': quiz.id,
+        'title': quiz.title,
+        'enrolled': enrolled,
+        'submissions': submissions,
+        **grade_statistics(histogram),
+        'distribution': [
+            {'range': f"{low}-{high}", 'count': sum(n for g, n in histogram.items() if low <= g <= high)}
+            for low, high in BANDS
+        ],
+        # Hardest first: the lowest share of correct answers
+        'questions': sorted(questions.values(), key=lambda q: (q['correct_rate'] is None, q['correct_rate'] or 0, q['id'])),
+        'computed_at': timezone.now().isoformat(),
+    }
+
+
+def quiz_analytics(quiz):
+    key = f"quiz-analytics:{quiz.id}:{quiz.content_version}:{quiz.results_version}"
+    data = cache.get(key)
+    if data is None:
+        data = compute_quiz_analytics(quiz)
+        cache.set(key, data, settings.ANALYTICS_CACHE_TIMEOUT)
+    return data
+
+
+def subject_gradebook(subject, teacher=None):
+    """
+    One row per enrolled student with their grade in each quiz and assignment
+    of the subject (only the teacher's own when teacher is given), plus
+    per-student and per-column averages.
+    """
+    quizzes = Quiz.objects.filter(subject=subject)
+    assignments = Assignment.objects.filter(subject=subject)
+    if teacher is not None:
+        quizzes = quizzes.filter(created_by=teacher)
+        assignments = assignments.filter(created_by=teacher)
+    columns = (
+        [{'type': 'quiz', 'id': i, 'title': t, 'due_date': d}
+         for i, t, d in quizzes.order_by('due_date', 'id').values_list('id', 'title', 'due_date')]
+        + [{'type': 'assignment', 'id': i, 'title': t, 'due_date': d}
+           for i, t, d in assignments.order_by('due_date', 'id').values_list('id', 'title', 'due_date')]
+    )
+    position = {(c['type'], c['id']): i for i, c in enumerate(columns)}
+
+    students = list(User.objects.filter(enrollment__subject=subject)
+                    .order_by('last_name', 'first_name', 'id')
+                    .values('id', 'username', 'first_name', 'last_name'))
+    grades = {s['id']: [None] * len(columns) for s in students}
+
+    quiz_grades = (QuizResult.objects.filter(quiz__in=quizzes, grade__isnull=False)
+                   .values_list('student_id', 'quiz_id', 'grade'))
+    assignment_grades = (AssignmentSubmission.objects.filter(assignment__in=assignments, grade__isnull=False)
+                         .values_list('student_id', 'assignment_id', 'grade'))
+    for kind, rows in (('quiz', quiz_grades), ('assignment', assignment_grades)):
+        for student_id, item_id, grade in rows.iterator(chunk_size=5000):
+            row = grades.get(student_id)
+            if row is not None:
+                row[position[(kind, item_id)]] = grade
+
+    def average(values):
+        values = [v for v in values if v is not None]
+        return round(sum(values) / len(values), 2) if values else None
+
+    for i, column in enumerate(columns):
+        column['average'] = average(grades[s['id']][i] for s in students)
+    return {
+        'subject': subject.id,
+        'columns': columns,
+        'rows': [{'student': s, 'grades': grades[s['id']], 'average': average(grades[s['id']])} for s in students],
+    }
+
+
+@receiver(post_save, sender=QuizResult)
+@receiver(post_delete, sender=QuizResult)
+def result_changed(sender, instance, raw=False, origin=None, **kwargs):
+    if not raw and not cascaded(sender, origin):
+        Quiz.objects.filter(pk=instance.quiz_id).update(results_version=F('results_version') + 1)
@@ -0,0 +1,85 @@
+import os
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models import F
+from .models import Quiz
+
+
+class AnswerKeyCache:
+    """
+    Per-process LRU cache of quiz answer keys.
+
+    Entries are keyed by (quiz_id, content_version). Editing a quiz bumps its
+    content_version in the database, so every worker stops using the old entry
+    as soon as it loads the quiz again, even though the cache is not shared.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, quiz, loader):
+        key = (quiz.pk, quiz.content_version)
+        with self._lock:
+            answer_key = self._entries.get(key)
+            if answer_key is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return answer_key
+            self.misses += 1
+
+        answer_key = loader(quiz)
+        self.set(key, answer_key)
+        return answer_key
+
+    def set(self, key, answer_key):
+        with self._lock:
+            # Older versions of the same quiz can never be requested again
+            for stale in [k for k in self._entries if k[0] == key[0] and k != key]:
+                del self._entries[stale]
+            self._entries[key] = answer_key
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, quiz_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == quiz_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+answer_key_cache = AnswerKeyCache(getattr(settings, 'ANSWER_KEY_CACHE_SIZE', 256))
+
+
+def bump_quiz_version(*quiz_ids):
+    """
+    Invalidate the cached answer keys of the given quizzes in every worker.
+    """
+    quiz_ids = [quiz_id for quiz_id in quiz_ids if quiz_id is not None]
+    if not quiz_ids:
+        return
+    Quiz.objects.filter(pk__in=quiz_ids).update(content_version=F('content_version') + 1)
+    for quiz_id in quiz_ids:
+        answer_key_cache.discard(quiz_id)
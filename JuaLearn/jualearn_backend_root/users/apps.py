@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        # Connects the receivers that keep search documents, dashboards, analytics, progress,
+        # token versions, lesson fingerprints and the change feed in sync
+        from . import analytics, authentication, changes, dashboard, lessons, progress, search  # noqa: F401
@@ -0,0 +1,179 @@
+"""
+JWT authentication that serves read requests without loading the user row.
+
+Access tokens carry the user's auth_version. Safe requests (GET, HEAD,
+OPTIONS) get a User built in memory from a per-process cache of each user's
+identity and status, refreshed at most every JWT_USER_CACHE_SECONDS; fields
+outside that set are deferred and load on first access, like any deferred
+field, so views that render the user's own profile call full_user() instead.
+Other requests load the user from the database as simplejwt does.
+
+Deactivating a user or changing their role bumps auth_version, which refuses
+their existing tokens: at once for writes and for reads served by the worker
+that saved the change, within JWT_USER_CACHE_SECONDS elsewhere. Queryset
+.update() calls bypass the signals below, so follow them with
+bump_auth_version().
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .models import User
+
+AUTH_VERSION_CLAIM = 'auth_version'
+
+# Loaded into the cache and set on token users; everything else is deferred
+CACHED_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'role',
+                 'is_active', 'is_staff', 'is_superuser', 'auth_version')
+
+
+class UserStateCache:
+    """
+    Per-process LRU cache of CACHED_FIELDS by user id, each entry kept for ttl seconds.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            state, expires = entry
+            if time.monotonic() >= expires:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return state
+
+    def set(self, user_id, state):
+        with self._lock:
+            self._entries[user_id] = (state, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def load(self, user_id):
+        state = User.objects.filter(pk=user_id).values(*CACHED_FIELDS).first()
+        if state is not None:
+            self.set(user_id, state)
+        return state
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserStateCache(getattr(settings, 'JWT_USER_CACHE_SECONDS', 30),
+                            getattr(settings, 'JWT_USER_CACHE_SIZE', 10000))
+
+
+def token_user(state):
+    """
+    A User for the request, with CACHED_FIELDS set and every other field deferred.
+    """
+    values = [state[f.attname] for f in User._meta.concrete_fields if f.attname in state]
+    return User.from_db(User.objects.db, CACHED_FIELDS, values)
+
+
+def full_user(user):
+    """
+    The request's user with every field loaded, in one query for a token user.
+    """
+    if user.get_deferred_fields():
+        return User.objects.get(pk=user.pk)
+    return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that trusts the cache for safe requests and the database for the rest.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if request.method in SAFE_METHODS:
+            return self.get_token_user(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
+
+    def get_user_id(self, validated_token):
+        try:
+            return User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    def check_version(self, validated_token, auth_version):
+        # Tokens issued before auth_version existed carry none and count as version 0
+        if validated_token.get(AUTH_VERSION_CLAIM, 0) != auth_version:
+            raise AuthenticationFailed(_("Token is no longer valid"), code="token_outdated")
+
+    def get_token_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        state = user_cache.get(user_id)
+        # A token newer than the cache means the user changed since it was loaded
+        if state is None or state['auth_version'] < validated_token.get(AUTH_VERSION_CLAIM, 0):
+            state = user_cache.load(user_id)
+        if state is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not state['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        self.check_version(validated_token, state['auth_version'])
+        return token_user(state)
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        self.check_version(validated_token, user.auth_version)
+        return user
+
+
+def bump_auth_version(*user_ids):
+    """
+    Refuse the existing tokens of these users.
+    """
+    User.objects.filter(pk__in=user_ids).update(auth_version=F('auth_version') + 1)
+    for user_id in user_ids:
+        user_cache.discard(user_id)
+
+
+@receiver(post_init, sender=User)
+def remember_auth_state(sender, instance, **kwargs):
+    # Read from __dict__ so deferred fields stay unloaded
+    instance._auth_state = (instance.__dict__.get('role'), instance.__dict__.get('is_active'))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    state = (instance.__dict__.get('role'), instance.__dict__.get('is_active'))
+    # None means the field was deferred when the instance was loaded, so there is nothing to compare with
+    changed = any(old is not None and new != old for old, new in zip(instance._auth_state, state))
+    if not created and changed:
+        bump_auth_version(instance.pk)
+        instance.refresh_from_db(fields=['auth_version'])
+    else:
+        # Names and email are cached too, so a profile edit shows up straight away in this worker
+        user_cache.discard(instance.pk)
+    instance._auth_state = state
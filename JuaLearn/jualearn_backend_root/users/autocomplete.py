@@ -0,0 +1,237 @@
+"""
+Per-process prefix index of subject, lesson and quiz titles for the search box.
+
+Every word of a title starts a key ("Quadratic equations" is found by "quad"
+and by "equ"), and the keys live in one sorted list, so a lookup is a bisect
+to the first key with the prefix followed by a short scan. Entries carry the
+subject, owner and published flag of their search document, so results are
+filtered by role in memory.
+
+The index is built from SearchDocument when the worker starts (or on first
+use). Changes made by this worker are applied as soon as their transaction
+commits; changes made by other workers are picked up by polling
+SearchDocument.updated_at every AUTOCOMPLETE_REFRESH_SECONDS. Deletions
+cannot be polled for, so the index is rebuilt from scratch every
+AUTOCOMPLETE_REBUILD_SECONDS.
+"""
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from .models import Enrollment, SearchDocument
+
+KINDS = ('subject', 'lesson', 'quiz')
+
+# Rows committed by other workers can carry an updated_at slightly older than
+# the newest one already seen, so each poll looks back this far
+POLL_OVERLAP = timedelta(seconds=60)
+
+FIELDS = ('kind', 'object_id', 'title', 'subject_id', 'owner_id', 'owner__role', 'published', 'updated_at')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def word_keys(title):
+    """
+    The title from the start of each of its words: "Big O notation" -> big o notation, o notation, notation.
+    """
+    title = ' '.join(normalize(title).split())
+    keys = [title] if title else []
+    for i, c in enumerate(title):
+        if c == ' ':
+            keys.append(title[i + 1:])
+    return keys
+
+
+class Entry:
+    __slots__ = ('kind', 'object_id', 'title', 'subject_id', 'owner_id', 'owner_is_admin', 'published')
+
+    def __init__(self, kind, object_id, title, subject_id, owner_id, owner_is_admin, published):
+        self.kind = kind
+        self.object_id = object_id
+        self.title = title
+        self.subject_id = subject_id
+        self.owner_id = owner_id
+        self.owner_is_admin = owner_is_admin
+        self.published = published
+
+    def visible_to(self, user, enrolled):
+        # Same rules as users.search.visible_documents
+        if user.role == 'admin':
+            return True
+        if user.role == 'teacher':
+            return self.owner_id == user.id or (self.kind == 'subject' and self.published and self.owner_is_admin)
+        if user.role == 'student':
+            if self.kind == 'subject':
+                return self.published
+            return self.published and self.subject_id in enrolled
+        return False
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.entries = {}
+        self.keys = []
+        self.lock = threading.RLock()
+        self.built_at = None
+        self.polled_at = None
+        self.high_water = None
+
+    def _add(self, entry):
+        ident = (entry.kind, entry.object_id)
+        self._remove(ident)
+        self.entries[ident] = entry
+        for key in word_keys(entry.title):
+            insort(self.keys, (key, entry.kind, entry.object_id))
+
+    def _remove(self, ident):
+        entry = self.entries.pop(ident, None)
+        if entry is None:
+            return
+        for key in word_keys(entry.title):
+            item = (key, *ident)
+            i = bisect_left(self.keys, item)
+            if i < len(self.keys) and self.keys[i] == item:
+                del self.keys[i]
+
+    def _track(self, updated_at):
+        if updated_at is not None and (self.high_water is None or updated_at > self.high_water):
+            self.high_water = updated_at
+
+    def load(self, rows):
+        """
+        Replace the whole index with these SearchDocument value rows.
+        """
+        entries, keys, high_water = {}, [], None
+        for row in rows:
+            entry = entry_from(row)
+            entries[(entry.kind, entry.object_id)] = entry
+            keys.extend((key, entry.kind, entry.object_id) for key in word_keys(entry.title))
+            if high_water is None or row['updated_at'] > high_water:
+                high_water = row['updated_at']
+        keys.sort()
+        with self.lock:
+            self.entries, self.keys, self.high_water = entries, keys, high_water
+            self.built_at = self.polled_at = time.monotonic()
+
+    def apply(self, rows, removed=()):
+        with self.lock:
+            for ident in removed:
+                self._remove(ident)
+            for row in rows:
+                self._add(entry_from(row))
+                self._track(row['updated_at'])
+
+    def clear(self):
+        with self.lock:
+            self.entries, self.keys, self.high_water = {}, [], None
+            self.built_at = self.polled_at = None
+
+    def lookup(self, prefix, user, enrolled, limit, max_scan):
+        """
+        Up to limit visible entries whose title has a word starting with prefix.
+        Entries whose title starts with it come first, then shorter titles.
+        """
+        prefix = ' '.join(normalize(prefix).split())
+        if not prefix:
+            return []
+        found, seen = [], set()
+        with self.lock:
+            i = bisect_left(self.keys, (prefix,))
+            end = min(i + max_scan, len(self.keys))
+            while i < end and len(found) < limit * 4:
+                key, kind, object_id = self.keys[i]
+                if not key.startswith(prefix):
+                    break
+                i += 1
+                if (kind, object_id) in seen:
+                    continue
+                seen.add((kind, object_id))
+                entry = self.entries[(kind, object_id)]
+                if entry.visible_to(user, enrolled):
+                    found.append(entry)
+        found.sort(key=lambda e: (not normalize(e.title).startswith(prefix), len(e.title), e.title))
+        return found[:limit]
+
+
+def entry_from(row):
+    return Entry(row['kind'], row['object_id'], row['title'], row['subject_id'], row['owner_id'],
+                 row['owner__role'] == 'admin', row['published'])
+
+
+def documents():
+    return SearchDocument.objects.filter(kind__in=KINDS).values(*FIELDS)
+
+
+title_index = PrefixIndex()
+_build_lock = threading.Lock()
+
+
+def build():
+    with _build_lock:
+        title_index.load(documents().iterator(chunk_size=2000))
+
+
+def ensure_fresh():
+    """
+    Build the index on first use, rebuild it when it is old and fold in rows
+    other workers changed since the last poll.
+    """
+    now = time.monotonic()
+    if title_index.built_at is None or now - title_index.built_at > settings.AUTOCOMPLETE_REBUILD_SECONDS:
+        build()
+    elif now - title_index.polled_at > settings.AUTOCOMPLETE_REFRESH_SECONDS:
+        title_index.polled_at = now
+        changed = documents()
+        if title_index.high_water is not None:
+            changed = changed.filter(updated_at__gte=title_index.high_water - POLL_OVERLAP)
+        title_index.apply(changed)
+
+
+def refresh(kind, ids):
+    """
+    Re-read these documents into the index once the current transaction commits.
+    """
+    if kind not in KINDS or not ids:
+        return
+    ids = list(ids)
+
+    def apply():
+        if title_index.built_at is None:
+            return
+        rows = list(documents().filter(kind=kind, object_id__in=ids))
+        present = {row['object_id'] for row in rows}
+        title_index.apply(rows, removed=[(kind, i) for i in ids if i not in present])
+
+    transaction.on_commit(apply)
+
+
+def warm_in_background():
+    """
+    Build the index in a thread so the worker can start serving requests straight away.
+    """
+    def run():
+        from django.db import connection
+        try:
+            build()
+        except Exception:
+            # The first request builds it instead
+            pass
+        finally:
+            connection.close()
+
+    threading.Thread(target=run, name='autocomplete-warmup', daemon=True).start()
+
+
+def suggest(user, prefix, limit):
+    ensure_fresh()
+    enrolled = set()
+    if user.role == 'student':
+        enrolled = set(Enrollment.objects.filter(student=user).values_list('subject_id', flat=True))
+    return title_index.lookup(prefix, user, enrolled, limit, settings.AUTOCOMPLETE_MAX_SCAN)
@@ -0,0 +1,179 @@
+"""
+Offline subject bundles for the PWA.
+
+A bundle holds what a student needs to study a subject offline: the
+subject's name and description, every lesson rendered to HTML and every
+published quiz without its answer key. Each item is a BundleEntry keyed like
+'lesson:12' and identified by the SHA-256 of its canonical JSON; the bundle's
+manifest maps keys to those hashes and its digest is the hash of the
+manifest, so the same content always gives the same digest.
+
+Bundles are built on demand. current_bundle() compares the subject's
+catalog_version and the content versions of its published quizzes with the
+stamp the bundle was built from and rebuilds incrementally when they differ:
+items whose source (lesson content hash and title, quiz fields and version)
+is unchanged keep their entry, so editing one lesson re-renders one lesson.
+The bundle's version goes up only when its manifest changes.
+
+The manifests of the last BUNDLE_HISTORY versions are kept, so a client
+holding version N downloads only the entries changed since and the keys
+removed; a version we no longer know gets the whole bundle. Encoded
+responses are cached by digest and base version.
+"""
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Sum
+from .lessons import compress, render_markdown
+from .models import BundleEntry, Lesson, Quiz, QuizChoice, QuizQuestion, SubjectBundle
+
+SUBJECT_KEY = 'subject'
+
+
+def canonical(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def content_hash(data):
+    return hashlib.sha256(canonical(data)).hexdigest()
+
+
+def source_stamp(subject):
+    quizzes = Quiz.objects.filter(subject=subject, published=True).aggregate(n=Count('id'), v=Sum('content_version'))
+    return f"{subject.catalog_version}:{quizzes['n']}:{quizzes['v'] or 0}"
+
+
+# --------- ITEMS ---------
+
+def subject_item(subject):
+    return {'id': subject.id, 'name': subject.name, 'description': subject.description}
+
+
+def lesson_items(lesson_ids):
+    rows = Lesson.objects.filter(id__in=lesson_ids).values_list('id', 'title', 'content', 'content_hash')
+    return {f"lesson:{lesson_id}": {'id': lesson_id, 'title': title, 'html': render_markdown(content),
+                                    'version': digest[:16]}
+            for lesson_id, title, content, digest in rows.iterator(chunk_size=100)}
+
+
+def quiz_items(quizzes):
+    """
+    Entries for these quiz rows with their questions and choices; is_correct is never read.
+    """
+    questions = {}
+    for question in (QuizQuestion.objects.filter(quiz_id__in=[q['id'] for q in quizzes])
+                     .order_by('id').values('id', 'quiz_id', 'text', 'type')):
+        questions.setdefault(question.pop('quiz_id'), []).append({**question, 'choices': []})
+    by_id = {question['id']: question for group in questions.values() for question in group}
+    for choice in (QuizChoice.objects.filter(question_id__in=by_id)
+                   .order_by('id').values('id', 'question_id', 'text')):
+        by_id[choice.pop('question_id')]['choices'].append(choice)
+    return {f"quiz:{quiz['id']}": {'id': quiz['id'], 'title': quiz['title'], 'description': quiz['description'],
+                                   'due_date': quiz['due_date'], 'questions': questions.get(quiz['id'], [])}
+            for quiz in quizzes}
+
+
+# --------- BUILD ---------
+
+def build(subject, stamp=None):
+    """
+    Bring the subject's bundle up to date, rebuilding only the items whose source changed.
+    """
+    stamp = stamp or source_stamp(subject)
+    lessons = {f"lesson:{row['id']}": row
+               for row in Lesson.objects.filter(subject=subject).values('id', 'title', 'content_hash')}
+    quizzes = {f"quiz:{row['id']}": row
+               for row in Quiz.objects.filter(subject=subject, published=True)
+               .values('id', 'title', 'description', 'due_date', 'content_version')}
+    sources = {SUBJECT_KEY: content_hash(subject_item(subject))}
+    sources.update({key: content_hash(row) for key, row in {**lessons, **quizzes}.items()})
+
+    built = dict(BundleEntry.objects.filter(subject=subject).values_list('key', 'source'))
+    stale = {key for key, source in sources.items() if built.get(key) != source}
+    items = {SUBJECT_KEY: subject_item(subject)} if SUBJECT_KEY in stale else {}
+    items.update(lesson_items([lessons[key]['id'] for key in stale & lessons.keys()]))
+    items.update(quiz_items([quizzes[key] for key in stale & quizzes.keys()]))
+
+    with transaction.atomic():
+        bundle, _ = SubjectBundle.objects.select_for_update().get_or_create(subject=subject)
+        BundleEntry.objects.filter(subject=subject).exclude(key__in=list(sources)).delete()
+        BundleEntry.objects.bulk_create(
+            [BundleEntry(subject=subject, key=key, source=sources[key], content_hash=content_hash(data), data=data)
+             for key, data in items.items()],
+            update_conflicts=True, unique_fields=['subject', 'key'], update_fields=['content_hash', 'source', 'data'],
+            batch_size=500,
+        )
+        manifest = dict(BundleEntry.objects.filter(subject=subject).order_by('key').values_list('key', 'content_hash'))
+        digest = content_hash(manifest)
+        if digest != bundle.digest:
+            bundle.version += 1
+            bundle.digest = digest
+            history = {**bundle.history, str(bundle.version): manifest}
+            kept = sorted(map(int, history))[-settings.BUNDLE_HISTORY:]
+            bundle.history = {str(version): history[str(version)] for version in kept}
+        bundle.source_stamp = stamp
+        bundle.save()
+    return bundle
+
+
+def current_bundle(subject):
+    stamp = source_stamp(subject)
+    bundle = SubjectBundle.objects.filter(subject=subject).first()
+    if bundle is None or bundle.source_stamp != stamp:
+        bundle = build(subject, stamp)
+    return bundle
+
+
+# --------- DELTAS ---------
+
+def delta(bundle, since=None):
+    """
+    The bundle as the entries changed and the keys removed since version
+    since, or whole (base None) when since is not a version we still know.
+    """
+    manifest = bundle.history[str(bundle.version)]
+    previous = bundle.history.get(str(since)) if since is not None else None
+    if previous is None:
+        changed, removed = list(manifest), []
+    else:
+        changed = [key for key, digest in manifest.items() if previous.get(key) != digest]
+        removed = sorted(previous.keys() - manifest.keys())
+    # Only entries still matching the manifest; a rebuild running meanwhile may have moved on
+    entries = {key: data for key, digest, data in BundleEntry.objects.filter(subject_id=bundle.subject_id, key__in=changed)
+               .values_list('key', 'content_hash', 'data') if manifest[key] == digest}
+    if len(entries) != len(changed):
+        return None
+    return {
+        'subject': bundle.subject_id,
+        'version': bundle.version,
+        'digest': bundle.digest,
+        'base': since if previous is not None else None,
+        'manifest': manifest,
+        'entries': dict(sorted(entries.items())),
+        'removed': removed,
+    }
+
+
+def encoded_delta(subject, since=None):
+    """
+    (bundle, base version or None, {encoding: bytes}) of the delta from
+    since to the current bundle, served from the cache when possible.
+    """
+    for _ in range(3):
+        bundle = current_bundle(subject)
+        base = since if since is not None and str(since) in bundle.history else None
+        key = f"bundle:{subject.id}:{bundle.digest}:{base}"
+        encoded = cache.get(key)
+        if encoded is not None:
+            return bundle, base, encoded
+        data = delta(bundle, base)
+        if data is not None:
+            encoded = compress(canonical(data))
+            cache.set(key, encoded, settings.BUNDLE_CACHE_TIMEOUT)
+            return bundle, base, encoded
+        # The bundle was rebuilt while we read it; start over from the new one
+        subject.refresh_from_db(fields=['catalog_version'])
+    raise RuntimeError(f"Bundle of subject {subject.id} kept changing while it was read")
@@ -0,0 +1,29 @@
+"""
+Set-wise handling of cascading deletes.
+
+Deleting a quiz deletes its results, and deleting a subject deletes its
+lessons, quizzes, assignments, enrollments and everything under those. Django
+sends post_delete for every one of those rows, so receivers that each run a
+query or two turn one delete into hundreds of queries.
+
+Instead, the modules that keep derived data (progress, analytics, dashboards,
+the change feed) listen to pre_delete of Subject, Quiz and Assignment, while
+the rows below still exist, and deal with all of them in a few bulk
+statements. Their per-row receivers return early when cascaded() says the row
+is going along with one of those parents. Deletes that start anywhere else,
+such as a user's, still go through the per-row receivers.
+"""
+from django.db.models import QuerySet
+from .models import Subject, Quiz, Assignment
+
+PARENTS = (Subject, Quiz, Assignment)
+
+
+def cascaded(sender, origin):
+    """
+    Whether a row of sender is being deleted because a subject, quiz or
+    assignment it belongs to is. origin is the instance or queryset delete()
+    was called on, as the delete signals pass it.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is not sender and model in PARENTS
@@ -0,0 +1,102 @@
+"""
+Cached student views of the catalog: the subject list and the lesson and quiz
+lists of the subjects a student is enrolled in.
+
+Every subject has a catalog_version that the views and the importer bump
+whenever the subject, or one of its lessons or quizzes, is created, changed,
+published or deleted. A cached list is keyed by the endpoint, the query
+string and the versions it was built from:
+
+- the subject list, the same for every student, by a digest of the
+  (id, catalog_version) pairs of the published subjects
+- lesson and quiz lists by the (subject, catalog_version) pairs of the
+  student's enrollments, so students enrolled in the same subjects share them
+
+A bump or an enrollment change moves readers to a new key and the old entry
+ages out of the cache. Responses carry a strong ETag, a hash of the JSON body,
+and a request whose If-None-Match names it gets an empty 304. Writes made
+outside users/views.py and the importer must call bump() themselves. Requests with ?expand= are
+not cached: an expanded author, for one, changes without any bump.
+"""
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+from .models import Subject, Enrollment
+
+
+def bump(*subject_ids):
+    subject_ids = {subject_id for subject_id in subject_ids if subject_id is not None}
+    if subject_ids:
+        Subject.objects.filter(pk__in=subject_ids).update(catalog_version=F('catalog_version') + 1)
+
+
+def published_versions():
+    # Every pair goes in: totals such as count and sum can agree for different sets of subjects
+    pairs = Subject.objects.filter(published=True).order_by('id').values_list('id', 'catalog_version')
+    return hashlib.sha256(repr(list(pairs)).encode()).hexdigest()
+
+
+def enrolled_versions(student):
+    return list(Enrollment.objects.filter(student=student).order_by('subject_id')
+                .values_list('subject_id', 'subject__catalog_version'))
+
+
+def cache_key(name, versions, request):
+    params = sorted((key, values) for key, values in request.GET.lists())
+    digest = hashlib.sha256(repr((request.path, params, versions)).encode()).hexdigest()
+    return f"catalog:{name}:{digest}"
+
+
+def not_modified(request, etag):
+    """
+    True when the request's If-None-Match names etag (weak comparison, as RFC 9110 asks).
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    return any(tag == '*' or tag.removeprefix('W/') == etag for tag in parse_etags(header))
+
+
+class CatalogCacheMixin:
+    """
+    Serve list() to students from the catalog cache. catalog_scope is
+    'published' for lists that are the same for every student and 'enrolled'
+    for lists that depend on the student's enrollments.
+    """
+    catalog_scope = 'enrolled'
+
+    def list(self, request, *args, **kwargs):
+        # The browsable API renders per request, so only JSON is cached
+        if (request.user.role != 'student' or request.accepted_renderer.format != 'json'
+                or request.GET.get('expand')):
+            return super().list(request, *args, **kwargs)
+
+        if self.catalog_scope == 'published':
+            versions = published_versions()
+        else:
+            versions = enrolled_versions(request.user)
+        key = cache_key(self.basename, versions, request)
+        entry = cache.get(key)
+        if entry is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = JSONRenderer().render(response.data)
+            entry = (f'"{hashlib.sha256(body).hexdigest()[:32]}"', body)
+            cache.set(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+
+        etag, body = entry
+        if not_modified(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        # Clients may keep it but must revalidate; it is per user, so shared caches must not
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Authorization'])
+        return response
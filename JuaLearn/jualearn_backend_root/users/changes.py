@@ -0,0 +1,306 @@
+"""
+Change feed for clients that keep a local copy of what they can see.
+
+Every create, update and delete of a synced row appends a ChangeEvent: the
+row's kind and id, whether it was deleted, and the subject and user it
+belongs to, which let feed() pick a caller's events without joining the rows.
+Events are inserted in the transaction of the write they record, so they
+commit or roll back together. A write made outside any transaction commits
+before its receivers run, and its events follow straight after in their own.
+
+Readers must never see an event before a lower id that is still being
+inserted: feed() moves a client's cursor past everything it returns, and the
+lower event would be skipped for good. So event inserts are serialized. On
+PostgreSQL a transaction takes an advisory lock before its first event and
+holds it until it commits, allocating its ids and committing before the next
+one can start. SQLite allows one write transaction at a time anyway. Every
+id up to the highest committed one is therefore final.
+
+feed() walks the caller's events after a cursor and compacts them: a row
+changed many times since the cursor appears once, with its current data as
+the list endpoints render it, or as a tombstone when it was deleted or the
+caller can no longer see it (unpublished, moved to another subject). When a
+student's enrollment changes, the page lists the subject under 'resync'
+rather than resending all of its content, which need not fit in a page: the
+client drops its copy of the subject's lessons, quizzes and assignments and,
+if still enrolled, downloads the subject's bundle. compact() drops events
+superseded by a later one for the same row and subject; the feed only ever
+returns a row's latest state, so this never changes what a cursor gets.
+
+Rows deleted along with their subject or quiz get their tombstones from a
+pre_delete on the parent, a query per kind, rather than one by one (see
+users.cascades).
+
+Synced: subjects, lessons, quizzes, assignments (with the caller's own
+submission), enrollments, quiz results and notifications. Derived tables
+(search documents, dashboards, progress, bundles) and quiz questions, which
+have their own endpoints, are not. Writes that bypass signals, bulk_create()
+and update(), must call record() themselves, as the importer and
+users.notifications do.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, F, FilteredRelation, Max, OuterRef, Q
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from .cascades import cascaded
+from .models import (
+    Subject, Lesson, Quiz, Assignment, AssignmentSubmission, Enrollment, QuizResult, Notification, ChangeEvent,
+)
+from .querysets import eager_load
+from .serializers import (
+    SubjectSerializer, LessonSummarySerializer, QuizSerializer, AssignmentSerializer, EnrollmentSerializer,
+    QuizResultSerializer, NotificationSerializer,
+)
+
+KINDS = {
+    Subject: 'subject',
+    Lesson: 'lesson',
+    Quiz: 'quiz',
+    Assignment: 'assignment',
+    Enrollment: 'enrollment',
+    QuizResult: 'quiz_result',
+    Notification: 'notification',
+}
+SERIALIZERS = {
+    'subject': SubjectSerializer,
+    'lesson': LessonSummarySerializer,
+    'quiz': QuizSerializer,
+    'assignment': AssignmentSerializer,
+    'enrollment': EnrollmentSerializer,
+    'quiz_result': QuizResultSerializer,
+    'notification': NotificationSerializer,
+}
+# Visible to every student enrolled in their subject
+CONTENT_KINDS = ('lesson', 'quiz', 'assignment')
+# Advisory lock key serializing event and notification inserts on PostgreSQL
+SEQUENCE_LOCK = 0x4A554143
+
+
+# --------- RECORDING ---------
+
+def record(kind, rows, deleted=False):
+    """
+    Append an event for each (object_id, subject_id, user_id) in the current transaction.
+    """
+    events = [ChangeEvent(kind=kind, object_id=object_id, subject_id=subject_id, user_id=user_id, deleted=deleted)
+              for object_id, subject_id, user_id in rows]
+    if events:
+        # No savepoint: a failed insert fails the write it records
+        with transaction.atomic(savepoint=False):
+            serialize_inserts()
+            ChangeEvent.objects.bulk_create(events, batch_size=1000)
+
+
+def serialize_inserts():
+    """
+    Wait until no other transaction can insert rows read by cursor, i.e.
+    change events and notifications, and keep it so until this one ends: ids
+    allocated meanwhile are committed before anyone else's. Call inside an
+    atomic block, before the inserts.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SEQUENCE_LOCK])
+
+
+def scope(instance):
+    """
+    (object_id, subject_id, user_id) of a synced row; the user is its author, student or recipient.
+    """
+    kind = KINDS[type(instance)]
+    if kind == 'subject':
+        return instance.pk, instance.pk, instance.created_by_id
+    if kind in CONTENT_KINDS:
+        return instance.pk, instance.subject_id, instance.created_by_id
+    if kind == 'enrollment':
+        return instance.pk, instance.subject_id, instance.student_id
+    if kind == 'quiz_result':
+        subject_id = Quiz.objects.filter(pk=instance.quiz_id).values_list('subject_id', flat=True).first()
+        return instance.pk, subject_id, instance.student_id
+    return instance.pk, None, instance.recipient_id
+
+
+def record_rows(instances, deleted=False):
+    """
+    record() a list of instances of one synced model, e.g. after bulk_create().
+    """
+    if instances:
+        record(KINDS[type(instances[0])], [scope(instance) for instance in instances], deleted=deleted)
+
+
+# --------- FEED ---------
+
+def event_scope(user):
+    """
+    A superset of the events whose rows the user may see; visible() decides exactly.
+    """
+    if user.role == 'admin':
+        return Q()
+    own = Q(user_id=user.id) | Q(kind='subject')
+    if user.role == 'teacher':
+        taught = Subject.objects.filter(Q(created_by=user) | Q(quiz__created_by=user) | Q(assignment__created_by=user)
+                                        | Q(lessons__created_by=user)).values('id')
+        return own | Q(subject_id__in=taught)
+    if user.role == 'student':
+        enrolled = Enrollment.objects.filter(student=user).values('subject_id')
+        return own | Q(kind__in=CONTENT_KINDS, subject_id__in=enrolled)
+    return Q(user_id=user.id)
+
+
+def visible(kind, user):
+    """
+    The rows of one kind the user can see, as the list endpoints show them.
+    """
+    model = next(model for model, name in KINDS.items() if name == kind)
+    if kind == 'notification':
+        return Notification.objects.filter(recipient=user)
+    if user.role == 'admin':
+        return model.objects.all()
+    if kind == 'subject':
+        if user.role == 'teacher':
+            return Subject.objects.filter(Q(created_by=user) | Q(created_by__role='admin', published=True))
+        if user.role == 'student':
+            return Subject.objects.filter(published=True)
+    elif user.role == 'teacher':
+        if kind in CONTENT_KINDS:
+            return model.objects.filter(created_by=user)
+        if kind == 'enrollment':
+            return Enrollment.objects.filter(subject__created_by=user)
+        if kind == 'quiz_result':
+            return QuizResult.objects.filter(quiz__created_by=user)
+    elif user.role == 'student':
+        enrolled = Enrollment.objects.filter(student=user).values('subject_id')
+        if kind == 'lesson':
+            return Lesson.objects.filter(subject__in=enrolled)
+        if kind == 'quiz':
+            return Quiz.objects.filter(subject__in=enrolled, published=True)
+        if kind == 'assignment':
+            # With the student's own submission, as AssignmentViewSet joins it
+            return (Assignment.objects.filter(subject__in=enrolled, published=True)
+                    .annotate(mine=FilteredRelation('submissions', condition=Q(submissions__student=user)))
+                    .annotate(grade=F('mine__grade'), submitted_at=F('mine__submitted_at')))
+        if kind in ('enrollment', 'quiz_result'):
+            return model.objects.filter(student=user)
+    return model.objects.none()
+
+
+def feed(user, cursor=0, limit=None):
+    """
+    The user's changes after cursor, one entry per row in the order of their
+    last change: {'cursor', 'has_more', 'changes': [{'kind', 'id', 'deleted', 'data'}],
+    'resync': [subject_id]}.
+    """
+    limit = limit or settings.SYNC_PAGE_SIZE
+    # Read the head first; every id up to it is committed (see the module
+    # docstring), and events committed after it wait for the next call
+    head = ChangeEvent.objects.aggregate(head=Max('id'))['head'] or 0
+    events = list(ChangeEvent.objects.filter(event_scope(user), id__gt=cursor, id__lte=head)
+                  .order_by('id').values_list('id', 'kind', 'object_id', 'subject_id', 'user_id')[:limit + 1])
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    keys = {}
+    resync = set()
+    for event_id, kind, object_id, subject_id, user_id in events:
+        keys.pop((kind, object_id), None)
+        keys[(kind, object_id)] = event_id
+        if kind == 'enrollment' and user.role == 'student' and user_id == user.id:
+            resync.add(subject_id)
+
+    by_kind = {}
+    for kind, object_id in keys:
+        by_kind.setdefault(kind, []).append(object_id)
+    rows = {}
+    for kind, ids in by_kind.items():
+        serializer_class = SERIALIZERS[kind]
+        queryset = eager_load(visible(kind, user).filter(pk__in=ids), serializer_class(many=True))
+        for data in serializer_class(queryset, many=True).data:
+            rows[(kind, data['id'])] = data
+
+    return {
+        'cursor': events[-1][0] if has_more else max(head, cursor),
+        'has_more': has_more,
+        'changes': [{'kind': kind, 'id': object_id, 'deleted': (kind, object_id) not in rows,
+                     'data': rows.get((kind, object_id))} for kind, object_id in keys],
+        'resync': sorted(resync),
+    }
+
+
+def compact():
+    """
+    Delete the events superseded by a later one for the same row and subject. Returns how many were deleted.
+    """
+    later = ChangeEvent.objects.filter(kind=OuterRef('kind'), object_id=OuterRef('object_id'), id__gt=OuterRef('id'))
+    deleted = ChangeEvent.objects.filter(
+        Exists(later.filter(subject_id=OuterRef('subject_id'))), subject_id__isnull=False).delete()[0]
+    deleted += ChangeEvent.objects.filter(
+        Exists(later.filter(subject_id__isnull=True)), subject_id__isnull=True).delete()[0]
+    return deleted
+
+
+# --------- UPDATES ---------
+
+@receiver(post_init, sender=Lesson)
+@receiver(post_init, sender=Quiz)
+@receiver(post_init, sender=Assignment)
+def remember_subject(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred subject stays unloaded
+    instance._synced_subject_id = instance.__dict__.get('subject_id')
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_save, sender=Lesson)
+@receiver(post_save, sender=Quiz)
+@receiver(post_save, sender=Assignment)
+@receiver(post_save, sender=Enrollment)
+@receiver(post_save, sender=QuizResult)
+@receiver(post_save, sender=Notification)
+def row_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    rows = [scope(instance)]
+    previous = getattr(instance, '_synced_subject_id', None)
+    if previous is not None and previous != instance.subject_id:
+        # Students of the old subject must hear that it left
+        rows.append((instance.pk, previous, instance.created_by_id))
+        instance._synced_subject_id = instance.subject_id
+    record(KINDS[sender], rows)
+
+
+@receiver(post_delete, sender=Subject)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_delete, sender=Quiz)
+@receiver(post_delete, sender=Assignment)
+@receiver(post_delete, sender=Enrollment)
+@receiver(post_delete, sender=QuizResult)
+@receiver(post_delete, sender=Notification)
+def row_deleted(sender, instance, origin=None, **kwargs):
+    if not cascaded(sender, origin):
+        record(KINDS[sender], [scope(instance)], deleted=True)
+
+
+@receiver(pre_delete, sender=Subject)
+@receiver(pre_delete, sender=Quiz)
+def children_deleted(sender, instance, origin=None, **kwargs):
+    # Tombstones for the rows row_deleted skips because they go with this one
+    if cascaded(sender, origin):
+        return
+    results = QuizResult.objects.filter(**{'quiz__subject' if sender is Subject else 'quiz': instance})
+    record('quiz_result', results.values_list('id', 'quiz__subject_id', 'student_id'), deleted=True)
+    if sender is Subject:
+        for model in (Lesson, Quiz, Assignment):
+            record(KINDS[model], model.objects.filter(subject=instance).values_list('id', 'subject_id', 'created_by_id'),
+                   deleted=True)
+        record('enrollment', Enrollment.objects.filter(subject=instance).values_list('id', 'subject_id', 'student_id'),
+               deleted=True)
+
+
+@receiver(post_save, sender=AssignmentSubmission)
+@receiver(post_delete, sender=AssignmentSubmission)
+def submission_changed(sender, instance, raw=False, origin=None, **kwargs):
+    # Students see their submission as part of the assignment, whose own tombstone covers a cascade
+    if not raw and not cascaded(sender, origin):
+        subject_id = Assignment.objects.filter(pk=instance.assignment_id).values_list('subject_id', flat=True).first()
+        if subject_id is not None:
+            record('assignment', [(instance.assignment_id, subject_id, instance.student_id)])
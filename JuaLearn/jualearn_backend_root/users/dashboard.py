@@ -0,0 +1,180 @@
+"""
+Per-student dashboard snapshots.
+
+A snapshot holds three sections: enrolled subjects, upcoming due items and
+recent grades. The signal receivers below flag the sections a change can
+affect as stale, with one UPDATE for every snapshot involved. Snapshots only
+exist for students who have opened their dashboard, so the flags cost
+nothing for the rest. Deleting a subject, quiz or assignment flags everyone
+it affects before the delete, instead of once per enrollment or grade going
+with it (see users.cascades). Reading a snapshot rebuilds its stale sections (one
+query each) and saves them back, unless another change came in meanwhile.
+"""
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists, F, OuterRef, Q, Value, CharField
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .cascades import cascaded
+from .models import (
+    Subject, Enrollment, Quiz, QuizResult, Assignment, AssignmentSubmission, DashboardSnapshot,
+)
+
+SECTIONS = ('subjects', 'upcoming', 'recent_grades')
+UPCOMING_LIMIT = 10
+RECENT_GRADES_LIMIT = 10
+
+
+def _stale(sections):
+    return {f'{section}_stale': True for section in sections} | {'version': F('version') + 1}
+
+
+def mark_students_stale(student_ids, *sections):
+    DashboardSnapshot.objects.filter(student_id__in=student_ids).update(**_stale(sections))
+
+
+def mark_subjects_stale(subject_ids, *sections):
+    """
+    Flag the sections of every student enrolled in these subjects.
+    """
+    enrolled = Enrollment.objects.filter(subject_id__in=subject_ids).values('student_id')
+    DashboardSnapshot.objects.filter(student_id__in=enrolled).update(**_stale(sections))
+
+
+def build_subjects(student):
+    return list(Subject.objects.filter(enrollment__student=student).order_by('name', 'id').values('id', 'name'))
+
+
+def build_upcoming(student, today):
+    """
+    Published quizzes and assignments of the student's subjects that are not
+    yet due and that they have not submitted, soonest first.
+    """
+    enrolled = Enrollment.objects.filter(student=student).values('subject_id')
+    fields = ('type', 'id', 'title', 'due_date', 'subject_id', 'subject_name')
+    quizzes = (Quiz.objects
+               .filter(subject_id__in=enrolled, published=True, due_date__gte=today)
+               .exclude(Exists(QuizResult.objects.filter(quiz=OuterRef('pk'), student=student)))
+               .annotate(type=Value('quiz', output_field=CharField()), subject_name=F('subject__name'))
+               .values(*fields))
+    assignments = (Assignment.objects
+                   .filter(subject_id__in=enrolled, published=True, due_date__gte=today)
+                   .exclude(Exists(AssignmentSubmission.objects.filter(
+                       assignment=OuterRef('pk'), student=student, submitted_at__isnull=False)))
+                   .annotate(type=Value('assignment', output_field=CharField()), subject_name=F('subject__name'))
+                   .values(*fields))
+    return list(quizzes.union(assignments, all=True).order_by('due_date', 'type', 'id')[:UPCOMING_LIMIT])
+
+
+def build_recent_grades(student):
+    fields = ('type', 'id', 'title', 'grade', 'graded_at')
+    quizzes = (QuizResult.objects
+               .filter(student=student, grade__isnull=False)
+               .annotate(type=Value('quiz', output_field=CharField()), item_id=F('quiz_id'),
+                         title=F('quiz__title'), at=F('submitted_at'))
+               .values('type', 'item_id', 'title', 'grade', 'at'))
+    assignments = (AssignmentSubmission.objects
+                   .filter(student=student, grade__isnull=False)
+                   .annotate(type=Value('assignment', output_field=CharField()), item_id=F('assignment_id'),
+                             title=F('assignment__title'), at=Coalesce('graded_at', 'submitted_at'))
+                   .values('type', 'item_id', 'title', 'grade', 'at'))
+    rows = quizzes.union(assignments, all=True).order_by(F('at').desc(nulls_last=True))[:RECENT_GRADES_LIMIT]
+    return [dict(zip(fields, (row['type'], row['item_id'], row['title'], row['grade'], row['at'])))
+            for row in rows]
+
+
+def as_json(value):
+    # What the JSONField will give back on the next read, so fresh and stored sections look the same
+    return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+
+
+def get_dashboard(student):
+    """
+    The student's dashboard sections, rebuilding whatever is stale.
+    """
+    today = timezone.localdate()
+    snapshot = DashboardSnapshot.objects.filter(student=student).first()
+    if snapshot is None:
+        snapshot = DashboardSnapshot(student=student)
+        stale = set(SECTIONS)
+    else:
+        stale = {section for section in SECTIONS if getattr(snapshot, f'{section}_stale')}
+        if snapshot.built_on != today:
+            stale.add('upcoming')
+
+    if stale:
+        builders = {
+            'subjects': lambda: build_subjects(student),
+            'upcoming': lambda: build_upcoming(student, today),
+            'recent_grades': lambda: build_recent_grades(student),
+        }
+        fresh = {section: as_json(builders[section]()) for section in stale}
+        for section, value in fresh.items():
+            setattr(snapshot, section, value)
+        changes = {**fresh, **{f'{section}_stale': False for section in stale}, 'built_on': today,
+                   'updated_at': timezone.now()}
+        if snapshot._state.adding:
+            DashboardSnapshot.objects.bulk_create([DashboardSnapshot(
+                student=student, built_on=today, subjects_stale=False, upcoming_stale=False,
+                recent_grades_stale=False, **fresh,
+            )], ignore_conflicts=True)
+        else:
+            # Skipped if an invalidation bumped the version while we were building
+            DashboardSnapshot.objects.filter(pk=student.pk, version=snapshot.version).update(**changes)
+
+    return {section: getattr(snapshot, section) for section in SECTIONS}
+
+
+# --------- INVALIDATION ---------
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_changed(sender, instance, raw=False, origin=None, **kwargs):
+    if not raw and not cascaded(sender, origin):
+        mark_students_stale([instance.student_id], 'subjects', 'upcoming')
+
+
+@receiver(post_save, sender=Subject)
+def subject_changed(sender, instance, created=False, raw=False, **kwargs):
+    # A new subject has no students yet
+    if not raw and not created:
+        mark_subjects_stale([instance.pk], 'subjects', 'upcoming')
+
+
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+def due_item_changed(sender, instance, raw=False, created=False, origin=None, **kwargs):
+    # Drafts show up once they are published, which is a save of its own
+    if not raw and not (created and not instance.published) and not cascaded(sender, origin):
+        mark_subjects_stale([instance.subject_id], 'upcoming', 'recent_grades')
+
+
+@receiver(post_save, sender=QuizResult)
+@receiver(post_delete, sender=QuizResult)
+@receiver(post_save, sender=AssignmentSubmission)
+@receiver(post_delete, sender=AssignmentSubmission)
+def grade_changed(sender, instance, raw=False, origin=None, **kwargs):
+    if not raw and not cascaded(sender, origin):
+        mark_students_stale([instance.student_id], 'upcoming', 'recent_grades')
+
+
+@receiver(pre_delete, sender=Subject)
+@receiver(pre_delete, sender=Quiz)
+@receiver(pre_delete, sender=Assignment)
+def parent_deleted(sender, instance, origin=None, **kwargs):
+    # Recent grades list every grade a student has, enrolled or not
+    if cascaded(sender, origin):
+        return
+    if sender is Subject:
+        mark_subjects_stale([instance.pk], *SECTIONS)
+        graded = (Q(student__in=QuizResult.objects.filter(quiz__subject=instance).values('student_id'))
+                  | Q(student__in=AssignmentSubmission.objects.filter(assignment__subject=instance).values('student_id')))
+    elif sender is Quiz:
+        graded = Q(student__in=QuizResult.objects.filter(quiz=instance).values('student_id'))
+    else:
+        graded = Q(student__in=AssignmentSubmission.objects.filter(assignment=instance).values('student_id'))
+    DashboardSnapshot.objects.filter(graded).update(**_stale(('upcoming', 'recent_grades')))
@@ -0,0 +1,302 @@
+"""
+Server-sent events stream of new notifications.
+
+The stream is a plain ASGI app mounted in jualearnbackend/asgi.py next to
+Django. Each worker process keeps a NotificationHub with one queue per open
+connection, and a backend feeds the hub with notifications as they appear.
+
+Notifications are read by id, so a lower id committing after a higher one
+was streamed would never be sent. Notification inserts are serialized like
+change events (users.changes.serialize_inserts), which makes every id up to
+the highest committed one final.
+"""
+import asyncio
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .authentication import ClaimsJWTAuthentication
+from .models import Notification
+from .serializers import NotificationSerializer
+
+logger = logging.getLogger(__name__)
+
+# Recipients per query when polling for every connected user
+USER_CHUNK_SIZE = 500
+
+
+def db_sync_to_async(func):
+    """
+    Run ORM code in a worker thread, dropping stale connections around it.
+    """
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper, thread_sensitive=True)
+
+
+def serialize_event(notification):
+    data = json.dumps(NotificationSerializer(notification).data, default=str)
+    return f"id: {notification.id}\nevent: notification\ndata: {data}\n\n"
+
+
+@db_sync_to_async
+def fetch_notifications(after_id, user_ids, limit, until=None):
+    """
+    Notifications with after_id < id <= until for the given recipients, oldest first.
+    """
+    rows = Notification.objects.filter(id__gt=after_id, recipient_id__in=user_ids)
+    if until is not None:
+        rows = rows.filter(id__lte=until)
+    rows = rows.select_related('template').order_by('id')[:limit]
+    return [(n.id, n.recipient_id, serialize_event(n)) for n in rows]
+
+
+@db_sync_to_async
+def latest_notification_id():
+    return Notification.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+@db_sync_to_async
+def authenticate_token(raw_token):
+    """
+    Validate an access token as the API does for reads, auth_version included,
+    and return the id of the active user it belongs to, or None.
+    """
+    try:
+        return ClaimsJWTAuthentication().get_token_user(AccessToken(raw_token)).pk
+    except (TokenError, AuthenticationFailed):
+        return None
+
+
+class NotificationHub:
+    """
+    In-process fan-out of events to the open streams of each user.
+    """
+
+    def __init__(self):
+        self._queues = {}
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue()
+        self._queues.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self._queues.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._queues[user_id]
+
+    def publish(self, user_id, event_id, payload):
+        for queue in self._queues.get(user_id, ()):
+            queue.put_nowait((event_id, payload))
+
+    def user_ids(self):
+        return list(self._queues)
+
+    def __bool__(self):
+        return bool(self._queues)
+
+
+class DatabasePollingBackend:
+    """
+    Single-box backend: one task per worker polls the notification table for
+    rows addressed to connected users and publishes them to the hub.
+
+    Works with the database queue of notifications.py and needs no broker. The
+    task only runs while at least one stream is open.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.interval = getattr(settings, 'NOTIFICATION_STREAM_POLL_INTERVAL', 2.0)
+        self.batch_size = getattr(settings, 'NOTIFICATION_STREAM_BATCH_SIZE', 500)
+        self.cursor = None
+        self._task = None
+
+    async def start(self):
+        """
+        Make sure the poller runs. Everything after the returned cursor will be published.
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self.cursor = await latest_notification_id()
+            self._task = loop.create_task(self.run())
+        return self.cursor
+
+    async def poll(self):
+        """
+        Publish every notification for a connected user between the cursor and the current head.
+        """
+        user_ids = self.hub.user_ids()
+        if not user_ids:
+            return
+        head = await latest_notification_id()
+        for start in range(0, len(user_ids), USER_CHUNK_SIZE):
+            chunk, after = user_ids[start:start + USER_CHUNK_SIZE], self.cursor
+            while True:
+                rows = await fetch_notifications(after, chunk, self.batch_size, head)
+                for event_id, recipient_id, payload in rows:
+                    self.hub.publish(recipient_id, event_id, payload)
+                if len(rows) < self.batch_size:
+                    break
+                after = rows[-1][0]
+        self.cursor = max(self.cursor, head)
+
+    async def run(self):
+        while self.hub:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Polling for new notifications failed")
+
+
+hub = NotificationHub()
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'NOTIFICATION_STREAM_BACKEND', 'users.events.DatabasePollingBackend')
+        _backend = import_string(path)(hub)
+    return _backend
+
+
+def get_token(scope):
+    """
+    Read the access token from the Authorization header or, because EventSource
+    cannot set headers, from the ?token= query parameter.
+    """
+    headers = dict(scope.get('headers') or [])
+    auth = headers.get(b'authorization', b'').decode('latin-1').split()
+    if len(auth) == 2 and auth[0] in jwt_settings.AUTH_HEADER_TYPES:
+        return auth[1]
+    for pair in scope.get('query_string', b'').decode('latin-1').split('&'):
+        key, _, value = pair.partition('=')
+        if key == 'token' and value:
+            return value
+    return None
+
+
+def get_last_event_id(scope):
+    headers = dict(scope.get('headers') or [])
+    value = headers.get(b'last-event-id', b'').decode('latin-1')
+    return int(value) if value.isdigit() else None
+
+
+def cors_headers(scope):
+    headers = dict(scope.get('headers') or [])
+    origin = headers.get(b'origin', b'').decode('latin-1')
+    if origin and origin in getattr(settings, 'CORS_ALLOWED_ORIGINS', []):
+        return [
+            (b'access-control-allow-origin', origin.encode('latin-1')),
+            (b'access-control-allow-credentials', b'true'),
+            (b'vary', b'Origin'),
+        ]
+    return []
+
+
+async def send_error(send, scope, status, detail):
+    body = json.dumps({'detail': detail}).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')] + cors_headers(scope),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def notification_stream(scope, receive, send):
+    """
+    ASGI app streaming a user's new notifications as server-sent events.
+
+    On reconnect, the browser sends the id of the last event it saw in
+    Last-Event-ID and missed notifications are replayed first, however many,
+    NOTIFICATION_STREAM_REPLAY_LIMIT per query. A comment line
+    is sent every NOTIFICATION_STREAM_HEARTBEAT seconds to keep proxies from
+    closing an idle connection, and the token is checked again before each
+    one, so the stream ends once it expires or is refused.
+    """
+    if scope['method'] != 'GET':
+        return await send_error(send, scope, 405, 'Method not allowed.')
+    raw_token = get_token(scope)
+    user_id = await authenticate_token(raw_token) if raw_token else None
+    if user_id is None:
+        return await send_error(send, scope, 401, 'Authentication credentials were not provided or are invalid.')
+
+    heartbeat = getattr(settings, 'NOTIFICATION_STREAM_HEARTBEAT', 15.0)
+    replay_limit = getattr(settings, 'NOTIFICATION_STREAM_REPLAY_LIMIT', 100)
+    backend = get_backend()
+    queue = hub.subscribe(user_id)
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        # Subscribe and start polling before replaying so nothing falls in between
+        cursor = await backend.start()
+        last_id = get_last_event_id(scope)
+        if last_id is None:
+            last_id = cursor
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ] + cors_headers(scope),
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+        while True:
+            missed = await fetch_notifications(last_id, [user_id], replay_limit)
+            for event_id, _, payload in missed:
+                await send({'type': 'http.response.body', 'body': payload.encode(), 'more_body': True})
+                last_id = event_id
+            if len(missed) < replay_limit:
+                break
+
+        while not disconnected.is_set():
+            getter = asyncio.ensure_future(queue.get())
+            stopper = asyncio.ensure_future(disconnected.wait())
+            done, _ = await asyncio.wait({getter, stopper}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED)
+            stopper.cancel()
+            if getter not in done:
+                getter.cancel()
+                if disconnected.is_set():
+                    break
+                if await authenticate_token(raw_token) != user_id:
+                    # The browser reconnects and gets a 401
+                    await send({'type': 'http.response.body', 'body': b''})
+                    break
+                await send({'type': 'http.response.body', 'body': b': heartbeat\n\n', 'more_body': True})
+                continue
+            event_id, payload = getter.result()
+            if event_id <= last_id:
+                continue
+            await send({'type': 'http.response.body', 'body': payload.encode(), 'more_body': True})
+            last_id = event_id
+    finally:
+        hub.unsubscribe(user_id, queue)
+        watcher.cancel()
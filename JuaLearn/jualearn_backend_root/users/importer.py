@@ -0,0 +1,397 @@
+"""
+Bulk import of subjects, lessons and quizzes from the JSON files in CONTENT_FOLDER.
+
+Shared by the `bulkupload` management command and the bulk_upload API view.
+Files are stream-parsed one record at a time, records are resolved against
+the database in batches and written with bulk_create, and the whole import
+runs in one transaction so a failure leaves nothing half imported.
+
+Imports are incremental: every subject, lesson and quiz stores the hash of
+the record it was imported from, unchanged records are skipped, and changed
+quizzes are diffed question by question so untouched questions (and the
+student answers pointing at them) survive a re-import. Bulk writes skip model
+signals, so created and changed rows are re-indexed for search batch by batch,
+recorded in the change feed, the dashboards showing changed quizzes are
+flagged stale, the cached catalog lists of the subjects touched are retired
+and new lesson bodies are rendered once the import commits.
+"""
+import hashlib
+import json
+import os
+import time
+from django.db import transaction
+from . import catalog, changes, dashboard, lessons, search
+from .answer_keys import bump_quiz_version
+from .models import Subject, Lesson, Quiz, QuizQuestion, QuizChoice
+
+BATCH_SIZE = 500
+
+
+def iter_json_array(path, chunk_size=64 * 1024):
+    """
+    Yield the items of a top-level JSON array without loading the whole file.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = ''
+        eof = False
+
+        def fill():
+            nonlocal buf, eof
+            data = f.read(chunk_size)
+            if data:
+                buf += data
+            else:
+                eof = True
+
+        while not buf.strip():
+            if eof:
+                raise ValueError(f"{path}: file is empty")
+            fill()
+        buf = buf.lstrip()
+        if buf[0] != '[':
+            raise ValueError(f"{path}: expected a JSON array")
+        buf = buf[1:]
+
+        while True:
+            buf = buf.lstrip()
+            if not buf:
+                if eof:
+                    raise ValueError(f"{path}: unexpected end of file")
+                fill()
+                continue
+            if buf[0] == ']':
+                return
+            if buf[0] == ',':
+                buf = buf[1:]
+                continue
+            try:
+                item, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            if end == len(buf) and not eof:
+                # A number could still continue in the next chunk
+                fill()
+                continue
+            yield item
+            buf = buf[end:]
+
+
+def iter_ndjson(path):
+    """
+    Yield one record per non-blank line of a newline-delimited JSON file.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def content_hash(data):
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def question_signature(text, type, choices):
+    """
+    Hash of a question and its (text, is_correct) choices, comparable between records and rows.
+    """
+    # Choice order is not stored, so it must not count as a change
+    choices = sorted([c_text, bool(c_correct)] for c_text, c_correct in choices)
+    return content_hash({'text': text, 'type': type, 'choices': choices})
+
+
+def record_signature(record):
+    return question_signature(
+        record['text'], record.get('type', 'multiple-choice'),
+        [(choice['text'], choice.get('is_correct', False)) for choice in record.get('choices', [])],
+    )
+
+
+class ImportReport:
+    """
+    Import plan: per-kind counts of creates, updates, deletes, no-ops and
+    skips, the list of non-trivial changes, and per-phase timings.
+    """
+    KINDS = ('subjects', 'lessons', 'quizzes', 'questions', 'choices')
+    ACTIONS = ('create', 'update', 'delete', 'noop', 'skip')
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.plan = {kind: dict.fromkeys(self.ACTIONS, 0) for kind in self.KINDS}
+        self.changes = []
+        self.timings = {}
+        self.warnings = []
+
+    def record(self, kind, action, label=None, n=1):
+        self.plan[kind][action] += n
+        if label is not None and action not in ('noop', 'skip'):
+            self.changes.append({'kind': kind, 'action': action, 'item': label})
+
+    def as_dict(self):
+        return {
+            'dry_run': self.dry_run,
+            'plan': {kind: dict(actions) for kind, actions in self.plan.items()},
+            'changes': list(self.changes),
+            'timings': {phase: round(seconds, 3) for phase, seconds in self.timings.items()},
+            'warnings': list(self.warnings),
+        }
+
+
+class ContentImporter:
+    def __init__(self, base_path, user, batch_size=BATCH_SIZE, dry_run=False):
+        self.base_path = base_path
+        self.user = user
+        self.batch_size = batch_size
+        self.report = ImportReport(dry_run)
+        self.subject_ids = {}
+
+    def records(self, filename):
+        path = os.path.join(self.base_path, filename)
+        ndjson_path = os.path.splitext(path)[0] + '.ndjson'
+        if not os.path.exists(path) and os.path.exists(ndjson_path):
+            return iter_ndjson(ndjson_path)
+        return iter_json_array(path)
+
+    def run(self):
+        with transaction.atomic():
+            for phase in ('subjects', 'lessons', 'quizzes'):
+                started = time.perf_counter()
+                getattr(self, f'import_{phase}')()
+                self.report.timings[phase] = time.perf_counter() - started
+            if self.report.dry_run:
+                # Everything was computed against real rows; throw the writes away
+                transaction.set_rollback(True)
+        self.report.timings['total'] = sum(self.report.timings.values())
+        return self.report
+
+    def import_subjects(self):
+        for batch in batched(self.records('subjects.json'), self.batch_size):
+            records = {record['name']: record for record in batch}
+            existing = {}
+            for subject_id, name, source_hash in (Subject.objects.filter(name__in=records)
+                                                  .order_by('-id').values_list('id', 'name', 'source_hash')):
+                existing[name] = (subject_id, source_hash)
+
+            new_subjects, changed = [], []
+            for name, record in records.items():
+                digest = content_hash(record)
+                if name not in existing:
+                    new_subjects.append(Subject(
+                        name=name, description=record.get('description', ''),
+                        created_by=self.user, source_hash=digest,
+                    ))
+                    self.report.record('subjects', 'create', name)
+                elif existing[name][1] == digest:
+                    self.report.record('subjects', 'noop')
+                else:
+                    changed.append(Subject(id=existing[name][0], description=record.get('description', ''), source_hash=digest))
+                    self.report.record('subjects', 'update', name)
+
+            Subject.objects.bulk_create(new_subjects)
+            Subject.objects.bulk_update(changed, ['description', 'source_hash'])
+            search.index('subject', [subject.id for subject in new_subjects + changed])
+            changes.record_rows(new_subjects + changed)
+            catalog.bump(*[subject.id for subject in changed])
+            self.subject_ids.update({name: subject_id for name, (subject_id, _) in existing.items()})
+            self.subject_ids.update({subject.name: subject.id for subject in new_subjects})
+
+    def resolve_subjects(self, batch, kind):
+        """
+        Key a batch by (subject_id, title), reporting records whose subject is unknown.
+        The last occurrence of a title wins, as it did when records were applied one by one.
+        """
+        resolved = {}
+        for record in batch:
+            subject_id = self.subject_ids.get(record.get('subjectName'))
+            if subject_id is None:
+                self.report.record(kind, 'skip')
+                self.report.warnings.append(
+                    f"Subject not found for {kind[:-1]}: {record.get('title')} with subjectName: {record.get('subjectName')}"
+                )
+                continue
+            resolved[(subject_id, record['title'])] = record
+        return resolved
+
+    def import_lessons(self):
+        for batch in batched(self.records('lessons.json'), self.batch_size):
+            records = self.resolve_subjects(batch, 'lessons')
+            existing = {}
+            for lesson_id, subject_id, title, source_hash in Lesson.objects.filter(
+                subject_id__in={subject_id for subject_id, _ in records},
+                title__in={title for _, title in records},
+            ).order_by('-id').values_list('id', 'subject_id', 'title', 'source_hash'):
+                existing[(subject_id, title)] = (lesson_id, source_hash)
+
+            new_lessons, changed = [], []
+            for (subject_id, title), record in records.items():
+                digest = content_hash(record)
+                if (subject_id, title) not in existing:
+                    new_lessons.append(Lesson(
+                        subject_id=subject_id, title=title, content=record['content'],
+                        created_by=self.user, source_hash=digest, **lessons.fingerprint(record['content']),
+                    ))
+                    self.report.record('lessons', 'create', title)
+                elif existing[(subject_id, title)][1] == digest:
+                    self.report.record('lessons', 'noop')
+                else:
+                    lesson_id = existing[(subject_id, title)][0]
+                    changed.append(Lesson(id=lesson_id, subject_id=subject_id, content=record['content'],
+                                          source_hash=digest, **lessons.fingerprint(record['content'])))
+                    self.report.record('lessons', 'update', title)
+
+            Lesson.objects.bulk_create(new_lessons)
+            Lesson.objects.bulk_update(changed, ['content', 'source_hash', 'content_hash', 'content_size'])
+            search.index('lesson', [lesson.id for lesson in new_lessons + changed])
+            changes.record_rows(new_lessons + changed)
+            catalog.bump(*{lesson.subject_id for lesson in new_lessons + changed})
+            lessons.prerender([lesson.id for lesson in new_lessons + changed])
+
+    def import_quizzes(self):
+        for batch in batched(self.records('quizzes.json'), self.batch_size):
+            records = self.resolve_subjects(batch, 'quizzes')
+            quizzes = {}
+            for quiz in Quiz.objects.filter(
+                subject_id__in={subject_id for subject_id, _ in records},
+                title__in={title for _, title in records},
+            ).order_by('-id'):
+                quizzes[(quiz.subject_id, quiz.title)] = quiz
+
+            new_quizzes, changed = [], []
+            for (subject_id, title), record in records.items():
+                digest = content_hash(record)
+                quiz = quizzes.get((subject_id, title))
+                if quiz is None:
+                    new_quizzes.append((Quiz(
+                        subject_id=subject_id, title=title, description=record.get('description', ''),
+                        due_date=record.get('due_date'), created_by=self.user, source_hash=digest,
+                    ), record))
+                    self.report.record('quizzes', 'create', title)
+                elif quiz.source_hash == digest:
+                    self.report.record('quizzes', 'noop')
+                else:
+                    quiz.description = record.get('description', '')
+                    quiz.due_date = record.get('due_date')
+                    quiz.source_hash = digest
+                    changed.append((quiz, record))
+                    self.report.record('quizzes', 'update', title)
+
+            Quiz.objects.bulk_create([quiz for quiz, _ in new_quizzes])
+            Quiz.objects.bulk_update([quiz for quiz, _ in changed], ['description', 'due_date', 'source_hash'])
+            questions, choices = self.create_questions([(quiz, record.get('questions', [])) for quiz, record in new_quizzes])
+            self.report.record('questions', 'create', n=questions)
+            self.report.record('choices', 'create', n=choices)
+            self.sync_questions(changed)
+            bump_quiz_version(*[quiz.id for quiz, _ in changed])
+            search.index('quiz', [quiz.id for quiz, _ in new_quizzes + changed])
+            changes.record_rows([quiz for quiz, _ in new_quizzes + changed])
+            dashboard.mark_subjects_stale({quiz.subject_id for quiz, _ in changed}, 'upcoming', 'recent_grades')
+            catalog.bump(*{quiz.subject_id for quiz, _ in new_quizzes + changed})
+
+    def create_questions(self, quiz_questions):
+        """
+        Insert the questions of several quizzes, then all of their choices, with two bulk inserts.
+        """
+        questions, question_records = [], []
+        for quiz, records in quiz_questions:
+            for record in records:
+                questions.append(QuizQuestion(quiz=quiz, text=record['text'], type=record.get('type', 'multiple-choice')))
+                question_records.append(record)
+        QuizQuestion.objects.bulk_create(questions)
+        choices = [
+            QuizChoice(question=question, text=choice['text'], is_correct=choice.get('is_correct', False))
+            for question, record in zip(questions, question_records)
+            for choice in record.get('choices', [])
+        ]
+        QuizChoice.objects.bulk_create(choices)
+        return len(questions), len(choices)
+
+    def sync_questions(self, changed):
+        """
+        Diff the questions of changed quizzes against their records, matching questions and
+        choices by text, and apply the difference with a handful of bulk statements.
+        """
+        if not changed:
+            return
+        current = {}
+        for question in (QuizQuestion.objects.filter(quiz__in=[quiz for quiz, _ in changed])
+                         .prefetch_related('choices').order_by('id')):
+            current.setdefault(question.quiz_id, {}).setdefault(question.text, []).append(question)
+
+        new_questions = []
+        updated_questions, deleted_questions = [], []
+        new_choices, updated_choices, deleted_choices = [], [], []
+
+        for quiz, record in changed:
+            remaining = current.get(quiz.id, {})
+            for q_record in record.get('questions', []):
+                matches = remaining.get(q_record['text'])
+                if not matches:
+                    new_questions.append((quiz, [q_record]))
+                    self.report.record('questions', 'create', f"{quiz.title}: {q_record['text']}")
+                    continue
+                question = matches.pop(0)
+                choices = list(question.choices.all())
+                if question_signature(question.text, question.type,
+                                      [(c.text, c.is_correct) for c in choices]) == record_signature(q_record):
+                    self.report.record('questions', 'noop')
+                    continue
+                self.report.record('questions', 'update', f"{quiz.title}: {q_record['text']}")
+                q_type = q_record.get('type', 'multiple-choice')
+                if question.type != q_type:
+                    question.type = q_type
+                    updated_questions.append(question)
+
+                by_text = {}
+                for choice in choices:
+                    by_text.setdefault(choice.text, []).append(choice)
+                for c_record in q_record.get('choices', []):
+                    is_correct = c_record.get('is_correct', False)
+                    choice_matches = by_text.get(c_record['text'])
+                    if not choice_matches:
+                        new_choices.append(QuizChoice(question=question, text=c_record['text'], is_correct=is_correct))
+                        continue
+                    choice = choice_matches.pop(0)
+                    if choice.is_correct != is_correct:
+                        choice.is_correct = is_correct
+                        updated_choices.append(choice)
+                    else:
+                        self.report.record('choices', 'noop')
+                deleted_choices.extend(c.id for leftovers in by_text.values() for c in leftovers)
+
+            for leftovers in remaining.values():
+                for question in leftovers:
+                    deleted_questions.append(question.id)
+                    self.report.record('questions', 'delete', f"{quiz.title}: {question.text}")
+
+        QuizQuestion.objects.filter(id__in=deleted_questions).delete()
+        QuizChoice.objects.filter(id__in=deleted_choices).delete()
+        QuizQuestion.objects.bulk_update(updated_questions, ['type'])
+        QuizChoice.objects.bulk_update(updated_choices, ['is_correct'])
+        QuizChoice.objects.bulk_create(new_choices)
+        _, created_choices = self.create_questions(new_questions)
+        self.report.record('choices', 'create', n=len(new_choices) + created_choices)
+        self.report.record('choices', 'update', n=len(updated_choices))
+        self.report.record('choices', 'delete', n=len(deleted_choices))
+
+
+def import_content(base_path, user, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Sync subjects.json, lessons.json and quizzes.json from base_path into the database.
+    With dry_run the plan is computed and returned but nothing is written. Returns an ImportReport.
+    """
+    return ContentImporter(base_path, user, batch_size, dry_run).run()
@@ -0,0 +1,219 @@
+"""
+Rendered lesson bodies.
+
+Lesson lists only carry a summary (id, title, subject, size and version);
+bodies are fetched one at a time from the body endpoint as HTML rendered on
+the server from the lesson's markdown. Rendered bodies are stored in the
+default cache under the SHA-256 of the markdown, already compressed with
+gzip (and brotli, when the brotli package is installed), so serving one is a
+cache read. Being keyed by content, an entry never goes stale: an edit gets
+a new hash, and LessonViewSet and the importer render it right after commit.
+
+The renderer covers the markdown lessons are written in: ATX headings,
+paragraphs, emphasis, inline and fenced code, links, images, block quotes,
+flat lists and rules. All text is escaped first and only http(s), mailto and
+relative URLs become links, so lesson content can never inject markup.
+"""
+import gzip
+import hashlib
+import html
+import re
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from .models import Lesson
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ('br', 'gzip', 'identity') if brotli is not None else ('gzip', 'identity')
+
+
+def fingerprint(content):
+    data = (content or '').encode('utf-8')
+    return {'content_hash': hashlib.sha256(data).hexdigest(), 'content_size': len(data)}
+
+
+@receiver(pre_save, sender=Lesson)
+def fingerprint_lesson(sender, instance, raw=False, **kwargs):
+    # Bulk writes skip this; the importer sets both fields itself
+    for field, value in fingerprint(instance.content).items():
+        setattr(instance, field, value)
+
+
+# --------- MARKDOWN ---------
+
+FENCE = re.compile(r'^\s*(```|~~~)\s*([\w+-]*)\s*$')
+HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+RULE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+BULLET = re.compile(r'^\s*[-*+]\s+(.*)$')
+NUMBERED = re.compile(r'^\s*\d+[.)]\s+(.*)$')
+QUOTE = re.compile(r'^\s*>\s?(.*)$')
+
+CODE_SPAN = re.compile(r'`([^`]+)`')
+IMAGE = re.compile(r'!\[([^\]]*)\]\(([^)\s]+)\)')
+LINK = re.compile(r'\[([^\]]+)\]\(([^)\s]+)\)')
+STRONG = re.compile(r'\*\*(.+?)\*\*|__(.+?)__')
+EMPHASIS = re.compile(r'(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])|(?<!\w)_(?!\s)(.+?)(?<!\s)_(?!\w)')
+SAFE_URL = re.compile(r'^(https?://|mailto:|/|#|\./|\.\./|[\w\-./]+$)', re.IGNORECASE)
+
+
+def render_inline(text):
+    # Code spans are cut out first so nothing inside them is formatted
+    parts = CODE_SPAN.split(text)
+    out = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            out.append(f'<code>{html.escape(part)}</code>')
+            continue
+        part = html.escape(part, quote=True)
+        part = IMAGE.sub(lambda m: (f'<img src="{m.group(2)}" alt="{m.group(1)}">'
+                                    if SAFE_URL.match(html.unescape(m.group(2))) else m.group(1)), part)
+        part = LINK.sub(lambda m: (f'<a href="{m.group(2)}">{m.group(1)}</a>'
+                                   if SAFE_URL.match(html.unescape(m.group(2))) else m.group(1)), part)
+        part = STRONG.sub(lambda m: f'<strong>{m.group(1) or m.group(2)}</strong>', part)
+        part = EMPHASIS.sub(lambda m: f'<em>{m.group(1) or m.group(2)}</em>', part)
+        out.append(part)
+    return ''.join(out)
+
+
+def render_markdown(text):
+    lines = (text or '').replace('\r\n', '\n').split('\n')
+    blocks = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip():
+            i += 1
+            continue
+
+        fence = FENCE.match(line)
+        if fence:
+            end = i + 1
+            while end < len(lines) and not lines[end].strip().startswith(fence.group(1)):
+                end += 1
+            language = f' class="language-{fence.group(2)}"' if fence.group(2) else ''
+            blocks.append(f'<pre><code{language}>{html.escape(chr(10).join(lines[i + 1:end]))}</code></pre>')
+            i = end + 1
+            continue
+
+        heading = HEADING.match(line)
+        if heading:
+            level = len(heading.group(1))
+            blocks.append(f'<h{level}>{render_inline(heading.group(2))}</h{level}>')
+            i += 1
+            continue
+
+        if RULE.match(line):
+            blocks.append('<hr>')
+            i += 1
+            continue
+
+        if QUOTE.match(line):
+            quoted = []
+            while i < len(lines) and QUOTE.match(lines[i]):
+                quoted.append(QUOTE.match(lines[i]).group(1))
+                i += 1
+            blocks.append(f'<blockquote>{render_markdown(chr(10).join(quoted))}</blockquote>')
+            continue
+
+        for pattern, tag in ((BULLET, 'ul'), (NUMBERED, 'ol')):
+            if pattern.match(line):
+                items = []
+                while i < len(lines) and lines[i].strip():
+                    item = pattern.match(lines[i])
+                    if item:
+                        items.append(item.group(1))
+                    elif items and lines[i][:1].isspace():
+                        # An indented line continues the item above it
+                        items[-1] += ' ' + lines[i].strip()
+                    else:
+                        break
+                    i += 1
+                blocks.append(f'<{tag}>' + ''.join(f'<li>{render_inline(item)}</li>' for item in items) + f'</{tag}>')
+                break
+        else:
+            paragraph = []
+            while i < len(lines) and lines[i].strip() and not any(
+                    p.match(lines[i]) for p in (FENCE, HEADING, RULE, QUOTE, BULLET, NUMBERED)):
+                paragraph.append(lines[i].strip())
+                i += 1
+            blocks.append(f'<p>{render_inline(chr(10).join(paragraph))}</p>')
+    return '\n'.join(blocks)
+
+
+# --------- BODY CACHE ---------
+
+def cache_key(content_hash):
+    return f"lesson-body:{content_hash}"
+
+
+def compress(body):
+    """
+    {encoding: bytes} of a rendered body for every encoding we can serve.
+    """
+    encoded = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded['br'] = brotli.compress(body)
+    return encoded
+
+
+def render_body(content):
+    return compress(render_markdown(content).encode('utf-8'))
+
+
+def rendered_body(lesson):
+    """
+    The lesson's rendered body in every encoding, rendering it on a cache miss.
+    """
+    content_hash = lesson.content_hash or fingerprint(lesson.content)['content_hash']
+    key = cache_key(content_hash)
+    encoded = cache.get(key)
+    if encoded is None:
+        encoded = render_body(lesson.content)
+        cache.set(key, encoded, settings.LESSON_BODY_CACHE_TIMEOUT)
+    return content_hash, encoded
+
+
+def prerender(lesson_ids):
+    """
+    Render the bodies of these lessons that are not cached yet, once the current transaction commits.
+    """
+    lesson_ids = list(lesson_ids)
+    if not lesson_ids:
+        return
+
+    def render():
+        for start in range(0, len(lesson_ids), 200):
+            rows = dict(Lesson.objects.filter(id__in=lesson_ids[start:start + 200]).values_list('content_hash', 'content'))
+            cached = cache.get_many([cache_key(h) for h in rows])
+            missing = {cache_key(h): render_body(content) for h, content in rows.items() if cache_key(h) not in cached}
+            cache.set_many(missing, settings.LESSON_BODY_CACHE_TIMEOUT)
+
+    transaction.on_commit(render)
+
+
+def pick_encoding(accept_encoding):
+    """
+    The best encoding the client accepts, following the q-values of its Accept-Encoding header.
+    """
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        match = re.search(r'q\s*=\s*([\d.]+)', params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    for encoding in ENCODINGS[:-1]:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
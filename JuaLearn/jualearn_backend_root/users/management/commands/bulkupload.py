@@ -1,15 +1,17 @@
-import json
-import os
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from users.models import Subject, Lesson, Quiz, QuizQuestion, QuizChoice
+from users.importer import import_content
 
 User = get_user_model()
 
 class Command(BaseCommand):
     help = 'Bulk upload subjects, lessons, quizzes from JSON files'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Show what would be created, updated and deleted without writing anything')
+
     def handle(self, *args, **options):
         base_path = getattr(settings, 'CONTENT_FOLDER', None)
         if not base_path:
@@ -20,76 +22,22 @@ class Command(BaseCommand):
         if not admin_user:
             self.stdout.write(self.style.ERROR('No superuser found. Please create a superuser first.'))
             return
-        admin_id = admin_user.id
 
         try:
-            with open(os.path.join(base_path, 'subjects.json'), 'r') as f:
-                subjects_data = json.load(f)
-            with open(os.path.join(base_path, 'lessons.json'), 'r') as f:
-                lessons_data = json.load(f)
-            with open(os.path.join(base_path, 'quizzes.json'), 'r') as f:
-                quizzes_data = json.load(f)
-
-            created_subjects = {}
-
-            for subj in subjects_data:
-                subject_obj, created = Subject.objects.get_or_create(
-                    name=subj['name'],
-                    defaults={
-                        'description': subj.get('description', ''),
-                        'created_by_id': admin_id,
-                    }
-                )
-                created_subjects[subj['name']] = subject_obj
-                self.stdout.write(self.style.SUCCESS(f"Subject: {subject_obj.name} {'created' if created else 'exists'}"))
-
-            for lesson in lessons_data:
-                subj_obj = created_subjects.get(lesson['subjectName'])
-                if subj_obj is None:
-                    self.stdout.write(self.style.ERROR(f"Subject not found for lesson: {lesson['title']} with subjectName: {lesson['subjectName']}"))
-                    continue
-                lesson_obj, created = Lesson.objects.get_or_create(
-                    subject=subj_obj,
-                    title=lesson['title'],
-                    defaults={'content': lesson['content'], 'created_by_id': admin_id}
-                )
-                self.stdout.write(self.style.SUCCESS(f"Lesson: {lesson_obj.title} {'created' if created else 'exists'}"))
-
-            for quiz in quizzes_data:
-                subj_obj = created_subjects.get(quiz['subjectName'])
-                if subj_obj is None:
-                    self.stdout.write(self.style.ERROR(f"Subject not found for quiz: {quiz['title']} with subjectName: {quiz['subjectName']}"))
-                    continue
-
-                quiz_obj, created = Quiz.objects.get_or_create(
-                    title=quiz['title'],
-                    subject=subj_obj,
-                    defaults={
-                        'description': quiz.get('description', ''),
-                        'due_date': quiz.get('due_date'),
-                        'created_by_id': admin_id,
-                    }
-                )
-                if not created:
-                    quiz_obj.questions.all().delete()
-
-                self.stdout.write(self.style.SUCCESS(f"Quiz: {quiz_obj.title} {'created' if created else 'exists'}"))
-
-                for q in quiz.get('questions', []):
-                    question_obj = QuizQuestion.objects.create(
-                        quiz=quiz_obj,
-                        text=q['text'],
-                        type=q.get('type', 'multiple-choice'),
-                    )
-                    for choice in q.get('choices', []):
-                        QuizChoice.objects.create(
-                            question=question_obj,
-                            text=choice['text'],
-                            is_correct=choice.get('is_correct', False),
-                        )
-                    self.stdout.write(self.style.SUCCESS(f"  Question: {q['text']} created"))
-
-            self.stdout.write(self.style.SUCCESS('Bulk upload complete!'))
-
+            report = import_content(base_path, admin_user, dry_run=options['dry_run'])
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Bulk upload failed: {e}'))
+            return
+
+        for warning in report.warnings:
+            self.stdout.write(self.style.ERROR(warning))
+        for change in report.changes:
+            self.stdout.write(f"{change['action']:>6} {change['kind'][:-1]}: {change['item']}")
+        for kind, actions in report.plan.items():
+            summary = ', '.join(f"{count} {action}" for action, count in actions.items() if count)
+            self.stdout.write(f"{kind}: {summary or 'nothing to do'}")
+        self.stdout.write(f"took {report.timings['total']:.2f}s")
+        if report.dry_run:
+            self.stdout.write(self.style.WARNING('Dry run: no changes were written.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Bulk upload complete!'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from users import changes
+
+
+class Command(BaseCommand):
+    help = 'Delete change feed events superseded by a later change to the same row'
+
+    def handle(self, *args, **options):
+        count = changes.compact()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {count} superseded change event(s)"))
@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from users.notifications import STALE_AFTER, run_pending_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued notification fan-out jobs from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the queue once and exit')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=int(STALE_AFTER.total_seconds()),
+                            help='Requeue running jobs started more than this many seconds ago')
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        while True:
+            requeued = requeue_stale_jobs(stale_after)
+            if requeued:
+                self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale job(s)"))
+            done = run_pending_jobs()
+            if done:
+                self.stdout.write(self.style.SUCCESS(f"Delivered {done} notification job(s)"))
+            if options['once']:
+                return
+            if not done:
+                time.sleep(options['interval'])
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from users import progress
+
+
+class Command(BaseCommand):
+    help = 'Recount the subject progress of every enrolled student from their quiz results and assignment grades'
+
+    def handle(self, *args, **options):
+        count = progress.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} progress row(s)"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from users import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search documents of every subject, lesson, quiz and assignment'
+
+    def handle(self, *args, **options):
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} search document(s)"))
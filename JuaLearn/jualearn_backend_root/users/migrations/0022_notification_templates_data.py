@@ -0,0 +1,38 @@
+from django.db import migrations
+
+TEXT_FIELDS = ('title', 'message', 'url', 'type')
+
+
+def attach_templates(model, NotificationTemplate):
+    """
+    Create one template per distinct message and point every matching row at it.
+    """
+    pending = model.objects.filter(template__isnull=True)
+    for values in pending.values(*TEXT_FIELDS).distinct().order_by():
+        template = NotificationTemplate.objects.create(**values)
+        pending.filter(**values).update(template=template)
+
+
+def forwards(apps, schema_editor):
+    NotificationTemplate = apps.get_model('users', 'NotificationTemplate')
+    attach_templates(apps.get_model('users', 'Notification'), NotificationTemplate)
+    attach_templates(apps.get_model('users', 'NotificationJob'), NotificationTemplate)
+
+
+def backwards(apps, schema_editor):
+    NotificationTemplate = apps.get_model('users', 'NotificationTemplate')
+    for template in NotificationTemplate.objects.all():
+        values = {field: getattr(template, field) for field in TEXT_FIELDS}
+        template.deliveries.update(**values)
+        template.jobs.update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0021_notificationtemplate'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0022_notification_templates_data'),
+    ]
+
+    operations = [
+        migrations.RemoveField(model_name='notification', name='title'),
+        migrations.RemoveField(model_name='notification', name='message'),
+        migrations.RemoveField(model_name='notification', name='url'),
+        migrations.RemoveField(model_name='notification', name='type'),
+        migrations.RemoveField(model_name='notificationjob', name='title'),
+        migrations.RemoveField(model_name='notificationjob', name='message'),
+        migrations.RemoveField(model_name='notificationjob', name='url'),
+        migrations.RemoveField(model_name='notificationjob', name='type'),
+        migrations.AlterField(
+            model_name='notification',
+            name='template',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='users.notificationtemplate'),
+        ),
+        migrations.AlterField(
+            model_name='notificationjob',
+            name='template',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='users.notificationtemplate'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0024_notification_inbox_unread_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='source_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='source_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='source_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
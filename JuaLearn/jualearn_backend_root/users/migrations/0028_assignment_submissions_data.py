@@ -0,0 +1,57 @@
+from django.db import migrations
+
+DEFINITION_FIELDS = ('title', 'subject_id', 'created_by_id', 'due_date')
+
+
+def forwards(apps, schema_editor):
+    """
+    Fold each group of per-student copies into one definition row.
+
+    Copies share title, subject, creator and due date with the base row
+    (assigned_to NULL) they were cloned from. The base row is kept, or the
+    oldest copy when there is none, and every copy that was assigned to a
+    student becomes an AssignmentSubmission carrying its grade.
+    """
+    Assignment = apps.get_model('users', 'Assignment')
+    AssignmentSubmission = apps.get_model('users', 'AssignmentSubmission')
+
+    groups = {}
+    for row in Assignment.objects.order_by('id').values('id', 'assigned_to_id', 'grade', 'published', *DEFINITION_FIELDS):
+        groups.setdefault(tuple(row[f] for f in DEFINITION_FIELDS), []).append(row)
+
+    for rows in groups.values():
+        base = next((r for r in rows if r['assigned_to_id'] is None), rows[0])
+        submissions = {}
+        for row in rows:
+            if row['assigned_to_id'] is not None and row['assigned_to_id'] not in submissions:
+                submissions[row['assigned_to_id']] = AssignmentSubmission(
+                    assignment_id=base['id'], student_id=row['assigned_to_id'], grade=row['grade'],
+                )
+        AssignmentSubmission.objects.bulk_create(submissions.values())
+        if any(r['published'] for r in rows):
+            Assignment.objects.filter(id=base['id']).update(published=True)
+        Assignment.objects.filter(id__in=[r['id'] for r in rows if r['id'] != base['id']]).delete()
+
+
+def backwards(apps, schema_editor):
+    Assignment = apps.get_model('users', 'Assignment')
+    AssignmentSubmission = apps.get_model('users', 'AssignmentSubmission')
+    for submission in AssignmentSubmission.objects.select_related('assignment'):
+        assignment = submission.assignment
+        Assignment.objects.create(
+            title=assignment.title, subject_id=assignment.subject_id, created_by_id=assignment.created_by_id,
+            due_date=assignment.due_date, published=assignment.published,
+            assigned_to_id=submission.student_id, grade=submission.grade,
+        )
+    AssignmentSubmission.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0027_assignmentsubmission'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
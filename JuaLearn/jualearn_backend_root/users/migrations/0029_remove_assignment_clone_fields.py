@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:55
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0028_assignment_submissions_data'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='assignment',
+            name='assignment_assignee_idx',
+        ),
+        migrations.RemoveField(
+            model_name='assignment',
+            name='assigned_to',
+        ),
+        migrations.RemoveField(
+            model_name='assignment',
+            name='grade',
+        ),
+    ]
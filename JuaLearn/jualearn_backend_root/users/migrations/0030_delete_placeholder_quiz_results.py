@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+
+def delete_placeholders(apps, schema_editor):
+    """
+    Remove the empty results quiz creation used to make for every enrolled
+    student: no grade and no answers to any of the quiz's questions.
+    """
+    QuizResult = apps.get_model('users', 'QuizResult')
+    StudentAnswer = apps.get_model('users', 'StudentAnswer')
+    answered = StudentAnswer.objects.filter(student=OuterRef('student'), question__quiz=OuterRef('quiz'))
+    QuizResult.objects.filter(grade__isnull=True).filter(~Exists(answered)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0029_remove_assignment_clone_fields'),
+    ]
+
+    operations = [
+        # Nothing to restore going backwards: results are created on submission now
+        migrations.RunPython(delete_placeholders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+TABLE = 'users_searchdocument'
+
+POSTGRES_INDEX = [
+    f"""ALTER TABLE {TABLE} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', body), 'B')
+    ) STORED""",
+    f"CREATE INDEX searchdocument_vector_idx ON {TABLE} USING GIN (search_vector)",
+]
+
+# External-content FTS5 table over title and body, maintained by triggers
+SQLITE_INDEX = [
+    f"""CREATE VIRTUAL TABLE {TABLE}_fts USING fts5(
+        title, body, content='{TABLE}', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER {TABLE}_fts_insert AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {TABLE}_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    f"""CREATE TRIGGER {TABLE}_fts_delete AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {TABLE}_fts({TABLE}_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    f"""CREATE TRIGGER {TABLE}_fts_update AFTER UPDATE ON {TABLE} BEGIN
+        INSERT INTO {TABLE}_fts({TABLE}_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO {TABLE}_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {TABLE}_fts_insert",
+    f"DROP TRIGGER IF EXISTS {TABLE}_fts_delete",
+    f"DROP TRIGGER IF EXISTS {TABLE}_fts_update",
+    f"DROP TABLE IF EXISTS {TABLE}_fts",
+]
+
+
+def sqlite_has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_fulltext_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        statements = POSTGRES_INDEX
+    elif connection.vendor == 'sqlite' and sqlite_has_fts5(connection):
+        statements = SQLITE_INDEX
+    else:
+        # Other databases are searched with the LIKE fallback backend
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    # The Postgres column and index go with the table
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_DROP:
+            schema_editor.execute(sql)
+
+
+def index_existing_content(apps, schema_editor):
+    Subject = apps.get_model('users', 'Subject')
+    Lesson = apps.get_model('users', 'Lesson')
+    Quiz = apps.get_model('users', 'Quiz')
+    Assignment = apps.get_model('users', 'Assignment')
+    SearchDocument = apps.get_model('users', 'SearchDocument')
+
+    def documents():
+        for s in Subject.objects.iterator():
+            yield SearchDocument(kind='subject', object_id=s.id, subject_id=s.id, owner_id=s.created_by_id,
+                                 published=s.published, title=s.name,
+                                 body='\n\n'.join(filter(None, [s.description, s.content])))
+        for lesson in Lesson.objects.iterator():
+            yield SearchDocument(kind='lesson', object_id=lesson.id, subject_id=lesson.subject_id,
+                                 owner_id=lesson.created_by_id, published=True, title=lesson.title, body=lesson.content)
+        for quiz in Quiz.objects.prefetch_related('questions'):
+            body = '\n'.join([quiz.description or '', *(q.text for q in quiz.questions.all())]).strip()
+            yield SearchDocument(kind='quiz', object_id=quiz.id, subject_id=quiz.subject_id, owner_id=quiz.created_by_id,
+                                 published=quiz.published, title=quiz.title, body=body)
+        for a in Assignment.objects.iterator():
+            yield SearchDocument(kind='assignment', object_id=a.id, subject_id=a.subject_id, owner_id=a.created_by_id,
+                                 published=a.published, title=a.title)
+
+    SearchDocument.objects.bulk_create(documents(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0030_delete_placeholder_quiz_results'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('subject', 'Subject'), ('lesson', 'Lesson'), ('quiz', 'Quiz'), ('assignment', 'Assignment')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('published', models.BooleanField(default=False)),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('owner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.subject')),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(index_existing_content, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:06
+
+from django.db import migrations, models
+
+TABLE = 'users_searchdocument'
+
+# Adding a NOT NULL column makes SQLite rebuild the table, which drops the
+# triggers that keep the FTS5 index (migration 0031) in sync
+SQLITE_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE}_fts_insert AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {TABLE}_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE}_fts_delete AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {TABLE}_fts({TABLE}_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE}_fts_update AFTER UPDATE ON {TABLE} BEGIN
+        INSERT INTO {TABLE}_fts({TABLE}_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO {TABLE}_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    f"INSERT INTO {TABLE}_fts({TABLE}_fts) VALUES ('rebuild')",
+]
+
+
+def restore_sqlite_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or f'{TABLE}_fts' not in connection.introspection.table_names():
+        return
+    for sql in SQLITE_TRIGGERS:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0031_searchdocument'),
+    ]
+
+    operations = [
+        # Runs last when unapplying, after RemoveField has rebuilt the table again
+        migrations.RunPython(migrations.RunPython.noop, restore_sqlite_triggers),
+        migrations.AddField(
+            model_name='searchdocument',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(restore_sqlite_triggers, migrations.RunPython.noop),
+    ]
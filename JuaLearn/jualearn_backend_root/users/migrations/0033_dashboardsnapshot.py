@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:12
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0032_searchdocument_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dashboard_snapshot', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('subjects', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('upcoming', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('recent_grades', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('subjects_stale', models.BooleanField(default=True)),
+                ('upcoming_stale', models.BooleanField(default=True)),
+                ('recent_grades_stale', models.BooleanField(default=True)),
+                ('built_on', models.DateField(blank=True, null=True)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0033_dashboardsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='results_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
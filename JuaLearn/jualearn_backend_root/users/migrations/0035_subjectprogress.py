@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0034_quiz_results_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quizzes_taken', models.PositiveIntegerField(default=0)),
+                ('assignments_graded', models.PositiveIntegerField(default=0)),
+                ('average_grade', models.FloatField(blank=True, null=True)),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subject_progress', to=settings.AUTH_USER_MODEL)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress', to='users.subject')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['subject', '-average_grade'], name='progress_leaderboard_idx')],
+                'unique_together': {('student', 'subject')},
+            },
+        ),
+    ]
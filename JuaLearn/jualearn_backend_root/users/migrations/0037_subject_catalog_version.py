@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0036_user_auth_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subject',
+            name='catalog_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
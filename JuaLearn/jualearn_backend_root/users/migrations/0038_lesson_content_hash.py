@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:38
+
+import hashlib
+from django.db import migrations, models
+
+
+def fingerprint_lessons(apps, schema_editor):
+    Lesson = apps.get_model('users', 'Lesson')
+    batch = []
+    for lesson in Lesson.objects.only('id', 'content').iterator(chunk_size=500):
+        data = lesson.content.encode('utf-8')
+        lesson.content_hash = hashlib.sha256(data).hexdigest()
+        lesson.content_size = len(data)
+        batch.append(lesson)
+        if len(batch) == 500:
+            Lesson.objects.bulk_update(batch, ['content_hash', 'content_size'])
+            batch = []
+    Lesson.objects.bulk_update(batch, ['content_hash', 'content_size'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0037_subject_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='content_size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fingerprint_lessons, migrations.RunPython.noop),
+    ]
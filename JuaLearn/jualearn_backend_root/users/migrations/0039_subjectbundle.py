@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:49
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0038_lesson_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectBundle',
+            fields=[
+                ('subject', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='bundle', serialize=False, to='users.subject')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('digest', models.CharField(blank=True, max_length=64)),
+                ('source_stamp', models.CharField(blank=True, max_length=100)),
+                ('history', models.JSONField(default=dict)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BundleEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('source', models.CharField(max_length=64)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bundle_entries', to='users.subject')),
+            ],
+            options={
+                'unique_together': {('subject', 'key')},
+            },
+        ),
+    ]
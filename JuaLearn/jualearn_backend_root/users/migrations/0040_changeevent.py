@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+# kind -> (model, subject id lookup, user id lookup), as users.changes records them
+SYNCED = {
+    'subject': ('Subject', 'id', 'created_by_id'),
+    'lesson': ('Lesson', 'subject_id', 'created_by_id'),
+    'quiz': ('Quiz', 'subject_id', 'created_by_id'),
+    'assignment': ('Assignment', 'subject_id', 'created_by_id'),
+    'enrollment': ('Enrollment', 'subject_id', 'student_id'),
+    'quiz_result': ('QuizResult', 'quiz__subject_id', 'student_id'),
+    'notification': ('Notification', None, 'recipient_id'),
+}
+
+
+def seed_events(apps, schema_editor):
+    """
+    One event per existing row, so a client syncing from the start gets everything.
+    """
+    ChangeEvent = apps.get_model('users', 'ChangeEvent')
+    for kind, (model_name, subject_lookup, user_lookup) in SYNCED.items():
+        model = apps.get_model('users', model_name)
+        fields = ['id', subject_lookup, user_lookup] if subject_lookup else ['id', user_lookup]
+        rows = model.objects.order_by('id').values_list(*fields).iterator(chunk_size=2000)
+        batch = []
+        for row in rows:
+            object_id, *scope = row
+            subject_id, user_id = scope if subject_lookup else (None, scope[0])
+            batch.append(ChangeEvent(kind=kind, object_id=object_id, subject_id=subject_id, user_id=user_id))
+            if len(batch) == 2000:
+                ChangeEvent.objects.bulk_create(batch)
+                batch = []
+        ChangeEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0039_subjectbundle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('subject_id', models.BigIntegerField(blank=True, null=True)),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['subject_id', 'id'], name='change_subject_idx'), models.Index(fields=['user_id', 'id'], name='change_user_idx'), models.Index(fields=['kind', 'id'], name='change_kind_idx'), models.Index(fields=['kind', 'object_id', 'id'], name='change_row_idx')],
+            },
+        ),
+        migrations.RunPython(seed_events, migrations.RunPython.noop),
+    ]
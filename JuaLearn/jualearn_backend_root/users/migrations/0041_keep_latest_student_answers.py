@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+
+def delete_superseded_answers(apps, schema_editor):
+    """
+    Keep only each student's latest answer to a question. Resubmitting a quiz
+    used to add answers next to the earlier ones, which quiz analytics then
+    counted as well.
+    """
+    StudentAnswer = apps.get_model('users', 'StudentAnswer')
+    newer = StudentAnswer.objects.filter(student=OuterRef('student'), question=OuterRef('question'), id__gt=OuterRef('id'))
+    StudentAnswer.objects.filter(Exists(newer)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0040_changeevent'),
+    ]
+
+    operations = [
+        # The earlier answers are gone for good; nothing reads them any more
+        migrations.RunPython(delete_superseded_answers, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -16,6 +17,17 @@ class User(AbstractUser):
     years_of_experience = models.PositiveIntegerField(blank=True, null=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
 
+    # Maintained alongside Notification writes so the inbox badge never needs COUNT(*)
+    unread_notifications = models.PositiveIntegerField(default=0)
+    # Bumped when the user is deactivated or their role changes; tokens carrying an older value are refused
+    auth_version = models.PositiveIntegerField(default=0)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Student lists and notification fan-outs walk students in id order
+            models.Index(fields=['role', 'id'], name='user_role_idx'),
+        ]
+
 
 class Subject(models.Model):
     name = models.CharField(max_length=50)
@@ -29,25 +41,47 @@ class Subject(models.Model):
         null=True, 
         blank=True
     )
+    # Hash of the content/*.json record this row was last imported from
+    source_hash = models.CharField(max_length=64, blank=True)
+    # Bumped whenever the subject or one of its lessons or quizzes changes; keys cached catalog responses
+    catalog_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
 
 class Assignment(models.Model):
+    """
+    One assignment set for every student enrolled in its subject. Each
+    student's submission and grade live in AssignmentSubmission.
+    """
     title = models.CharField(max_length=100)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_assignments')
-    assigned_to = models.ForeignKey(
-        User, 
-        on_delete=models.CASCADE, 
-        related_name='assignments', 
-        null=True, 
-        blank=True
-    )
     due_date = models.DateField()
-    grade = models.IntegerField(null=True, blank=True)
     published = models.BooleanField(default=False)
 
+    def __str__(self):
+        return self.title
+
+
+class AssignmentSubmission(models.Model):
+    """
+    A student's submission of an assignment and the grade it got. Created the
+    first time the student submits or the teacher grades, not up front.
+    """
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name='submissions')
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='assignment_submissions',
+                                limit_choices_to={'role': 'student'})
+    submitted_at = models.DateTimeField(null=True, blank=True)
+    grade = models.IntegerField(null=True, blank=True)
+    graded_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('assignment', 'student')
+
+    def __str__(self):
+        return f"{self.student.username} - {self.assignment.title} - Grade: {self.grade}"
+
 class Quiz(models.Model):
     title = models.CharField(max_length=100)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
@@ -62,22 +96,51 @@ class Quiz(models.Model):
     )
     due_date = models.DateField()
     published = models.BooleanField(default=False) 
+    # Bumped whenever questions or choices change; keys the answer-key cache
+    content_version = models.PositiveIntegerField(default=0)
+    # Bumped whenever a result is saved or deleted; keys the analytics cache
+    results_version = models.PositiveIntegerField(default=0)
+    source_hash = models.CharField(max_length=64, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['subject', 'published'], name='quiz_subject_published_idx'),
+        ]
 
-class Notification(models.Model):
-    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+
+class NotificationTemplate(models.Model):
+    """
+    Message text shared by every delivery of one notification.
+    """
     title = models.CharField(max_length=255)
     message = models.TextField(blank=True)
     url = models.URLField(blank=True, null=True)
+    type = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.title
+
+
+class Notification(models.Model):
+    """
+    Delivery of a NotificationTemplate to a single recipient.
+    """
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    template = models.ForeignKey(NotificationTemplate, on_delete=models.CASCADE, related_name='deliveries')
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
-    type = models.CharField(max_length=50, blank=True) 
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notification_inbox_idx'),
+            # Unread rows are a small slice of the table; mark-all-read and recounts only touch them
+            models.Index(fields=['recipient'], condition=models.Q(is_read=False), name='notification_unread_idx'),
+        ]
 
     def __str__(self):
-        return f"Notification for {self.recipient.username}: {self.title}"
+        return f"Notification for {self.recipient.username}: {self.template.title}"
 
 
 class Enrollment(models.Model):
@@ -117,6 +180,11 @@ class StudentAnswer(models.Model):
     selected_choice = models.ForeignKey(QuizChoice, on_delete=models.CASCADE)
     submitted_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'question'], name='studentanswer_student_idx'),
+        ]
+
 
 class Lesson(models.Model):
     subject = models.ForeignKey('Subject', on_delete=models.CASCADE, related_name='lessons')
@@ -124,6 +192,193 @@ class Lesson(models.Model):
     content = models.TextField()
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     date_created = models.DateTimeField(auto_now_add=True)
+    source_hash = models.CharField(max_length=64, blank=True)
+    # SHA-256 and UTF-8 length of content, set by users.lessons; key the rendered body cache
+    content_hash = models.CharField(max_length=64, blank=True)
+    content_size = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.subject.name} - {self.title}"
+
+class NotificationJob(models.Model):
+    """
+    A queued notification fan-out: one message delivered to every member of an audience.
+    """
+    AUDIENCE_CHOICES = (
+        ('all_students', 'All students'),
+        ('subject_students', 'Students enrolled in a subject'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    audience = models.CharField(max_length=30, choices=AUDIENCE_CHOICES)
+    subject = models.ForeignKey(Subject, on_delete=models.SET_NULL, null=True, blank=True)
+    template = models.ForeignKey(NotificationTemplate, on_delete=models.CASCADE, related_name='jobs')
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name='notification_jobs',
+        null=True,
+        blank=True
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total = models.PositiveIntegerField(null=True, blank=True)
+    sent = models.PositiveIntegerField(default=0)
+    # Highest recipient id already delivered, so an interrupted job resumes where it stopped
+    last_recipient_id = models.BigIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.get_audience_display()}: {self.template.title} ({self.status})"
+
+
+class SearchDocument(models.Model):
+    """
+    The searchable text of a subject, lesson, quiz or assignment, kept in sync
+    by users.search. The full-text index over title and body depends on the
+    database and is created by migration 0031.
+    """
+    KIND_CHOICES = (
+        ('subject', 'Subject'),
+        ('lesson', 'Lesson'),
+        ('quiz', 'Quiz'),
+        ('assignment', 'Assignment'),
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    # Copied from the source row so results can be filtered by role without joining it back
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='+')
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    published = models.BooleanField(default=False)
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    # Lets each worker's autocomplete index pick up changes made by other workers
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.title}"
+
+
+class DashboardSnapshot(models.Model):
+    """
+    A student's dashboard, stored ready to serve. users.dashboard flags a
+    section stale when something it shows changes and only stale sections are
+    rebuilt on the next read.
+    """
+    student = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='dashboard_snapshot')
+    subjects = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    upcoming = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    recent_grades = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    subjects_stale = models.BooleanField(default=True)
+    upcoming_stale = models.BooleanField(default=True)
+    recent_grades_stale = models.BooleanField(default=True)
+    # Upcoming items depend on today's date, so that section also expires at midnight
+    built_on = models.DateField(null=True, blank=True)
+    # Bumped by every invalidation; a rebuild is only saved if nothing changed meanwhile
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard of {self.student.username}"
+
+
+class SubjectProgress(models.Model):
+    """
+    A student's standing in one subject, kept up to date by users.progress
+    whenever one of their quiz results or assignment submissions changes, so
+    rankings and completion never need to read the raw results.
+    """
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='subject_progress')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='progress')
+    quizzes_taken = models.PositiveIntegerField(default=0)
+    assignments_graded = models.PositiveIntegerField(default=0)
+    # Over every graded quiz and assignment; null until the first grade
+    average_grade = models.FloatField(null=True, blank=True)
+    last_activity = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('student', 'subject')
+        indexes = [
+            models.Index(fields=['subject', '-average_grade'], name='progress_leaderboard_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student.username} - {self.subject.name}: {self.average_grade}"
+
+
+class SubjectBundle(models.Model):
+    """
+    The offline bundle of a subject: its metadata, lessons and published
+    quizzes as BundleEntry rows, built by users.bundles. version only moves
+    when the content does.
+    """
+    subject = models.OneToOneField(Subject, on_delete=models.CASCADE, primary_key=True, related_name='bundle')
+    version = models.PositiveIntegerField(default=0)
+    # SHA-256 of the manifest, so identical content always has the same digest
+    digest = models.CharField(max_length=64, blank=True)
+    # The catalog and quiz versions the bundle was built from; a different stamp means rebuild
+    source_stamp = models.CharField(max_length=100, blank=True)
+    # {version: {entry key: content hash}} of the latest versions, for deltas
+    history = models.JSONField(default=dict)
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Bundle of {self.subject.name} v{self.version}"
+
+
+class BundleEntry(models.Model):
+    """
+    One item of a subject bundle, e.g. 'lesson:12', stored with the hash of its content.
+    """
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='bundle_entries')
+    key = models.CharField(max_length=40)
+    content_hash = models.CharField(max_length=64)
+    # What the item was built from, so unchanged items are not rebuilt
+    source = models.CharField(max_length=64)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        unique_together = ('subject', 'key')
+
+    def __str__(self):
+        return f"{self.subject_id}/{self.key}"
+
+
+class ChangeEvent(models.Model):
+    """
+    A create, update or delete of a row clients keep a copy of, recorded by
+    users.changes. The id is the change-feed sequence.
+    """
+    kind = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    # Plain ids rather than foreign keys, so tombstones outlive the rows they point at
+    subject_id = models.BigIntegerField(null=True, blank=True)
+    user_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['subject_id', 'id'], name='change_subject_idx'),
+            models.Index(fields=['user_id', 'id'], name='change_user_idx'),
+            models.Index(fields=['kind', 'id'], name='change_kind_idx'),
+            models.Index(fields=['kind', 'object_id', 'id'], name='change_row_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.subject.name} - {self.title}"
\ No newline at end of file
+        return f"#{self.id} {self.kind}:{self.object_id}{' deleted' if self.deleted else ''}"
@@ -0,0 +1,223 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from . import changes
+from .models import Enrollment, Notification, NotificationJob, NotificationTemplate, User
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+# Thread mode: seconds before the first retry, doubled for each one after
+RETRY_DELAY = 5
+# Running jobs started longer ago than this lost their thread or worker
+STALE_AFTER = timedelta(minutes=10)
+
+
+def fanout_chunk_size():
+    return getattr(settings, 'NOTIFICATION_FANOUT_CHUNK_SIZE', 1000)
+
+
+def notify(recipient, title, message='', url='', type=''):
+    """
+    Send a one-off notification to a single user.
+    """
+    with transaction.atomic():
+        # The notification stream reads by id, so ids must commit in order
+        changes.serialize_inserts()
+        template = NotificationTemplate.objects.create(title=title, message=message, url=url, type=type)
+        notification = Notification.objects.create(recipient=recipient, template=template)
+        adjust_unread(recipient.pk, 1)
+    return notification
+
+
+def adjust_unread(user_ids, delta):
+    """
+    Add delta to the unread counter of one user id or a list of user ids.
+    """
+    if not isinstance(user_ids, (list, tuple, set)):
+        user_ids = [user_ids]
+    return User.objects.filter(pk__in=user_ids).update(
+        unread_notifications=Greatest(F('unread_notifications') + delta, Value(0))
+    )
+
+
+def mark_all_read(user):
+    """
+    Mark every unread notification of a user as read with a single UPDATE.
+    """
+    with transaction.atomic():
+        # update() skips signals, so the rows are listed for the change feed first
+        ids = list(Notification.objects.filter(recipient=user, is_read=False).values_list('id', flat=True))
+        updated = Notification.objects.filter(id__in=ids).update(is_read=True)
+        if updated:
+            adjust_unread(user.pk, -updated)
+            changes.record('notification', [(notification_id, None, user.pk) for notification_id in ids])
+    return updated
+
+
+def recount_unread(users=None):
+    """
+    Recompute unread counters from the notification table, e.g. after manual data fixes.
+    """
+    unread = (Notification.objects.filter(recipient=OuterRef('pk'), is_read=False)
+              .order_by().values('recipient').annotate(n=Count('id')).values('n'))
+    users = User.objects.all() if users is None else users
+    return users.update(unread_notifications=Coalesce(Subquery(unread, output_field=IntegerField()), 0))
+
+
+def enqueue_fanout(audience, title, message='', url='', type='', subject=None, created_by=None):
+    """
+    Queue a notification for every member of an audience and return the job.
+
+    Delivery happens outside the request. NOTIFICATION_FANOUT_MODE selects who
+    picks the job up: 'thread' starts a background thread once the current
+    transaction commits, 'worker' leaves it for the notificationworker command.
+    Both retry a failed job up to MAX_ATTEMPTS times and requeue jobs whose
+    process died.
+    """
+    template = NotificationTemplate.objects.create(title=title, message=message, url=url, type=type)
+    job = NotificationJob.objects.create(
+        audience=audience,
+        subject=subject,
+        template=template,
+        created_by=created_by,
+    )
+    if getattr(settings, 'NOTIFICATION_FANOUT_MODE', 'thread') == 'thread':
+        transaction.on_commit(lambda: start_job_thread(job.pk))
+    return job
+
+
+def start_job_thread(job_id):
+    def target():
+        try:
+            run_job_with_retries(job_id)
+            # There is no worker in this mode to pick up what a dead process left behind
+            resume_abandoned_jobs(STALE_AFTER)
+        except Exception:
+            logger.exception("Notification thread of job %s failed", job_id)
+        finally:
+            close_old_connections()
+
+    threading.Thread(target=target, name=f"notification-job-{job_id}", daemon=True).start()
+
+
+def audience_recipient_ids(job, after_id=0):
+    """
+    Recipient ids of a job greater than after_id, in ascending order.
+    """
+    if job.audience == 'all_students':
+        return (User.objects.filter(role='student', id__gt=after_id)
+                .order_by('id').values_list('id', flat=True))
+    if job.audience == 'subject_students' and job.subject_id is not None:
+        return (Enrollment.objects.filter(subject_id=job.subject_id, student_id__gt=after_id)
+                .order_by('student_id').values_list('student_id', flat=True))
+    return User.objects.none().values_list('id', flat=True)
+
+
+def claim_job(job_id):
+    """
+    Atomically move a pending job to running. Returns False if another worker got it first.
+    """
+    claimed = NotificationJob.objects.filter(pk=job_id, status='pending').update(
+        status='running',
+        started_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    )
+    return claimed == 1
+
+
+def run_job(job_id):
+    """
+    Deliver a pending job in chunks of recipient ids.
+
+    Each chunk is inserted with one bulk_create and committed together with the
+    job's progress cursor, so a job that dies half way resumes without
+    delivering duplicates.
+    """
+    if not claim_job(job_id):
+        return False
+    job = NotificationJob.objects.get(pk=job_id)
+    chunk_size = fanout_chunk_size()
+
+    try:
+        if job.total is None:
+            job.total = audience_recipient_ids(job).count()
+            job.save(update_fields=['total'])
+
+        while True:
+            chunk = list(audience_recipient_ids(job, job.last_recipient_id)[:chunk_size])
+            if not chunk:
+                break
+            with transaction.atomic():
+                changes.serialize_inserts()
+                delivered = Notification.objects.bulk_create([
+                    Notification(recipient_id=recipient_id, template_id=job.template_id)
+                    for recipient_id in chunk
+                ])
+                changes.record_rows(delivered)
+                adjust_unread(chunk, 1)
+                job.sent += len(chunk)
+                job.last_recipient_id = chunk[-1]
+                job.save(update_fields=['sent', 'last_recipient_id'])
+    except Exception as e:
+        logger.exception("Notification job %s failed", job_id)
+        job.status = 'pending' if job.attempts < MAX_ATTEMPTS else 'failed'
+        job.error = str(e)
+        job.save(update_fields=['status', 'error'])
+        return False
+
+    job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at'])
+    return True
+
+
+def run_job_with_retries(job_id):
+    """
+    run_job() until the job is done, fails for good or is taken by someone
+    else, waiting RETRY_DELAY seconds after the first failure and twice as
+    long after each one after that.
+    """
+    delay = RETRY_DELAY
+    while True:
+        if run_job(job_id):
+            return True
+        if not NotificationJob.objects.filter(pk=job_id, status='pending').exists():
+            return False
+        time.sleep(delay)
+        delay *= 2
+
+
+def resume_abandoned_jobs(max_age):
+    """
+    Requeue stale running jobs and run every job pending for longer than
+    max_age. Returns the number of jobs completed.
+    """
+    requeue_stale_jobs(max_age)
+    abandoned = (NotificationJob.objects.filter(status='pending', created_at__lt=timezone.now() - max_age)
+                 .order_by('created_at', 'id').values_list('id', flat=True))
+    return sum(1 for job_id in list(abandoned) if run_job_with_retries(job_id))
+
+
+def run_pending_jobs(limit=None):
+    """
+    Run queued jobs oldest first. Returns the number of jobs completed.
+    """
+    pending = NotificationJob.objects.filter(status='pending').order_by('created_at', 'id').values_list('id', flat=True)
+    if limit is not None:
+        pending = pending[:limit]
+    return sum(1 for job_id in list(pending) if run_job(job_id))
+
+
+def requeue_stale_jobs(max_age):
+    """
+    Put running jobs whose worker died (started more than max_age ago) back in the queue.
+    """
+    cutoff = timezone.now() - max_age
+    return NotificationJob.objects.filter(status='running', started_at__lt=cutoff).update(status='pending')
@@ -0,0 +1,175 @@
+"""
+Per-student, per-subject progress and subject leaderboards.
+
+SubjectProgress holds one row for every enrollment. Whenever a quiz result or
+assignment submission is saved or deleted, the receivers below recount the
+row of that student and subject from their own results only (a couple of
+indexed lookups) inside the same transaction, so the row never disagrees
+with the grades it summarises. Deleting a quiz or assignment recounts the
+students who had a grade on it together instead (see users.cascades), and
+a deleted subject takes its progress rows with it. rebuild() recounts every
+row at once for backfills and repairs.
+
+Leaderboards and completion read SubjectProgress alone.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .cascades import cascaded
+from .models import Enrollment, Quiz, QuizResult, Assignment, AssignmentSubmission, SubjectProgress
+
+FIELDS = ['quizzes_taken', 'assignments_graded', 'average_grade', 'last_activity', 'updated_at']
+
+
+def tally(results, submissions):
+    """
+    {(student_id, subject_id): {field: value}} for these quiz results and assignment submissions.
+    """
+    totals = {}
+
+    def entry(key):
+        return totals.setdefault(key, {'quizzes': 0, 'assignments': 0, 'graded': 0, 'sum': 0, 'last': None})
+
+    quiz_rows = (results.values('student_id', subject=F('quiz__subject_id'))
+                 .annotate(n=Count('id'), graded=Count('grade'), total=Sum('grade'), last=Max('submitted_at'))
+                 .order_by())
+    assignment_rows = (submissions.values('student_id', subject=F('assignment__subject_id'))
+                       .annotate(graded=Count('grade'), total=Sum('grade'),
+                                 graded_last=Max('graded_at'), submitted_last=Max('submitted_at'))
+                       .order_by())
+    for row in quiz_rows:
+        t = entry((row['student_id'], row['subject']))
+        t['quizzes'] = row['n']
+        t['graded'] += row['graded']
+        t['sum'] += row['total'] or 0
+        t['last'] = row['last']
+    for row in assignment_rows:
+        t = entry((row['student_id'], row['subject']))
+        t['assignments'] = row['graded']
+        t['graded'] += row['graded']
+        t['sum'] += row['total'] or 0
+        t['last'] = max(filter(None, (t['last'], row['graded_last'], row['submitted_last'])), default=None)
+
+    return {key: {
+        'quizzes_taken': t['quizzes'],
+        'assignments_graded': t['assignments'],
+        'average_grade': round(t['sum'] / t['graded'], 2) if t['graded'] else None,
+        'last_activity': t['last'],
+    } for key, t in totals.items()}
+
+
+def save_rows(pairs, counts):
+    """
+    Upsert the progress rows of these (student_id, subject_id) pairs; pairs without counts get zeroes.
+    """
+    empty = {'quizzes_taken': 0, 'assignments_graded': 0, 'average_grade': None, 'last_activity': None}
+    SubjectProgress.objects.bulk_create(
+        [SubjectProgress(student_id=student_id, subject_id=subject_id, **counts.get((student_id, subject_id), empty))
+         for student_id, subject_id in pairs],
+        update_conflicts=True, unique_fields=['student', 'subject'], update_fields=FIELDS, batch_size=1000,
+    )
+
+
+def refresh(student_id, subject_id):
+    """
+    Recount one student's progress in one subject. Students who are not
+    enrolled have no row.
+    """
+    if not Enrollment.objects.filter(student_id=student_id, subject_id=subject_id).exists():
+        SubjectProgress.objects.filter(student_id=student_id, subject_id=subject_id).delete()
+        return
+    counts = tally(QuizResult.objects.filter(student_id=student_id, quiz__subject_id=subject_id),
+                   AssignmentSubmission.objects.filter(student_id=student_id, assignment__subject_id=subject_id))
+    save_rows([(student_id, subject_id)], counts)
+
+
+def refresh_students(student_ids, subject_id):
+    """
+    refresh() for many students of one subject at once.
+    """
+    enrolled = list(Enrollment.objects.filter(subject_id=subject_id, student_id__in=student_ids)
+                    .values_list('student_id', flat=True))
+    counts = tally(QuizResult.objects.filter(student_id__in=enrolled, quiz__subject_id=subject_id),
+                   AssignmentSubmission.objects.filter(student_id__in=enrolled, assignment__subject_id=subject_id))
+    save_rows([(student_id, subject_id) for student_id in enrolled], counts)
+
+
+def rebuild():
+    """
+    Recount every enrolled student's progress. Returns the number of rows written.
+    """
+    with transaction.atomic():
+        pairs = list(Enrollment.objects.values_list('student_id', 'subject_id').order_by('subject_id', 'student_id'))
+        counts = tally(QuizResult.objects.all(), AssignmentSubmission.objects.all())
+        SubjectProgress.objects.all().delete()
+        save_rows(pairs, counts)
+    return len(pairs)
+
+
+def leaderboard(subject, limit):
+    """
+    The top students of a subject by average grade, with their completion in
+    percent of the subject's published quizzes and assignments.
+    """
+    items = (Quiz.objects.filter(subject=subject, published=True).count()
+             + Assignment.objects.filter(subject=subject, published=True).count())
+    rows = (SubjectProgress.objects
+            .filter(subject=subject, average_grade__isnull=False)
+            .select_related('student')
+            .order_by('-average_grade', '-quizzes_taken', 'student_id')[:limit])
+    return [{
+        'rank': rank,
+        'student': {'id': row.student_id, 'username': row.student.username,
+                    'first_name': row.student.first_name, 'last_name': row.student.last_name},
+        'average_grade': row.average_grade,
+        'quizzes_taken': row.quizzes_taken,
+        'assignments_graded': row.assignments_graded,
+        'completion': min(round(100 * (row.quizzes_taken + row.assignments_graded) / items), 100) if items else None,
+        'last_activity': row.last_activity,
+    } for rank, row in enumerate(rows, start=1)]
+
+
+# --------- UPDATES ---------
+
+@receiver(post_save, sender=QuizResult)
+@receiver(post_delete, sender=QuizResult)
+def result_changed(sender, instance, raw=False, origin=None, **kwargs):
+    if not raw and not cascaded(sender, origin):
+        subject_id = Quiz.objects.filter(pk=instance.quiz_id).values_list('subject_id', flat=True).first()
+        if subject_id is not None:
+            refresh(instance.student_id, subject_id)
+
+
+@receiver(post_save, sender=AssignmentSubmission)
+@receiver(post_delete, sender=AssignmentSubmission)
+def submission_changed(sender, instance, raw=False, origin=None, **kwargs):
+    if not raw and not cascaded(sender, origin):
+        subject_id = Assignment.objects.filter(pk=instance.assignment_id).values_list('subject_id', flat=True).first()
+        if subject_id is not None:
+            refresh(instance.student_id, subject_id)
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_changed(sender, instance, raw=False, origin=None, **kwargs):
+    if not raw and not cascaded(sender, origin):
+        refresh(instance.student_id, instance.subject_id)
+
+
+@receiver(pre_delete, sender=Quiz)
+@receiver(pre_delete, sender=Assignment)
+def remember_graded(sender, instance, origin=None, **kwargs):
+    # Read while the grades still exist; recounted once they are gone
+    if not cascaded(sender, origin):
+        grades = (QuizResult.objects.filter(quiz=instance) if sender is Quiz
+                  else AssignmentSubmission.objects.filter(assignment=instance))
+        instance._graded_students = list(grades.values_list('student_id', flat=True))
+
+
+@receiver(post_delete, sender=Quiz)
+@receiver(post_delete, sender=Assignment)
+def graded_item_deleted(sender, instance, **kwargs):
+    students = getattr(instance, '_graded_students', None)
+    if students:
+        refresh_students(students, instance.subject_id)
@@ -0,0 +1,202 @@
+"""
+Eager loading planned from the serializer that is going to render a queryset.
+
+build_plan() walks a serializer's readable fields and works out which
+relations it will touch: nested serializers and related fields on foreign keys
+become select_related(), nested many=True serializers become a Prefetch
+(itself planned from the child serializer) and plain fields become the
+columns passed to only(). Levels the planner cannot see into, such as
+SerializerMethodField or a related object's __str__, keep all their columns.
+Fields rendering the queryset's own annotations need no column.
+
+Because the plan follows the serializer's fields, ?fields= and ?omit= (see
+SparseFieldsMixin in users/serializers.py) trim the query too.
+
+Viewsets opt in through EagerLoadingMixin and can declare the relations the
+planner cannot infer in select_related / prefetch_related.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def get_model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def is_forward_single(field):
+    return field is not None and field.concrete and (field.many_to_one or field.one_to_one)
+
+
+class EagerLoadingPlan:
+    def __init__(self, model, annotations=()):
+        self.model = model
+        self.annotations = set(annotations)
+        self.select = set()
+        self.prefetch = {}
+        # prefix -> (model, set of field names, or None for every column)
+        self.levels = {'': (model, set())}
+
+    def level(self, prefix, model):
+        return self.levels.setdefault(prefix, (model, set()))
+
+    def add_column(self, prefix, name):
+        columns = self.levels[prefix][1]
+        if columns is not None:
+            columns.add(name)
+
+    def load_all(self, prefix):
+        self.levels[prefix] = (self.levels[prefix][0], None)
+
+    def add_select(self, lookup):
+        """
+        select_related() a lookup declared by hand, loading every column along the way.
+        """
+        model, prefix = self.model, ''
+        for name in lookup.split('__'):
+            relation = get_model_field(model, name)
+            if not is_forward_single(relation):
+                raise ValueError(f"{lookup!r} is not a chain of forward relations on {self.model.__name__}")
+            self.add_column(prefix, relation.name)
+            model, prefix = relation.related_model, f"{prefix}{name}__"
+            self.level(prefix, model)
+            self.load_all(prefix)
+        self.select.add(lookup)
+
+    def add_prefetch(self, lookup):
+        relation = get_model_field(self.model, lookup.split('__')[0])
+        if is_forward_single(relation):
+            self.add_column('', relation.name)
+        self.prefetch.setdefault(lookup, lookup)
+
+    def only_fields(self):
+        fields = []
+        for prefix, (model, columns) in self.levels.items():
+            if columns is None:
+                names = [f.name for f in model._meta.concrete_fields]
+            else:
+                # Foreign key columns are cheap and related managers and
+                # prefetches read them, so they are always loaded
+                keys = {f.name for f in model._meta.concrete_fields if f.is_relation}
+                names = [model._meta.pk.name, *sorted((columns | keys) - {model._meta.pk.name})]
+            fields.extend(prefix + name for name in names)
+        return fields
+
+    def apply(self, queryset, restrict=True):
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch.values())
+        if restrict:
+            queryset = queryset.only(*self.only_fields())
+        return queryset
+
+
+def build_plan(serializer, model=None, annotations=()):
+    """
+    Work out the select_related / prefetch_related / only() needed to render
+    querysets with this serializer instance.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    plan = EagerLoadingPlan(model or serializer.Meta.model, annotations)
+    _plan_serializer(plan, serializer, plan.model, '')
+    return plan
+
+
+def _plan_serializer(plan, serializer, model, prefix):
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*' or isinstance(field, serializers.SerializerMethodField):
+            plan.load_all(prefix)
+            continue
+
+        *path, attr = field.source.split('.')
+        current, current_prefix = model, prefix
+        for name in path:
+            relation = get_model_field(current, name)
+            if not is_forward_single(relation):
+                plan.load_all(current_prefix)
+                break
+            plan.add_column(current_prefix, relation.name)
+            plan.select.add(current_prefix + name)
+            current, current_prefix = relation.related_model, f"{current_prefix}{name}__"
+            plan.level(current_prefix, current)
+        else:
+            _plan_field(plan, field, current, current_prefix, attr)
+
+
+def _plan_field(plan, field, model, prefix, attr):
+    model_field = get_model_field(model, attr)
+    lookup = prefix + attr
+
+    if isinstance(field, serializers.ListSerializer):
+        if model_field is None or not model_field.is_relation:
+            plan.prefetch[lookup] = lookup
+            return
+        child_model = model_field.related_model
+        child = build_plan(field.child, child_model)
+        plan.prefetch[lookup] = Prefetch(lookup, queryset=child.apply(child_model._default_manager.all()))
+    elif isinstance(field, serializers.BaseSerializer):
+        if not is_forward_single(model_field):
+            plan.load_all(prefix)
+            return
+        plan.add_column(prefix, model_field.name)
+        plan.select.add(lookup)
+        plan.level(lookup + '__', model_field.related_model)
+        _plan_serializer(plan, field, model_field.related_model, lookup + '__')
+    elif isinstance(field, serializers.ManyRelatedField):
+        plan.prefetch[lookup] = lookup
+    elif isinstance(field, serializers.RelatedField) and is_forward_single(model_field):
+        plan.add_column(prefix, model_field.name)
+        if not isinstance(field, serializers.PrimaryKeyRelatedField):
+            # The field renders the related object, e.g. through its __str__
+            plan.select.add(lookup)
+            plan.level(lookup + '__', model_field.related_model)
+            plan.load_all(lookup + '__')
+    elif model_field is not None and model_field.concrete and not model_field.is_relation:
+        plan.add_column(prefix, model_field.name)
+    elif model_field is None and not prefix and attr in plan.annotations:
+        pass
+    else:
+        plan.load_all(prefix)
+
+
+def eager_load(queryset, serializer, restrict=True, select_related=(), prefetch_related=()):
+    """
+    Apply the plan for serializer to queryset, plus any relations declared by hand.
+    """
+    plan = build_plan(serializer, queryset.model, queryset.query.annotations)
+    for lookup in select_related:
+        plan.add_select(lookup)
+    for lookup in prefetch_related:
+        plan.add_prefetch(lookup)
+    return plan.apply(queryset, restrict=restrict)
+
+
+class EagerLoadingMixin:
+    """
+    Eager-load what the viewset's serializer renders, so list endpoints run a
+    constant number of queries whatever the page size.
+
+    only() is applied on reads that render the serializer (list, retrieve and
+    plain generic views) only, so instances saved by writes or handed to
+    custom actions are never partially loaded.
+    """
+    select_related = ()
+    prefetch_related = ()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return eager_load(
+            queryset,
+            self.get_serializer(),
+            restrict=self.request.method in SAFE_METHODS and getattr(self, 'action', None) in (None, 'list', 'retrieve'),
+            select_related=self.select_related,
+            prefetch_related=self.prefetch_related,
+        )
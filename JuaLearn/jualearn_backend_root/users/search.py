@@ -0,0 +1,339 @@
+"""
+Full-text search over subjects, lessons, quizzes and assignments.
+
+Every searchable row is mirrored into a SearchDocument (title, body and the
+fields needed to filter by role), kept up to date by the signal receivers at
+the bottom of this module and by the bulk importer, which bypasses signals.
+Ranking, matching and snippets are left to a backend picked from the
+database in use:
+
+- PostgreSQL: a generated tsvector column with a GIN index, queried with
+  websearch_to_tsquery, ranked with ts_rank_cd and highlighted with ts_headline
+- SQLite: an FTS5 table, ranked with bm25() and highlighted with snippet()
+- anything else: LIKE matching, ranked by where the words were found
+
+SEARCH_BACKEND can name a backend class to override the choice. Searches that
+run longer than SEARCH_TIMEOUT_MS are cancelled and raise SearchTimeout.
+"""
+import html
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVectorField
+from django.core.exceptions import EmptyResultSet
+from django.db import OperationalError, connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from . import autocomplete
+from .cascades import cascaded
+from .models import Subject, Lesson, Quiz, QuizQuestion, Assignment, Enrollment, SearchDocument
+
+# Backends wrap matches in these and format_snippet() turns them into <mark>
+# tags once the rest of the text has been escaped
+MATCH_START, MATCH_END = '\x02', '\x03'
+SNIPPET_WORDS = 16
+MAX_TERMS = 10
+BATCH_SIZE = 500
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def format_snippet(text):
+    text = html.escape(text or '')
+    return text.replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+class SimpleSearchBackend:
+    """
+    Works on any database: every word must appear in the title or body.
+    Title matches rank first. Slow on large tables, so only used when nothing better is available.
+    """
+
+    def search(self, documents, query, limit, offset=0):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        for term in terms:
+            documents = documents.filter(Q(title__icontains=term) | Q(body__icontains=term))
+        in_title = Q()
+        for term in terms:
+            in_title &= Q(title__icontains=term)
+        documents = (documents
+                     .annotate(rank=Case(When(in_title, then=Value(2)), default=Value(1), output_field=IntegerField()))
+                     .order_by('-rank', 'id'))[offset:offset + limit]
+        return [(doc, float(doc.rank), self.snippet(doc.body, terms)) for doc in documents]
+
+    def snippet(self, text, terms):
+        words = text.split()
+        pattern = re.compile('|'.join(re.escape(t) for t in terms), re.IGNORECASE)
+        first = next((i for i, word in enumerate(words) if pattern.search(word)), 0)
+        start = max(first - SNIPPET_WORDS // 2, 0)
+        picked = ' '.join(words[start:start + SNIPPET_WORDS])
+        picked = pattern.sub(lambda m: f"{MATCH_START}{m.group(0)}{MATCH_END}", picked)
+        return ('… ' if start else '') + picked + (' …' if start + SNIPPET_WORDS < len(words) else '')
+
+    @contextmanager
+    def time_limit(self, milliseconds):
+        yield
+
+
+class SQLiteSearchBackend:
+    """
+    FTS5 with the porter stemmer. Every word must match; the last one also
+    matches as a prefix, so results show up while a word is being typed.
+    """
+    table = f'{SearchDocument._meta.db_table}_fts'
+
+    def match_expression(self, terms):
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, documents, query, limit, offset=0):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        try:
+            visible, visible_params = documents.values('id').query.sql_with_params()
+        except EmptyResultSet:
+            return []
+        sql = (
+            f"SELECT rowid, bm25({self.table}, 10.0, 1.0) AS rank, "
+            f"snippet({self.table}, 1, %s, %s, '…', %s) "
+            f"FROM {self.table} WHERE {self.table} MATCH %s AND rowid IN ({visible}) "
+            f"ORDER BY rank LIMIT %s OFFSET %s"
+        )
+        params = [MATCH_START, MATCH_END, SNIPPET_WORDS, self.match_expression(terms),
+                  *visible_params, limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        found = SearchDocument.objects.in_bulk([row[0] for row in rows])
+        # bm25 is lower for better matches; flip it so higher is better everywhere
+        return [(found[doc_id], -rank, snippet) for doc_id, rank, snippet in rows if doc_id in found]
+
+    @contextmanager
+    def time_limit(self, milliseconds):
+        connection.ensure_connection()
+        deadline = time.monotonic() + milliseconds / 1000
+        raw = connection.connection
+        # A non-zero return from the handler aborts the running statement
+        raw.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+        try:
+            yield
+        except OperationalError as e:
+            if 'interrupted' in str(e):
+                raise SearchTimeout() from e
+            raise
+        finally:
+            raw.set_progress_handler(None, 0)
+
+
+class PostgresSearchBackend:
+    """
+    websearch_to_tsquery accepts what people type into a search box: quoted
+    phrases, OR and -excluded words.
+    """
+    config = 'english'
+
+    def search(self, documents, query, limit, offset=0):
+        if not search_terms(query):
+            return []
+        # search_vector is a generated column the model doesn't declare (see migration 0031)
+        vector = RawSQL(f"{SearchDocument._meta.db_table}.search_vector", [], output_field=SearchVectorField())
+        tsquery = SearchQuery(query, config=self.config, search_type='websearch')
+        documents = (documents
+                     .alias(vector=vector)
+                     .filter(vector=tsquery)
+                     .annotate(rank=SearchRank(vector, tsquery, cover_density=True),
+                               snippet=SearchHeadline('body', tsquery, config=self.config,
+                                                      start_sel=MATCH_START, stop_sel=MATCH_END,
+                                                      max_words=SNIPPET_WORDS, min_words=SNIPPET_WORDS // 2,
+                                                      max_fragments=1))
+                     .order_by('-rank', 'id'))[offset:offset + limit]
+        return [(doc, doc.rank, doc.snippet) for doc in documents]
+
+    @contextmanager
+    def time_limit(self, milliseconds):
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    # Like SET LOCAL, but takes a bound parameter
+                    cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(int(milliseconds))])
+                yield
+        except OperationalError as e:
+            # psycopg reports a cancelled statement as QueryCanceled
+            if 'statement timeout' in str(e):
+                raise SearchTimeout() from e
+            raise
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresSearchBackend()
+        elif connection.vendor == 'sqlite' and SQLiteSearchBackend.table in connection.introspection.table_names():
+            _backend = SQLiteSearchBackend()
+        else:
+            _backend = SimpleSearchBackend()
+    return _backend
+
+
+def visible_documents(user):
+    """
+    The documents a user may find, matching what the list endpoints show them.
+    """
+    documents = SearchDocument.objects.all()
+    if user.role == 'admin':
+        return documents
+    if user.role == 'teacher':
+        return documents.filter(Q(owner=user) | Q(kind='subject', published=True, owner__role='admin'))
+    if user.role == 'student':
+        enrolled = Enrollment.objects.filter(student=user).values('subject_id')
+        return documents.filter(
+            Q(kind='subject', published=True)
+            | (~Q(kind='subject') & Q(published=True, subject_id__in=enrolled))
+        )
+    return documents.none()
+
+
+def search(user, query, limit, offset=0):
+    """
+    Ranked (document, rank, snippet) triples for the documents the user may see.
+    Snippets are HTML-escaped with matches wrapped in <mark>.
+    """
+    backend = get_backend()
+    with backend.time_limit(settings.SEARCH_TIMEOUT_MS):
+        hits = backend.search(visible_documents(user), query, limit, offset)
+    return [(doc, rank, format_snippet(snippet)) for doc, rank, snippet in hits]
+
+
+# --------- INDEXING ---------
+
+def subject_documents(ids):
+    for s in Subject.objects.filter(id__in=ids):
+        yield SearchDocument(kind='subject', object_id=s.id, subject_id=s.id, owner_id=s.created_by_id,
+                             published=s.published, title=s.name,
+                             body='\n\n'.join(filter(None, [s.description, s.content])))
+
+
+def lesson_documents(ids):
+    # Lessons have no published flag; enrolled students see all of them
+    for lesson in Lesson.objects.filter(id__in=ids):
+        yield SearchDocument(kind='lesson', object_id=lesson.id, subject_id=lesson.subject_id,
+                             owner_id=lesson.created_by_id, published=True, title=lesson.title, body=lesson.content)
+
+
+def quiz_documents(ids):
+    for quiz in Quiz.objects.filter(id__in=ids).prefetch_related('questions'):
+        body = '\n'.join([quiz.description or '', *(q.text for q in quiz.questions.all())]).strip()
+        yield SearchDocument(kind='quiz', object_id=quiz.id, subject_id=quiz.subject_id, owner_id=quiz.created_by_id,
+                             published=quiz.published, title=quiz.title, body=body)
+
+
+def assignment_documents(ids):
+    for a in Assignment.objects.filter(id__in=ids):
+        yield SearchDocument(kind='assignment', object_id=a.id, subject_id=a.subject_id, owner_id=a.created_by_id,
+                             published=a.published, title=a.title)
+
+
+BUILDERS = {
+    'subject': subject_documents,
+    'lesson': lesson_documents,
+    'quiz': quiz_documents,
+    'assignment': assignment_documents,
+}
+
+
+def index(kind, ids):
+    """
+    Write the documents for these rows of one kind, dropping documents of rows that no longer exist.
+    """
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        documents = list(BUILDERS[kind](batch))
+        SearchDocument.objects.bulk_create(
+            documents, update_conflicts=True, unique_fields=['kind', 'object_id'],
+            update_fields=['subject', 'owner', 'published', 'title', 'body', 'updated_at'],
+        )
+        found = {document.object_id for document in documents}
+        unindex(kind, [i for i in batch if i not in found])
+        autocomplete.refresh(kind, batch)
+
+
+def unindex(kind, ids):
+    if ids:
+        SearchDocument.objects.filter(kind=kind, object_id__in=ids).delete()
+        autocomplete.refresh(kind, ids)
+
+
+def rebuild():
+    """
+    Re-index everything. Returns the number of documents written.
+    """
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        for kind, model in (('subject', Subject), ('lesson', Lesson), ('quiz', Quiz), ('assignment', Assignment)):
+            index(kind, model.objects.values_list('id', flat=True).order_by('id'))
+        transaction.on_commit(autocomplete.build)
+    return SearchDocument.objects.count()
+
+
+KINDS = {Subject: 'subject', Lesson: 'lesson', Quiz: 'quiz', Assignment: 'assignment'}
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_save, sender=Lesson)
+@receiver(post_save, sender=Quiz)
+@receiver(post_save, sender=Assignment)
+def index_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index(KINDS[sender], [instance.pk])
+
+
+@receiver(post_delete, sender=Subject)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_delete, sender=Quiz)
+@receiver(post_delete, sender=Assignment)
+def index_deleted(sender, instance, origin=None, **kwargs):
+    if not cascaded(sender, origin):
+        unindex(KINDS[sender], [instance.pk])
+
+
+@receiver(pre_delete, sender=Subject)
+def unindex_subject_children(sender, instance, origin=None, **kwargs):
+    # The documents of the lessons, quizzes and assignments index_deleted skips because they go with this subject
+    documents = SearchDocument.objects.filter(subject=instance).exclude(kind='subject')
+    removed = defaultdict(list)
+    for kind, object_id in documents.values_list('kind', 'object_id'):
+        removed[kind].append(object_id)
+    documents.delete()
+    for kind, ids in removed.items():
+        autocomplete.refresh(kind, ids)
+
+
+@receiver(post_save, sender=QuizQuestion)
+@receiver(post_delete, sender=QuizQuestion)
+def index_question_quiz(sender, instance, raw=False, origin=None, **kwargs):
+    # Question text is part of its quiz's document, unless the quiz is going too
+    if not raw and not cascaded(sender, origin):
+        index('quiz', [instance.quiz_id])
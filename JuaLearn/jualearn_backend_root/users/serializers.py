@@ -1,15 +1,103 @@
 from rest_framework import serializers
-from .models import User, Assignment, Subject, Notification, Quiz, Enrollment, QuizResult, Lesson, QuizChoice, QuizQuestion, StudentAnswer
+from rest_framework.permissions import SAFE_METHODS
+from .models import User, Assignment, Subject, Notification, Quiz, Enrollment, QuizResult, Lesson, QuizChoice, QuizQuestion, StudentAnswer, NotificationJob
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .authentication import AUTH_VERSION_CLAIM
 from django.contrib.auth.password_validation import validate_password
 
-class UserSerializer(serializers.ModelSerializer):
+
+def parse_field_paths(value):
+    """
+    'id,subject.name,subject.id' -> {'id': {}, 'subject': {'name': {}, 'id': {}}}
+    """
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in filter(None, (part.strip() for part in path.split('.'))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+class SparseFieldsMixin:
+    """
+    Lets read requests choose what a serializer renders:
+
+    - ?fields=id,title,subject.name renders only these fields
+    - ?omit=content,student.email renders every field but these
+    - ?expand=subject renders a relation as a nested object instead of its
+      id, for the relations listed in Meta.expandable_fields
+
+    Dotted names reach into nested serializers and unknown names are ignored.
+    The eager-loading planner (users/querysets.py) plans from the fields left,
+    so a dropped relation is not joined and a dropped column is not loaded.
+    Writes always use every field.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.get_field_selection()
+        if selection is None:
+            return fields
+        only, omit, expand = selection
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name in expand:
+            if name in expandable and name in fields:
+                source = fields[name].source or name
+                # Named by string, as most serializers are defined further down this module
+                fields[name] = globals()[expandable[name]](
+                    read_only=True, **({'source': source} if source != name else {}))
+        if only is not None:
+            fields = {name: field for name, field in fields.items() if name in only}
+        for name, nested in omit.items():
+            if not nested:
+                fields.pop(name, None)
+
+        # Nested serializers get their part of the selection before their fields are built
+        for name, field in fields.items():
+            child = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(child, SparseFieldsMixin):
+                child._field_selection = ((only or {}).get(name) or None, omit.get(name, {}), expand.get(name, {}))
+        return fields
+
+    def get_field_selection(self):
+        """
+        (fields, omit, expand) as trees of names, or None to render every field.
+        """
+        if hasattr(self, '_field_selection'):
+            return self._field_selection
+        # Only the serializer at the top of the response reads the query string
+        parent = self.parent
+        if parent is not None and not (isinstance(parent, serializers.ListSerializer) and parent.parent is None):
+            return None
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        params = getattr(request, 'query_params', request.GET)
+        if not any(params.get(key) for key in ('fields', 'omit', 'expand')):
+            return None
+        return (parse_field_paths(params['fields']) if params.get('fields') else None,
+                parse_field_paths(params.get('omit', '')),
+                parse_field_paths(params.get('expand', '')))
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = [
             'id', 'username', 'email', 'role', 'first_name', 'last_name',
             'institution', 'years_of_experience', 'phone_number'
         ]
+
+
+class UserSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    What anyone may see of a user, e.g. when created_by is expanded.
+    """
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'first_name', 'last_name']
+
         
 class TeacherRegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
@@ -37,11 +125,12 @@ class TeacherRegisterSerializer(serializers.ModelSerializer):
         user.save()
         return user
 
-class SubjectSerializer(serializers.ModelSerializer):
+class SubjectSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Subject
         fields = ['id', 'name', 'description', 'created_by', 'published']
         read_only_fields = ['created_by']
+        expandable_fields = {'created_by': 'UserSummarySerializer'}
 
 
 class UserRegisterSerializer(serializers.ModelSerializer):
@@ -56,14 +145,16 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         user.save()
         return user
 
-class AssignmentSerializer(serializers.ModelSerializer):
+class AssignmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # The requesting student's own submission, annotated by the view
+    grade = serializers.IntegerField(read_only=True, allow_null=True)
+    submitted_at = serializers.DateTimeField(read_only=True, allow_null=True)
+
     class Meta:
         model = Assignment
-        fields = '__all__'
-        read_only_fields = ['created_by', 'grade']
-        extra_kwargs = {
-            'assigned_to': {'required': False, 'allow_null': True}
-        }
+        fields = ['id', 'title', 'subject', 'created_by', 'due_date', 'published', 'grade', 'submitted_at']
+        read_only_fields = ['created_by']
+        expandable_fields = {'subject': 'SubjectSerializer', 'created_by': 'UserSummarySerializer'}
 
     def validate(self, attrs):
         if not attrs.get('title'):
@@ -74,14 +165,16 @@ class AssignmentSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({"due_date": "This field is required."})
         return attrs
 
-class QuizSerializer(serializers.ModelSerializer):
+class QuizSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Quiz
-        fields = '__all__'
+        # The version counters are cache keys and source_hash is the importer's, not quiz content
+        exclude = ['content_version', 'results_version', 'source_hash']
         read_only_fields = ['created_by']
         extra_kwargs = {
             'assigned_to': {'required': False, 'allow_null': True}
         }
+        expandable_fields = {'subject': 'SubjectSerializer', 'created_by': 'UserSummarySerializer'}
 
 
     def validate(self, attrs):
@@ -100,6 +193,7 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         token['role'] = user.role
         token['firstName'] = user.first_name
         token['lastName'] = user.last_name
+        token[AUTH_VERSION_CLAIM] = user.auth_version
         return token
 
     def validate(self, attrs):
@@ -115,12 +209,30 @@ class UserProfileSerializer(serializers.ModelSerializer):
         fields = ['username', 'email', 'first_name', 'last_name', 'profile_picture']
         read_only_fields = ['role']
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    title = serializers.CharField(source='template.title', read_only=True)
+    message = serializers.CharField(source='template.message', read_only=True)
+    url = serializers.CharField(source='template.url', read_only=True)
+    type = serializers.CharField(source='template.type', read_only=True)
+
     class Meta:
         model = Notification
         fields = ['id', 'title', 'message', 'url', 'created_at', 'is_read', 'type']
 
-class QuizResultSerializer(serializers.ModelSerializer):
+class NotificationJobSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    title = serializers.CharField(source='template.title', read_only=True)
+    type = serializers.CharField(source='template.type', read_only=True)
+
+    class Meta:
+        model = NotificationJob
+        fields = [
+            'id', 'audience', 'subject', 'title', 'type', 'status',
+            'total', 'sent', 'attempts', 'error', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+        expandable_fields = {'subject': 'SubjectSerializer'}
+
+class QuizResultSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     quiz = serializers.StringRelatedField()
     quiz_id = serializers.PrimaryKeyRelatedField(queryset=Quiz.objects.all(), source='quiz', write_only=True)
 
@@ -129,7 +241,7 @@ class QuizResultSerializer(serializers.ModelSerializer):
         fields = ['id', 'student', 'quiz', 'quiz_id', 'grade', 'submitted_at']
         read_only_fields = ['id', 'student', 'quiz', 'submitted_at']
         
-class QuizResultSerializer(serializers.ModelSerializer):
+class QuizResultSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     student = serializers.StringRelatedField(read_only=True)
     quiz = serializers.StringRelatedField(read_only=True)
 
@@ -138,7 +250,7 @@ class QuizResultSerializer(serializers.ModelSerializer):
         fields = ['id', 'student', 'quiz', 'grade']
         read_only_fields = ['id', 'student', 'quiz', 'grade']
         
-class StudentSerializer(serializers.ModelSerializer):
+class StudentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     full_name = serializers.SerializerMethodField()
 
     class Meta:
@@ -148,7 +260,22 @@ class StudentSerializer(serializers.ModelSerializer):
     def get_full_name(self, obj):
         return f"{obj.first_name} {obj.last_name}"
 
-class EnrollmentSerializer(serializers.ModelSerializer):
+class AssignmentStudentSerializer(StudentSerializer):
+    """
+    An enrolled student with their submission of one assignment, if any.
+    """
+    submission_id = serializers.IntegerField(read_only=True, allow_null=True)
+    submitted_at = serializers.DateTimeField(read_only=True, allow_null=True)
+    grade = serializers.IntegerField(read_only=True, allow_null=True)
+
+    class Meta(StudentSerializer.Meta):
+        fields = StudentSerializer.Meta.fields + ['submission_id', 'submitted_at', 'grade']
+
+class AssignmentGradeSerializer(serializers.Serializer):
+    student = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role='student'))
+    grade = serializers.IntegerField(min_value=0, max_value=100)
+
+class EnrollmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     student = StudentSerializer(read_only=True)
     subject = SubjectSerializer(read_only=True)
     subject_id = serializers.PrimaryKeyRelatedField(
@@ -161,19 +288,41 @@ class EnrollmentSerializer(serializers.ModelSerializer):
         model = Enrollment
         fields = ['id', 'student', 'subject', 'subject_id', 'enrolled_at']
 
-class LessonSerializer(serializers.ModelSerializer):
+class LessonSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Lesson
         fields = ['id', 'subject', 'title', 'content', 'created_by', 'date_created']
         read_only_fields = ['created_by', 'date_created']
+        expandable_fields = {'subject': 'SubjectSerializer', 'created_by': 'UserSummarySerializer'}
+
+
+class LessonSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    What lesson lists show; the body is fetched per lesson.
+    """
+    size = serializers.IntegerField(source='content_size', read_only=True)
+    # Changes whenever the content does, so clients can keep bodies they already have.
+    # A plain field on content_hash, so the planner loads that column and not the content.
+    version = serializers.CharField(source='content_hash', read_only=True)
+
+    class Meta:
+        model = Lesson
+        fields = ['id', 'title', 'subject', 'size', 'version']
+        expandable_fields = {'subject': 'SubjectSerializer'}
+
+    def to_representation(self, lesson):
+        data = super().to_representation(lesson)
+        if 'version' in data:
+            data['version'] = data['version'][:16]
+        return data
         
 
-class QuizChoiceSerializer(serializers.ModelSerializer):
+class QuizChoiceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = QuizChoice
         fields = ['id', 'text', 'is_correct']
         
-class QuizQuestionSerializer(serializers.ModelSerializer):
+class QuizQuestionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     choices = QuizChoiceSerializer(many=True, read_only=True)
 
     class Meta:
@@ -1,10 +1,52 @@
 import pytest
+from datetime import date
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from rest_framework.test import APIClient
-from users.models import Subject  # Adjust path if needed
+from users.models import Subject, Enrollment, Quiz, QuizQuestion, QuizChoice  # Adjust path if needed
+from users.answer_keys import answer_key_cache
+from users.autocomplete import title_index
+from users.authentication import user_cache
 
 User = get_user_model()
 
+query_log_key = pytest.StashKey[list]()
+
+@pytest.fixture
+def query_log(request):
+    # Filled by test_query_budget.py and printed in the terminal summary
+    return request.config.stash.setdefault(query_log_key, [])
+
+def pytest_terminal_summary(terminalreporter, config):
+    rows = config.stash.get(query_log_key, [])
+    if not rows:
+        return
+    terminalreporter.section("query budget")
+    terminalreporter.write_line(f"{'endpoint':<50} {'status':>6} {'small':>5} {'large':>5} {'ms':>7} {'sql ms':>7}")
+    for label, status, small, large, elapsed, sql_time in sorted(rows, key=lambda r: (-r[3], -r[4]))[:20]:
+        terminalreporter.write_line(
+            f"{label:<50} {status:>6} {small:>5} {large:>5} {elapsed * 1000:>7.1f} {sql_time * 1000:>7.1f}"
+        )
+
+@pytest.fixture(autouse=True)
+def clear_answer_key_cache():
+    # Primary keys are reused between tests, so cached keys must not leak
+    answer_key_cache.clear()
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Same reason: cached analytics are keyed by primary key
+    cache.clear()
+
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    user_cache.clear()
+
+@pytest.fixture(autouse=True)
+def clear_title_index():
+    # Built from the database of whichever test used it first
+    title_index.clear()
+
 @pytest.fixture
 def teacher_user(db):
     return User.objects.create_user(
@@ -39,3 +81,52 @@ def admin_client(admin_user):
     client = APIClient()
     client.force_authenticate(user=admin_user)
     return client
+
+@pytest.fixture
+def student_client(student_user):
+    client = APIClient()
+    client.force_authenticate(user=student_user)
+    return client
+
+@pytest.fixture
+def enrolled_client(student_client, student_user, subject):
+    # student_client, with student_user enrolled in subject
+    Enrollment.objects.create(student=student_user, subject=subject)
+    return student_client
+
+@pytest.fixture
+def client_for(db):
+    """
+    client_for(username, *subjects): a client of a new student enrolled in these subjects.
+    """
+    def client_for(username, *subjects):
+        student = User.objects.create(username=username, role='student')
+        for subject in subjects:
+            Enrollment.objects.create(student=student, subject=subject)
+        client = APIClient()
+        client.force_authenticate(user=student)
+        return client
+    return client_for
+
+@pytest.fixture
+def quiz(teacher_user, subject):
+    quiz = Quiz.objects.create(title="Fractions", subject=subject, created_by=teacher_user,
+                               due_date=date(2030, 1, 1), published=True)
+    for text in ("1/2 + 1/2?", "1/3 of 9?"):
+        question = QuizQuestion.objects.create(quiz=quiz, text=text)
+        QuizChoice.objects.create(question=question, text="right", is_correct=True)
+        QuizChoice.objects.create(question=question, text="wrong", is_correct=False)
+    return quiz
+
+@pytest.fixture
+def answers_for():
+    """
+    answers_for(quiz, correct): answers getting the first `correct` questions right and the rest wrong.
+    """
+    def answers_for(quiz, correct):
+        answers = []
+        for i, question in enumerate(quiz.questions.order_by('id')):
+            choice = question.choices.get(is_correct=i < correct)
+            answers.append({'question_id': question.id, 'choice_id': choice.id})
+        return answers
+    return answers_for
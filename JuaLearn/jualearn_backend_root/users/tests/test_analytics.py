@@ -0,0 +1,145 @@
+import time
+import pytest
+from datetime import date
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users.analytics import compute_quiz_analytics, grade_statistics, subject_gradebook
+from users.models import (
+    User, Enrollment, Quiz, QuizResult, StudentAnswer, Assignment, AssignmentSubmission,
+)
+from users.utils import grade_quiz
+
+
+def make_students(subject, n, prefix='s'):
+    students = User.objects.bulk_create([
+        User(username=f"{prefix}{i}", role='student', first_name='Student', last_name=f"{i:05d}") for i in range(n)
+    ])
+    Enrollment.objects.bulk_create([Enrollment(student=s, subject=subject) for s in students])
+    return students
+
+
+def test_grade_statistics_from_a_histogram():
+    stats = grade_statistics({50: 1, 70: 2, 100: 1})
+    assert stats == {'average': 72.5, 'median': 70, 'min': 50, 'max': 100, 'std_dev': 17.85}
+    assert grade_statistics({40: 1, 60: 1})['median'] == 50
+    assert grade_statistics({})['average'] is None
+
+
+@pytest.mark.django_db
+def test_quiz_analytics(teacher_client, quiz, subject, answers_for):
+    alice, bob, carol, _ = make_students(subject, 4)
+    grade_quiz(alice, quiz, answers_for(quiz, 2))
+    grade_quiz(bob, quiz, answers_for(quiz, 1))
+    grade_quiz(carol, quiz, answers_for(quiz, 1))
+
+    response = teacher_client.get(reverse('quiz-analytics', kwargs={'pk': quiz.id}))
+    assert response.status_code == 200
+    data = response.data
+    assert (data['enrolled'], data['submissions']) == (4, 3)
+    assert (data['average'], data['median'], data['min'], data['max']) == (66.67, 50, 50, 100)
+    assert {b['range']: b['count'] for b in data['distribution']}['50-59'] == 2
+    assert data['distribution'][-1] == {'range': '90-100', 'count': 1}
+
+    hardest, easiest = data['questions']
+    assert hardest['text'] == "1/3 of 9?" and hardest['correct'] == 1 and hardest['answered'] == 3
+    assert hardest['correct_rate'] == 0.333
+    assert [(c['text'], c['selected']) for c in hardest['choices']] == [("right", 1), ("wrong", 2)]
+    assert easiest['correct_rate'] == 1.0
+
+
+@pytest.mark.django_db
+def test_resubmitting_replaces_the_counted_choices(teacher_client, quiz, subject, answers_for):
+    alice, bob = make_students(subject, 2)
+    grade_quiz(alice, quiz, answers_for(quiz, 2))
+    grade_quiz(alice, quiz, answers_for(quiz, 1))
+    grade_quiz(bob, quiz, answers_for(quiz, 2))
+
+    hardest = teacher_client.get(reverse('quiz-analytics', kwargs={'pk': quiz.id})).data['questions'][0]
+    # Alice's first pick of "right" no longer counts
+    assert hardest['answered'] == 2
+    assert [(c['text'], c['selected']) for c in hardest['choices']] == [("right", 1), ("wrong", 1)]
+    assert hardest['correct_rate'] == 0.5
+    assert StudentAnswer.objects.filter(student=alice).count() == 2
+
+
+@pytest.mark.django_db
+def test_quiz_analytics_are_cached_until_the_next_submission(
+        teacher_client, quiz, subject, django_assert_max_num_queries, answers_for):
+    alice, bob = make_students(subject, 2)
+    grade_quiz(alice, quiz, answers_for(quiz, 2))
+    url = reverse('quiz-analytics', kwargs={'pk': quiz.id})
+    first = teacher_client.get(url).data
+
+    # Loading the quiz, nothing else
+    with django_assert_max_num_queries(1):
+        assert teacher_client.get(url).data == first
+
+    grade_quiz(bob, quiz, answers_for(quiz, 0))
+    fresh = teacher_client.get(url).data
+    assert fresh['submissions'] == 2 and fresh['min'] == 0
+
+    QuizResult.objects.filter(student=bob).delete()
+    assert teacher_client.get(url).data['submissions'] == 1
+
+
+@pytest.mark.django_db
+def test_analytics_are_for_the_quiz_owner(quiz, student_user):
+    other = User.objects.create(username='teacher2', role='teacher')
+    client = APIClient()
+    client.force_authenticate(user=other)
+    assert client.get(reverse('quiz-analytics', kwargs={'pk': quiz.id})).status_code == 404
+    client.force_authenticate(user=student_user)
+    assert client.get(reverse('quiz-analytics', kwargs={'pk': quiz.id})).status_code in (403, 404)
+
+
+@pytest.mark.django_db
+def test_teachers_only_list_results_of_their_quizzes(teacher_client, quiz, subject):
+    other = User.objects.create(username='teacher2', role='teacher')
+    elsewhere = Quiz.objects.create(title="Other", subject=subject, created_by=other, due_date=date(2030, 1, 1))
+    student, = make_students(subject, 1)
+    QuizResult.objects.create(student=student, quiz=quiz, grade=80)
+    QuizResult.objects.create(student=student, quiz=elsewhere, grade=30)
+    response = teacher_client.get(reverse('quiz-results-list'))
+    assert [r['grade'] for r in response.data] == [80]
+
+
+@pytest.mark.django_db
+def test_gradebook(teacher_client, teacher_user, quiz, subject):
+    alice, bob = make_students(subject, 2)
+    other = User.objects.create(username='teacher2', role='teacher')
+    Quiz.objects.create(title="Not mine", subject=subject, created_by=other, due_date=date(2030, 1, 1))
+    essay = Assignment.objects.create(title="Essay", subject=subject, created_by=teacher_user, due_date=date(2030, 2, 1))
+    QuizResult.objects.create(student=alice, quiz=quiz, grade=80)
+    QuizResult.objects.create(student=bob, quiz=quiz, grade=60)
+    AssignmentSubmission.objects.create(assignment=essay, student=alice, grade=90)
+    AssignmentSubmission.objects.create(assignment=essay, student=bob)
+
+    response = teacher_client.get(reverse('subject-gradebook', kwargs={'pk': subject.id}))
+    assert response.status_code == 200
+    data = response.data
+    assert [(c['type'], c['title'], c['average']) for c in data['columns']] == [
+        ('quiz', "Fractions", 70), ('assignment', "Essay", 90),
+    ]
+    assert [(r['student']['username'], r['grades'], r['average']) for r in data['rows']] == [
+        ('s0', [80, 90], 85), ('s1', [60, None], 60),
+    ]
+
+
+@pytest.mark.django_db
+def test_class_of_5000_stays_under_a_second(quiz, subject, teacher_user):
+    students = make_students(subject, 5000)
+    choices = {q.id: list(q.choices.order_by('id')) for q in quiz.questions.all()}
+    StudentAnswer.objects.bulk_create([
+        StudentAnswer(student=s, question_id=question_id, selected_choice=options[i % 2])
+        for i, s in enumerate(students) for question_id, options in choices.items()
+    ], batch_size=5000)
+    QuizResult.objects.bulk_create([QuizResult(student=s, quiz=quiz, grade=i % 101) for i, s in enumerate(students)],
+                                   batch_size=5000)
+
+    started = time.perf_counter()
+    data = compute_quiz_analytics(quiz)
+    gradebook = subject_gradebook(subject, teacher=teacher_user)
+    elapsed = time.perf_counter() - started
+    assert data['submissions'] == 5000 and data['questions'][0]['answered'] == 5000
+    assert len(gradebook['rows']) == 5000
+    assert elapsed < 1.0
@@ -0,0 +1,109 @@
+import pytest
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users.authentication import bump_auth_version, user_cache
+from users.models import User, Subject
+
+
+def login(username, password='testpass123'):
+    response = APIClient().post(reverse('token_obtain_pair'), {'username': username, 'password': password})
+    assert response.status_code == 200
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+    return client
+
+
+@pytest.mark.django_db
+def test_reads_skip_the_user_lookup(teacher_user, django_assert_num_queries):
+    client = login('teacher1')
+    url = reverse('notifications-unread-count')
+    # The first read loads the user into the cache, later ones only run the view's own query
+    with django_assert_num_queries(2):
+        assert client.get(url).status_code == 200
+    with django_assert_num_queries(1):
+        assert client.get(url).data == {'unread_count': 0}
+
+
+@pytest.mark.django_db
+def test_token_user_works_like_the_database_user(teacher_user):
+    Subject.objects.create(name="Mine", created_by=teacher_user)
+    Subject.objects.create(name="Not mine", created_by=User.objects.create(username='t2', role='teacher'))
+    teacher_user.institution = "Uni"
+    teacher_user.save()
+    client = login('teacher1')
+
+    response = client.get(reverse('me'))
+    assert (response.data['id'], response.data['role'], response.data['institution']) == (teacher_user.id, 'teacher', "Uni")
+    assert [s['name'] for s in client.get(reverse('subject-list')).data] == ["Mine"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name', ['me', 'my-profile'])
+def test_profile_reads_load_the_user_once(teacher_user, name, django_assert_num_queries):
+    client = login('teacher1')
+    client.get(reverse(name))
+    # Only the full user row, not a query per deferred field
+    with django_assert_num_queries(1):
+        assert client.get(reverse(name)).status_code == 200
+
+
+@pytest.mark.django_db
+def test_profile_edits_show_up_on_the_next_read(teacher_user):
+    client = login('teacher1')
+    client.get(reverse('me'))
+    response = client.patch(reverse('my-profile'), {'first_name': "Ada"})
+    assert response.status_code == 200
+    assert client.get(reverse('me')).data['first_name'] == "Ada"
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('change', ['deactivate', 'role'])
+def test_deactivation_and_role_changes_refuse_existing_tokens(teacher_user, change):
+    client = login('teacher1')
+    assert client.get(reverse('me')).status_code == 200
+    if change == 'deactivate':
+        teacher_user.is_active = False
+    else:
+        teacher_user.role = 'student'
+    teacher_user.save()
+
+    assert client.get(reverse('me')).status_code == 401
+    assert client.post(reverse('subject-list'), {'name': "New"}).status_code == 401
+    if change == 'role':
+        assert login('teacher1').get(reverse('me')).data['role'] == 'student'
+
+
+@pytest.mark.django_db
+def test_other_workers_catch_up_within_the_ttl(teacher_user, monkeypatch):
+    client = login('teacher1')
+    assert client.get(reverse('me')).status_code == 200
+    # As if another worker had changed the user: this worker's cache still has the old version
+    User.objects.filter(pk=teacher_user.pk).update(auth_version=5)
+    user_cache.set(teacher_user.pk, user_cache.get(teacher_user.pk) | {'auth_version': 0})
+
+    assert client.get(reverse('me')).status_code == 200
+    # Writes always check the database
+    assert client.post(reverse('subject-list'), {'name': "New"}).status_code == 401
+    monkeypatch.setattr(user_cache, 'ttl', 0)
+    user_cache.discard(teacher_user.pk)
+    assert client.get(reverse('me')).status_code == 401
+
+
+@pytest.mark.django_db
+def test_bump_auth_version(teacher_user):
+    client = login('teacher1')
+    assert client.get(reverse('me')).status_code == 200
+    bump_auth_version(teacher_user.pk)
+    assert client.get(reverse('me')).status_code == 401
+    assert login('teacher1').get(reverse('me')).status_code == 200
+
+
+@pytest.mark.django_db
+def test_unrelated_saves_keep_tokens_valid(teacher_user):
+    client = login('teacher1')
+    user = User.objects.only('id').get(pk=teacher_user.pk)
+    user.role = 'teacher'
+    user.save()
+    teacher_user.refresh_from_db()
+    assert teacher_user.auth_version == 0
+    assert client.get(reverse('me')).status_code == 200
@@ -0,0 +1,106 @@
+import random
+import time
+import pytest
+from datetime import date
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from users.autocomplete import PrefixIndex, word_keys
+from users.models import User, Subject, Enrollment, Lesson, Quiz, SearchDocument
+
+
+def suggest_as(user, q, **params):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    response = client.get(reverse('search-autocomplete'), {'q': q, **params})
+    assert response.status_code == 200
+    return [(r['type'], r['title']) for r in response.data['results']]
+
+
+def test_every_word_starts_a_key():
+    assert word_keys("  Équations   du second degré ") == [
+        "equations du second degre", "du second degre", "second degre", "degre",
+    ]
+
+
+def test_lookup_over_100k_titles_stays_fast():
+    rng = random.Random(7)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9))) for _ in range(5000)]
+    index = PrefixIndex()
+    index.load({
+        'kind': 'lesson', 'object_id': i, 'title': ' '.join(rng.sample(words, 3)), 'subject_id': i % 500,
+        'owner_id': 1, 'owner__role': 'teacher', 'published': True, 'updated_at': None,
+    } for i in range(100_000))
+    student = User(id=2, role='student')
+    enrolled = set(range(0, 500, 5))
+
+    timings = []
+    for _ in range(2000):
+        prefix = rng.choice(words)[:rng.randint(1, 4)]
+        started = time.perf_counter()
+        found = index.lookup(prefix, student, enrolled, 8, 2000)
+        timings.append(time.perf_counter() - started)
+        assert all(e.subject_id in enrolled for e in found)
+        assert all(any(w.startswith(prefix) for w in e.title.split()) for e in found)
+    timings.sort()
+    # About a millisecond at p99 on a developer machine; the bound leaves room for slow CI machines
+    assert timings[int(len(timings) * 0.99)] < 0.02
+
+
+@pytest.mark.django_db
+def test_autocomplete_filters_by_role(teacher_user, student_user):
+    admin = User.objects.create(username='boss', role='admin')
+    algebra = Subject.objects.create(name="Algebra", created_by=admin, published=True)
+    drafts = Subject.objects.create(name="Algorithms", created_by=teacher_user, published=False)
+    Enrollment.objects.create(student=student_user, subject=algebra)
+    Lesson.objects.create(subject=algebra, title="Linear algebra basics", content="...", created_by=teacher_user)
+    Lesson.objects.create(subject=drafts, title="Sorting algorithms", content="...", created_by=teacher_user)
+    Quiz.objects.create(title="Algebra quiz", subject=algebra, created_by=teacher_user,
+                        due_date=date(2030, 1, 1), published=False)
+
+    # Titles starting with the prefix first, shortest first
+    assert suggest_as(admin, "alg") == [
+        ('Subject', "Algebra"), ('Subject', "Algorithms"), ('Quiz', "Algebra quiz"),
+        ('Lesson', "Sorting algorithms"), ('Lesson', "Linear algebra basics"),
+    ]
+    assert suggest_as(student_user, "alg") == [('Subject', "Algebra"), ('Lesson', "Linear algebra basics")]
+    assert suggest_as(teacher_user, "ALG", limit=3) == [
+        ('Subject', "Algebra"), ('Subject', "Algorithms"), ('Quiz', "Algebra quiz"),
+    ]
+    assert suggest_as(student_user, "") == []
+
+
+@pytest.mark.django_db
+def test_index_follows_committed_changes(teacher_user, django_capture_on_commit_callbacks):
+    subject = Subject.objects.create(name="Biology", created_by=teacher_user)
+    assert suggest_as(teacher_user, "cell") == []
+
+    with django_capture_on_commit_callbacks(execute=True):
+        lesson = Lesson.objects.create(subject=subject, title="Cell structure", content="...", created_by=teacher_user)
+    assert suggest_as(teacher_user, "cell") == [('Lesson', "Cell structure")]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        lesson.title = "Membranes"
+        lesson.save()
+    assert suggest_as(teacher_user, "cell") == []
+    assert suggest_as(teacher_user, "memb") == [('Lesson', "Membranes")]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        lesson.delete()
+    assert suggest_as(teacher_user, "memb") == []
+
+
+@pytest.mark.django_db
+def test_index_polls_for_other_workers_changes(teacher_user, settings):
+    subject = Subject.objects.create(name="Biology", created_by=teacher_user)
+    assert suggest_as(teacher_user, "bio") == [('Subject', "Biology")]
+
+    # Written by another process: no on-commit hook runs here
+    SearchDocument.objects.filter(kind='subject', object_id=subject.id).update(title="Botany", updated_at=timezone.now())
+    assert suggest_as(teacher_user, "bot") == []
+    settings.AUTOCOMPLETE_REFRESH_SECONDS = 0
+    assert suggest_as(teacher_user, "bot") == [('Subject', "Botany")]
+
+    SearchDocument.objects.filter(kind='subject', object_id=subject.id).delete()
+    settings.AUTOCOMPLETE_REBUILD_SECONDS = 0
+    assert suggest_as(teacher_user, "bot") == []
@@ -0,0 +1,98 @@
+import gzip
+import json
+import pytest
+from datetime import date
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users import bundles
+from users.answer_keys import bump_quiz_version
+from users.models import User, Lesson, Quiz, QuizQuestion, QuizChoice
+
+
+@pytest.fixture
+def course(subject, teacher_user):
+    subject.published = True
+    subject.save()
+    algebra = Lesson.objects.create(subject=subject, title="Algebra", content="# x + 1", created_by=teacher_user)
+    geometry = Lesson.objects.create(subject=subject, title="Geometry", content="*Angles*", created_by=teacher_user)
+    quiz = Quiz.objects.create(title="Quiz 1", subject=subject, created_by=teacher_user,
+                               due_date=date(2030, 1, 1), published=True)
+    question = QuizQuestion.objects.create(quiz=quiz, text="1 + 1?")
+    QuizChoice.objects.create(question=question, text="2", is_correct=True)
+    QuizChoice.objects.create(question=question, text="3")
+    Quiz.objects.create(title="Draft", subject=subject, created_by=teacher_user, due_date=date(2030, 1, 1))
+    return {'subject': subject, 'algebra': algebra, 'geometry': geometry, 'quiz': quiz, 'question': question}
+
+
+def fetch(client, subject, since=None, **headers):
+    url = reverse('subject-bundle', args=[subject.id])
+    return client.get(url, {'since': since} if since is not None else {}, **headers)
+
+
+@pytest.mark.django_db
+def test_bundle_holds_lessons_and_published_quizzes_without_answers(enrolled_client, course):
+    response = fetch(enrolled_client, course['subject'], HTTP_ACCEPT_ENCODING='gzip')
+    assert response.status_code == 200
+    assert response['Content-Encoding'] == 'gzip'
+    data = json.loads(gzip.decompress(response.content))
+
+    quiz_key = f"quiz:{course['quiz'].id}"
+    assert data['version'] == 1 and data['base'] is None and data['removed'] == []
+    assert set(data['entries']) == {'subject', f"lesson:{course['algebra'].id}", f"lesson:{course['geometry'].id}", quiz_key}
+    assert data['entries'][f"lesson:{course['algebra'].id}"]['html'] == "<h1>x + 1</h1>"
+    assert data['entries'][quiz_key]['questions'][0]['choices'] == [
+        {'id': c.id, 'text': c.text} for c in course['question'].choices.order_by('id')
+    ]
+    assert 'is_correct' not in json.dumps(data)
+    assert data['manifest'] == {key: bundles.content_hash(value) for key, value in data['entries'].items()}
+
+
+@pytest.mark.django_db
+def test_delta_carries_only_what_changed(enrolled_client, teacher_client, course, monkeypatch):
+    subject = course['subject']
+    first = json.loads(fetch(enrolled_client, subject).content)
+
+    rendered = []
+    monkeypatch.setattr(bundles, 'render_markdown', lambda text: rendered.append(text) or text)
+    teacher_client.patch(reverse('lesson-detail', args=[course['algebra'].id]), {'content': "# y"})
+    teacher_client.delete(reverse('lesson-detail', args=[course['geometry'].id]))
+    QuizChoice.objects.create(question=course['question'], text="4")
+    bump_quiz_version(course['quiz'].id)
+
+    data = json.loads(fetch(enrolled_client, subject, since=first['version']).content)
+    # Only the edited lesson was rendered again
+    assert rendered == ["# y"]
+    assert data['base'] == first['version'] and data['version'] == first['version'] + 1
+    assert set(data['entries']) == {f"lesson:{course['algebra'].id}", f"quiz:{course['quiz'].id}"}
+    assert data['removed'] == [f"lesson:{course['geometry'].id}"]
+
+    # Up to date: nothing to download, and the same request again is a 304
+    response = fetch(enrolled_client, subject, since=data['version'])
+    assert json.loads(response.content)['entries'] == {}
+    again = fetch(enrolled_client, subject, since=data['version'], HTTP_IF_NONE_MATCH=response['ETag'])
+    assert again.status_code == 304
+
+
+@pytest.mark.django_db
+def test_unchanged_content_keeps_its_version(enrolled_client, course):
+    subject = course['subject']
+    fetch(enrolled_client, subject)
+    # An edit to a draft quiz bumps the catalog but not the bundle
+    subject.catalog_version += 1
+    subject.save()
+    data = json.loads(fetch(enrolled_client, subject).content)
+    assert data['version'] == 1
+
+
+@pytest.mark.django_db
+def test_unknown_versions_get_the_whole_bundle(enrolled_client, course):
+    data = json.loads(fetch(enrolled_client, course['subject'], since=99).content)
+    assert data['base'] is None and len(data['entries']) == 4
+    assert fetch(enrolled_client, course['subject'], since='x').status_code == 400
+
+
+@pytest.mark.django_db
+def test_only_enrolled_students_get_the_bundle(course):
+    client = APIClient()
+    client.force_authenticate(user=User.objects.create(username='bob', role='student'))
+    assert fetch(client, course['subject']).status_code == 403
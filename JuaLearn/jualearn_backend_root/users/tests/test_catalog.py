@@ -0,0 +1,141 @@
+import json
+import pytest
+from datetime import date
+from django.urls import reverse
+from users.importer import import_content
+from users.models import User, Subject, Enrollment, Lesson, Quiz
+
+
+@pytest.fixture
+def published(subject):
+    subject.published = True
+    subject.save()
+    return subject
+
+
+@pytest.mark.django_db
+def test_subject_list_is_cached_with_an_etag(teacher_client, teacher_user, published, django_assert_num_queries, client_for):
+    alice, bob = client_for('alice'), client_for('bob')
+    url = reverse('subject-list')
+    first = alice.get(url)
+    assert first.status_code == 200
+    etag = first['ETag']
+    assert first['Cache-Control'] == 'private, no-cache'
+
+    # Another student reuses the same entry: only the version check runs
+    with django_assert_num_queries(1):
+        second = bob.get(url)
+    assert (second['ETag'], second.content) == (etag, first.content)
+
+    not_modified = bob.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert not_modified.status_code == 304 and not_modified.content == b''
+    assert bob.get(url, HTTP_IF_NONE_MATCH=f'"other", W/{etag}').status_code == 304
+
+    draft = Subject.objects.create(name="Draft", created_by=teacher_user)
+    assert bob.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    teacher_client.post(reverse('subject-publish', kwargs={'pk': draft.id}))
+    fresh = bob.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert fresh.status_code == 200 and fresh['ETag'] != etag
+    assert sorted(s['name'] for s in json.loads(fresh.content)) == sorted([published.name, "Draft"])
+
+    teacher_client.patch(reverse('subject-detail', kwargs={'pk': draft.id}), {'description': "New"})
+    assert bob.get(url, HTTP_IF_NONE_MATCH=fresh['ETag']).status_code == 200
+
+
+@pytest.mark.django_db
+def test_swapping_published_subjects_retires_the_subject_list(teacher_client, teacher_user, client_for):
+    hidden = Subject.objects.create(name="Hidden", created_by=teacher_user, catalog_version=1)
+    shown = Subject.objects.create(name="Shown", created_by=teacher_user, published=True, catalog_version=2)
+    Subject.objects.create(name="Last", created_by=teacher_user, published=True)
+    alice = client_for('alice')
+    url = reverse('subject-list')
+    assert sorted(s['name'] for s in json.loads(alice.get(url).content)) == ["Last", "Shown"]
+
+    # Both bumps leave the count, highest id and summed versions of published subjects as they were
+    teacher_client.patch(reverse('subject-detail', kwargs={'pk': shown.id}), {'published': False})
+    teacher_client.patch(reverse('subject-detail', kwargs={'pk': hidden.id}), {'published': True})
+    assert sorted(s['name'] for s in json.loads(alice.get(url).content)) == ["Hidden", "Last"]
+
+
+@pytest.mark.django_db
+def test_expanded_lists_are_not_cached(teacher_user, published, client_for):
+    alice = client_for('alice')
+    url = reverse('subject-list') + '?expand=created_by'
+    assert json.loads(alice.get(url).content)[0]['created_by']['first_name'] == ""
+
+    # A profile edit bumps no catalog_version
+    teacher_user.first_name = "Grace"
+    teacher_user.save()
+    assert json.loads(alice.get(url).content)[0]['created_by']['first_name'] == "Grace"
+
+
+@pytest.mark.django_db
+def test_lesson_list_follows_lesson_writes_and_enrollments(teacher_client, teacher_user, published, client_for):
+    other = Subject.objects.create(name="Other", created_by=teacher_user, published=True)
+    alice = client_for('alice', published)
+    url = reverse('lesson-list')
+    assert json.loads(alice.get(url).content) == []
+
+    response = teacher_client.post(reverse('lesson-list'), {'subject': published.id, 'title': "Intro", 'content': "Hi"})
+    lesson_id = response.data['id']
+    first = alice.get(url)
+    assert [lesson['title'] for lesson in json.loads(first.content)] == ["Intro"]
+
+    teacher_client.patch(reverse('lesson-detail', kwargs={'pk': lesson_id}), {'title': "Welcome"})
+    assert [lesson['title'] for lesson in json.loads(alice.get(url).content)] == ["Welcome"]
+
+    # Moving a lesson away retires the lists of both subjects
+    teacher_client.patch(reverse('lesson-detail', kwargs={'pk': lesson_id}), {'subject': other.id})
+    assert json.loads(alice.get(url).content) == []
+    bob = client_for('bob', other)
+    assert [lesson['title'] for lesson in json.loads(bob.get(url).content)] == ["Welcome"]
+
+    Enrollment.objects.create(student=User.objects.get(username='alice'), subject=other)
+    assert [lesson['title'] for lesson in json.loads(alice.get(url).content)] == ["Welcome"]
+
+    teacher_client.delete(reverse('lesson-detail', kwargs={'pk': lesson_id}))
+    assert json.loads(alice.get(url).content) == []
+
+
+@pytest.mark.django_db
+def test_quiz_lists_follow_publishing(teacher_client, published, client_for):
+    alice = client_for('alice', published)
+    response = teacher_client.post(reverse('quiz-list'), {"title": "Quiz", "subject": published.id, "due_date": "2030-01-31"})
+    quiz_id = response.data['id']
+    assert json.loads(alice.get(reverse('quiz-list')).content) == []
+    assert [q['id'] for q in json.loads(alice.get(reverse('student-quizzes-list')).content)] == [quiz_id]
+
+    teacher_client.post(reverse('quiz-publish', kwargs={'pk': quiz_id}))
+    assert [q['id'] for q in json.loads(alice.get(reverse('quiz-list')).content)] == [quiz_id]
+
+    teacher_client.delete(reverse('quiz-detail', kwargs={'pk': quiz_id}))
+    assert json.loads(alice.get(reverse('quiz-list')).content) == []
+
+
+@pytest.mark.django_db
+def test_submissions_do_not_change_the_quiz_list(published, teacher_user, client_for):
+    quiz = Quiz.objects.create(title="Quiz", subject=published, created_by=teacher_user,
+                               due_date=date(2030, 1, 1), published=True)
+    alice = client_for('alice', published)
+    etag = alice.get(reverse('quiz-list'))['ETag']
+    Quiz.objects.filter(pk=quiz.pk).update(results_version=5, content_version=3)
+    assert alice.get(reverse('quiz-list'), HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+
+@pytest.mark.django_db
+def test_only_students_are_served_from_the_cache(teacher_client, published):
+    response = teacher_client.get(reverse('subject-list'))
+    assert response.status_code == 200 and 'ETag' not in response
+
+
+@pytest.mark.django_db
+def test_import_retires_cached_lists(tmp_path, admin_user, published, client_for):
+    alice = client_for('alice', published)
+    etag = alice.get(reverse('lesson-list'))['ETag']
+    (tmp_path / 'subjects.json').write_text(json.dumps([{"name": published.name}]))
+    (tmp_path / 'quizzes.json').write_text('[]')
+    (tmp_path / 'lessons.json').write_text(json.dumps([{"subjectName": published.name, "title": "Imported", "content": "x"}]))
+    import_content(str(tmp_path), admin_user)
+    response = alice.get(reverse('lesson-list'), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert [lesson['title'] for lesson in json.loads(response.content)] == ["Imported"]
@@ -0,0 +1,143 @@
+import pytest
+from datetime import date
+from django.db import transaction
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users import changes
+from users.models import User, Enrollment, Lesson, Quiz, QuizResult, ChangeEvent
+from users.notifications import mark_all_read, notify
+
+
+@pytest.fixture
+def student(subject):
+    subject.published = True
+    subject.save()
+    student = User.objects.create(username='alice', role='student')
+    Enrollment.objects.create(student=student, subject=subject)
+    return student
+
+
+def keyed(page):
+    return {(c['kind'], c['id']): c for c in page['changes']}
+
+
+@pytest.mark.django_db
+def test_feed_is_compacted_with_tombstones(student, subject, teacher_user):
+    lesson = Lesson.objects.create(subject=subject, title="Draft", content="x", created_by=teacher_user)
+    lesson.title = "Algebra"
+    lesson.save()
+    gone = Lesson.objects.create(subject=subject, title="Gone", content="x", created_by=teacher_user).id
+    Lesson.objects.filter(pk=gone).delete()
+
+    page = changes.feed(student, 0)
+    entries = keyed(page)
+    assert len(page['changes']) == len(entries)
+    assert entries[('lesson', lesson.id)]['data']['title'] == "Algebra"
+    assert entries[('lesson', gone)] == {'kind': 'lesson', 'id': gone, 'deleted': True, 'data': None}
+    assert entries[('subject', subject.id)]['data']['name'] == "Mathematics"
+    assert ('enrollment', Enrollment.objects.get().id) in entries
+    assert not page['has_more']
+
+    # Only what changed since the cursor
+    Lesson.objects.filter(pk=lesson.pk).first().save()
+    page = changes.feed(student, page['cursor'])
+    assert [(c['kind'], c['id']) for c in page['changes']] == [('lesson', lesson.id)]
+    assert changes.feed(student, page['cursor'])['changes'] == []
+
+
+@pytest.mark.django_db
+def test_feed_only_shows_what_the_caller_can_see(student, subject, teacher_user):
+    other = User.objects.create(username='bob', role='student')
+    quiz = Quiz.objects.create(title="Quiz", subject=subject, created_by=teacher_user,
+                               due_date=date(2030, 1, 1), published=True)
+    notify(other, "Not for alice")
+    notify(student, "For alice")
+    entries = keyed(changes.feed(student, 0))
+    assert entries[('quiz', quiz.id)]['data']['title'] == "Quiz"
+    assert [c['data']['title'] for c in entries.values() if c['kind'] == 'notification'] == ["For alice"]
+    cursor = changes.feed(student, 0)['cursor']
+
+    # Unpublishing turns the quiz into a tombstone for students, not for its teacher
+    quiz.published = False
+    quiz.save()
+    assert keyed(changes.feed(student, cursor))[('quiz', quiz.id)]['deleted']
+    assert not keyed(changes.feed(teacher_user, cursor))[('quiz', quiz.id)]['deleted']
+
+    mark_all_read(student)
+    assert [c['data']['is_read'] for c in changes.feed(student, cursor)['changes'] if c['kind'] == 'notification'] == [True]
+
+
+@pytest.mark.django_db
+def test_enrollment_changes_ask_for_a_resync(student, subject, teacher_user):
+    for i in range(5):
+        Lesson.objects.create(subject=subject, title=f"L{i}", content="x", created_by=teacher_user)
+    cursor = changes.feed(student, 0)['cursor']
+
+    Enrollment.objects.filter(student=student).first().delete()
+    page = changes.feed(student, cursor, limit=1)
+    assert page['resync'] == [subject.id]
+    assert [c['kind'] for c in page['changes']] == ['enrollment']
+
+    Enrollment.objects.create(student=student, subject=subject)
+    page = changes.feed(student, page['cursor'], limit=1)
+    assert page['resync'] == [subject.id]
+    assert len(page['changes']) == 1
+    assert changes.feed(student, page['cursor'])['resync'] == []
+
+
+@pytest.mark.django_db
+def test_events_roll_back_with_their_write(subject, teacher_user):
+    cursor = ChangeEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    with pytest.raises(RuntimeError), transaction.atomic():
+        Lesson.objects.create(subject=subject, title="Draft", content="x", created_by=teacher_user)
+        assert ChangeEvent.objects.filter(id__gt=cursor, kind='lesson').exists()
+        raise RuntimeError()
+    assert not ChangeEvent.objects.filter(id__gt=cursor).exists()
+
+
+@pytest.mark.django_db
+def test_rows_deleted_with_their_subject_get_tombstones(student, subject, teacher_user):
+    lesson = Lesson.objects.create(subject=subject, title="Algebra", content="x", created_by=teacher_user)
+    quiz = Quiz.objects.create(title="Quiz", subject=subject, created_by=teacher_user,
+                               due_date=date(2030, 1, 1), published=True)
+    result = QuizResult.objects.create(student=student, quiz=quiz, grade=80)
+    enrollment, subject_id = Enrollment.objects.get(), subject.id
+    cursor = ChangeEvent.objects.order_by('-id').values_list('id', flat=True).first()
+
+    subject.delete()
+    assert set(ChangeEvent.objects.filter(id__gt=cursor, deleted=True).values_list('kind', 'object_id')) == {
+        ('subject', subject_id), ('lesson', lesson.id), ('quiz', quiz.id), ('quiz_result', result.id),
+        ('enrollment', enrollment.id),
+    }
+
+
+@pytest.mark.django_db
+def test_pages_and_compaction_keep_the_same_result(student, subject, teacher_user):
+    for i in range(5):
+        lesson = Lesson.objects.create(subject=subject, title=f"L{i}", content="x", created_by=teacher_user)
+        lesson.save()
+    everything = keyed(changes.feed(student, 0))
+
+    paged, cursor, pages = {}, 0, 0
+    while True:
+        page = changes.feed(student, cursor, limit=2)
+        paged.update(keyed(page))
+        cursor, pages = page['cursor'], pages + 1
+        if not page['has_more']:
+            break
+    assert paged == everything and pages > 2
+
+    # Each lesson's create, and the subject's, before it was published
+    assert changes.compact() == 6
+    assert keyed(changes.feed(student, 0)) == everything
+    assert ChangeEvent.objects.filter(kind='lesson').count() == 5
+
+
+@pytest.mark.django_db
+def test_sync_endpoint(student):
+    client = APIClient()
+    client.force_authenticate(user=student)
+    response = client.get(reverse('sync'), {'cursor': 0, 'limit': 50})
+    assert response.status_code == 200
+    assert {'cursor', 'has_more', 'changes'} <= set(response.data)
+    assert client.get(reverse('sync'), {'cursor': 'x'}).status_code == 400
@@ -0,0 +1,118 @@
+import pytest
+from datetime import date, timedelta
+from django.urls import reverse
+from django.utils import timezone
+from users import dashboard
+from users.models import Enrollment, Quiz, QuizResult, Assignment, AssignmentSubmission, DashboardSnapshot
+from users.notifications import notify
+
+
+@pytest.fixture
+def enrolled(student_user, subject):
+    Enrollment.objects.create(student=student_user, subject=subject)
+    soon = timezone.localdate() + timedelta(days=3)
+    quiz = Quiz.objects.create(title="Fractions quiz", subject=subject, created_by=subject.created_by,
+                               due_date=soon, published=True)
+    assignment = Assignment.objects.create(title="Fractions homework", subject=subject, created_by=subject.created_by,
+                                           due_date=soon + timedelta(days=1), published=True)
+    return quiz, assignment
+
+
+def stale_sections(student):
+    snapshot = DashboardSnapshot.objects.get(student=student)
+    return {section for section in dashboard.SECTIONS if getattr(snapshot, f'{section}_stale')}
+
+
+@pytest.mark.django_db
+def test_dashboard_is_built_once_and_then_served_from_the_snapshot(
+        student_client, student_user, subject, enrolled, django_assert_max_num_queries):
+    quiz, assignment = enrolled
+    notify(student_user, "Welcome")
+    student_user.refresh_from_db()
+
+    with django_assert_max_num_queries(5):
+        response = student_client.get(reverse('student-dashboard'))
+    assert response.status_code == 200
+    assert response.data['subjects'] == [{'id': subject.id, 'name': subject.name}]
+    assert [(i['type'], i['id']) for i in response.data['upcoming']] == [('quiz', quiz.id), ('assignment', assignment.id)]
+    assert response.data['upcoming'][0]['subject_name'] == subject.name
+    assert response.data['recent_grades'] == []
+    assert response.data['unread_notifications'] == 1
+    assert stale_sections(student_user) == set()
+
+    with django_assert_max_num_queries(1):
+        again = student_client.get(reverse('student-dashboard'))
+    assert again.data == response.data
+
+
+@pytest.mark.django_db
+def test_changes_only_rebuild_the_sections_they_affect(student_client, student_user, subject, enrolled):
+    quiz, assignment = enrolled
+    url = reverse('student-dashboard')
+    student_client.get(url)
+
+    QuizResult.objects.create(student=student_user, quiz=quiz, grade=90)
+    assert stale_sections(student_user) == {'upcoming', 'recent_grades'}
+    data = student_client.get(url).data
+    assert [(i['type'], i['id']) for i in data['upcoming']] == [('assignment', assignment.id)]
+    assert [(g['type'], g['id'], g['grade']) for g in data['recent_grades']] == [('quiz', quiz.id, 90)]
+
+    AssignmentSubmission.objects.create(assignment=assignment, student=student_user, grade=75,
+                                        submitted_at=timezone.now(), graded_at=timezone.now())
+    data = student_client.get(url).data
+    assert data['upcoming'] == []
+    assert [(g['type'], g['grade']) for g in data['recent_grades']] == [('assignment', 75), ('quiz', 90)]
+
+    subject.name = "Maths"
+    subject.save()
+    assert stale_sections(student_user) == {'subjects', 'upcoming'}
+    assert student_client.get(url).data['subjects'] == [{'id': subject.id, 'name': "Maths"}]
+
+    # Drafts don't touch anyone's dashboard until they are published
+    draft = Quiz.objects.create(title="Draft", subject=subject, created_by=subject.created_by,
+                                due_date=date(2030, 1, 1))
+    assert stale_sections(student_user) == set()
+    draft.published = True
+    draft.save()
+    assert [i['title'] for i in student_client.get(url).data['upcoming']] == ["Draft"]
+
+    Enrollment.objects.filter(student=student_user).delete()
+    data = student_client.get(url).data
+    assert data['subjects'] == [] and data['upcoming'] == []
+
+
+@pytest.mark.django_db
+def test_upcoming_items_expire_overnight(student_client, student_user, enrolled):
+    quiz, _ = enrolled
+    student_client.get(reverse('student-dashboard'))
+    # Built yesterday, and the quiz was due yesterday: nothing flagged it stale
+    DashboardSnapshot.objects.filter(student=student_user).update(built_on=timezone.localdate() - timedelta(days=1))
+    Quiz.objects.filter(pk=quiz.pk).update(due_date=timezone.localdate() - timedelta(days=1))
+
+    data = student_client.get(reverse('student-dashboard')).data
+    assert quiz.id not in [i['id'] for i in data['upcoming'] if i['type'] == 'quiz']
+
+
+@pytest.mark.django_db
+def test_rebuild_is_not_saved_over_a_newer_invalidation(student_user, enrolled, monkeypatch):
+    quiz, _ = enrolled
+    dashboard.get_dashboard(student_user)
+    dashboard.mark_students_stale([student_user.id], 'recent_grades')
+
+    build = dashboard.build_recent_grades
+
+    def build_while_graded(student):
+        rows = build(student)
+        QuizResult.objects.create(student=student, quiz=quiz, grade=60)
+        return rows
+
+    monkeypatch.setattr(dashboard, 'build_recent_grades', build_while_graded)
+    assert dashboard.get_dashboard(student_user)['recent_grades'] == []
+    assert 'recent_grades' in stale_sections(student_user)
+    monkeypatch.undo()
+    assert [g['grade'] for g in dashboard.get_dashboard(student_user)['recent_grades']] == [60]
+
+
+@pytest.mark.django_db
+def test_only_students_have_a_dashboard(teacher_client):
+    assert teacher_client.get(reverse('student-dashboard')).status_code == 403
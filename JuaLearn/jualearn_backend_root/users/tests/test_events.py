@@ -0,0 +1,134 @@
+import asyncio
+import pytest
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+from users.authentication import bump_auth_version
+from users import events
+from users.events import DatabasePollingBackend, NotificationHub, notification_stream
+from users.models import User
+from users.notifications import notify
+
+def stream_scope(token=None, last_event_id=None):
+    headers = []
+    if last_event_id is not None:
+        headers.append((b'last-event-id', str(last_event_id).encode()))
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': '/api/notifications/stream/',
+        'query_string': f'token={token}'.encode() if token else b'',
+        'headers': headers,
+    }
+
+async def read_until(communicator, text, timeout=3):
+    body = b''
+    while text.encode() not in body:
+        message = await communicator.receive_output(timeout)
+        body += message.get('body', b'')
+    return body.decode()
+
+@pytest.fixture
+def stream_settings(settings):
+    settings.NOTIFICATION_STREAM_POLL_INTERVAL = 0.05
+    settings.NOTIFICATION_STREAM_HEARTBEAT = 0.2
+    return settings
+
+@pytest.mark.django_db(transaction=True)
+def test_stream_rejects_missing_token(stream_settings):
+    async def run():
+        communicator = ApplicationCommunicator(notification_stream, stream_scope())
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(3)
+        assert start['status'] == 401
+    asyncio.run(run())
+
+@pytest.mark.django_db(transaction=True)
+def test_stream_refuses_outdated_tokens(stream_settings):
+    student = User.objects.create_user(username='streamer', password='testpass123', role='student')
+    token = str(AccessToken.for_user(student))
+
+    async def run():
+        communicator = ApplicationCommunicator(notification_stream, stream_scope(token))
+        await communicator.send_input({'type': 'http.request'})
+        assert (await communicator.receive_output(3))['status'] == 200
+        await read_until(communicator, ": heartbeat")
+
+        # Deactivating or changing a role bumps auth_version: the open stream ends, reconnecting is refused
+        await sync_to_async(bump_auth_version)(student.pk)
+        while (await communicator.receive_output(3)).get('more_body', False):
+            pass
+        await communicator.wait(1)
+
+        communicator = ApplicationCommunicator(notification_stream, stream_scope(token))
+        await communicator.send_input({'type': 'http.request'})
+        assert (await communicator.receive_output(3))['status'] == 401
+    asyncio.run(run())
+
+@pytest.mark.django_db(transaction=True)
+def test_stream_replays_pushes_and_heartbeats(stream_settings):
+    student = User.objects.create_user(username='streamer', password='testpass123', role='student')
+    other = User.objects.create_user(username='other', password='testpass123', role='student')
+    seen = notify(student, "Already seen")
+    notify(student, "Missed while offline")
+    token = str(AccessToken.for_user(student))
+
+    async def run():
+        communicator = ApplicationCommunicator(notification_stream, stream_scope(token, last_event_id=seen.id))
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(3)
+        assert start['status'] == 200
+        assert (b'content-type', b'text/event-stream') in start['headers']
+
+        body = await read_until(communicator, "Missed while offline")
+        assert "Already seen" not in body
+
+        await sync_to_async(notify)(other, "Not for you")
+        live = await sync_to_async(notify)(student, "Live update")
+        body = await read_until(communicator, "Live update")
+        assert f"id: {live.id}" in body
+        assert "Not for you" not in body
+
+        body = await read_until(communicator, ": heartbeat")
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+    asyncio.run(run())
+
+@pytest.mark.django_db(transaction=True)
+def test_stream_replays_everything_missed_in_pages(stream_settings):
+    stream_settings.NOTIFICATION_STREAM_REPLAY_LIMIT = 2
+    student = User.objects.create_user(username='streamer', password='testpass123', role='student')
+    seen = notify(student, "Already seen")
+    for i in range(5):
+        notify(student, f"Missed {i}")
+    token = str(AccessToken.for_user(student))
+
+    async def run():
+        communicator = ApplicationCommunicator(notification_stream, stream_scope(token, last_event_id=seen.id))
+        await communicator.send_input({'type': 'http.request'})
+        assert (await communicator.receive_output(3))['status'] == 200
+        body = await read_until(communicator, "Missed 4")
+        assert all(f"Missed {i}" in body for i in range(5))
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+    asyncio.run(run())
+
+@pytest.mark.django_db(transaction=True)
+def test_poller_pages_through_users_and_notifications(stream_settings, monkeypatch):
+    stream_settings.NOTIFICATION_STREAM_BATCH_SIZE = 2
+    monkeypatch.setattr(events, 'USER_CHUNK_SIZE', 2)
+    students = [User.objects.create_user(username=f'pupil{i}', password='x', role='student') for i in range(5)]
+
+    async def run():
+        hub = NotificationHub()
+        backend = DatabasePollingBackend(hub)
+        queues = {student.pk: hub.subscribe(student.pk) for student in students}
+        backend.cursor = await events.latest_notification_id()
+        for student in students:
+            for i in range(3):
+                await sync_to_async(notify)(student, f"{student.username} #{i}")
+        await backend.poll()
+        for student in students:
+            assert queues[student.pk].qsize() == 3
+        assert backend.cursor == await events.latest_notification_id()
+    asyncio.run(run())
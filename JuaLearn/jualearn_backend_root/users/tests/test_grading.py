@@ -0,0 +1,100 @@
+import pytest
+from django.db import connection
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from users.models import Quiz, QuizQuestion, QuizChoice, QuizResult, StudentAnswer
+from users.utils import grade_quiz, load_answer_key
+from users.answer_keys import AnswerKeyCache, answer_key_cache
+
+@pytest.fixture
+def quiz(teacher_user, subject):
+    # Four questions rather than conftest's two, so grades move in steps of 25
+    quiz = Quiz.objects.create(
+        title="Graded Quiz",
+        subject=subject,
+        created_by=teacher_user,
+        due_date="2025-12-31"
+    )
+    for i in range(4):
+        question = QuizQuestion.objects.create(quiz=quiz, text=f"Question {i}")
+        QuizChoice.objects.create(question=question, text="Right", is_correct=True)
+        QuizChoice.objects.create(question=question, text="Wrong")
+    return quiz
+
+@pytest.mark.django_db
+def test_load_answer_key(quiz):
+    answer_key = load_answer_key(quiz)
+    assert len(answer_key) == 4
+    for choices in answer_key.values():
+        assert sorted(choices.values()) == [False, True]
+
+@pytest.mark.django_db
+def test_grade_quiz_scores_and_records_answers(quiz, student_user, answers_for):
+    result = grade_quiz(student_user, quiz, answers_for(quiz, correct=3))
+    assert result.grade == 75
+    assert StudentAnswer.objects.filter(student=student_user).count() == 4
+
+    result = grade_quiz(student_user, quiz, answers_for(quiz, correct=4))
+    assert result.grade == 100
+    assert QuizResult.objects.filter(student=student_user, quiz=quiz).count() == 1
+
+@pytest.mark.django_db
+def test_grade_quiz_ignores_invalid_and_duplicate_answers(quiz, student_user):
+    other_question = QuizQuestion.objects.create(quiz=Quiz.objects.create(
+        title="Other", subject=quiz.subject, created_by=quiz.created_by, due_date="2025-12-31"
+    ), text="Elsewhere")
+    foreign_choice = QuizChoice.objects.create(question=other_question, text="x", is_correct=True)
+    question = quiz.questions.order_by('id').first()
+    right = question.choices.get(is_correct=True)
+
+    answers = [
+        {'question_id': question.id, 'choice_id': right.id},
+        {'question_id': question.id, 'choice_id': right.id},
+        {'question_id': question.id, 'choice_id': foreign_choice.id},
+        {'question_id': other_question.id, 'choice_id': foreign_choice.id},
+        {'question_id': 'abc', 'choice_id': None},
+        {'choice_id': right.id},
+    ]
+    result = grade_quiz(student_user, quiz, answers)
+    assert result.grade == 25
+    assert StudentAnswer.objects.filter(student=student_user).count() == 1
+
+@pytest.mark.django_db
+def test_grade_quiz_query_count_is_constant(quiz, student_user, answers_for):
+    one_answer = answers_for(quiz, correct=1)[:1]
+    all_answers = answers_for(quiz, correct=4)
+    grade_quiz(student_user, quiz, [])
+    with CaptureQueriesContext(connection) as small:
+        grade_quiz(student_user, quiz, one_answer)
+    with CaptureQueriesContext(connection) as full:
+        grade_quiz(student_user, quiz, all_answers)
+    assert len(full) == len(small)
+
+@pytest.mark.django_db
+def test_answer_key_cache_hits_until_quiz_changes(quiz, student_user, teacher_client, answers_for):
+    answers = answers_for(quiz, correct=4)
+    grade_quiz(student_user, Quiz.objects.get(pk=quiz.pk), answers)
+    grade_quiz(student_user, Quiz.objects.get(pk=quiz.pk), answers)
+    assert answer_key_cache.stats()['hits'] == 1
+    assert answer_key_cache.stats()['misses'] == 1
+
+    question = quiz.questions.order_by('id').first()
+    url = reverse('quiz-questions-detail', kwargs={'quiz_pk': quiz.pk, 'pk': question.pk})
+    response = teacher_client.delete(url)
+    assert response.status_code == 204
+
+    quiz.refresh_from_db()
+    assert quiz.content_version == 1
+    result = grade_quiz(student_user, quiz, answers)
+    assert result.grade == 100
+    assert answer_key_cache.stats()['misses'] == 2
+
+def test_answer_key_cache_evicts_least_recently_used():
+    cache = AnswerKeyCache(max_size=2)
+    cache.set((1, 0), {})
+    cache.set((2, 0), {})
+    cache.set((1, 1), {})
+    assert cache.stats()['size'] == 2
+    cache.set((3, 0), {})
+    assert cache.stats()['evictions'] == 1
+    assert list(cache._entries) == [(1, 1), (3, 0)]
@@ -0,0 +1,158 @@
+import json
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.urls import reverse
+from users.importer import import_content, iter_json_array
+from users.models import Subject, Lesson, Quiz, QuizQuestion, QuizChoice, StudentAnswer
+
+def write_content(path, subjects, lessons, quizzes):
+    for name, data in (('subjects.json', subjects), ('lessons.json', lessons), ('quizzes.json', quizzes)):
+        (path / name).write_text(json.dumps(data), encoding='utf-8')
+    return path
+
+def sample_quiz(title, subject_name, n_questions=2):
+    return {
+        "title": title,
+        "subjectName": subject_name,
+        "due_date": "2025-09-30",
+        "questions": [
+            {"text": f"Q{i}", "choices": [{"text": "yes", "is_correct": True}, {"text": "no"}]}
+            for i in range(n_questions)
+        ],
+    }
+
+@pytest.fixture
+def content_dir(tmp_path):
+    return write_content(
+        tmp_path,
+        [{"name": "Physics", "description": "Forces"}, {"name": "Biology"}],
+        [
+            {"subjectName": "Physics", "title": "Motion", "content": "# Motion"},
+            {"subjectName": "Biology", "title": "Cells", "content": "# Cells"},
+            {"subjectName": "Astrology", "title": "Stars", "content": "nope"},
+        ],
+        [sample_quiz("Motion Quiz", "Physics", 3), sample_quiz("Cell Quiz", "Biology")],
+    )
+
+def test_iter_json_array_handles_small_chunks(tmp_path):
+    items = [{"text": "a, ]b"}, 12345, [1, 2], "x" * 50, None]
+    path = tmp_path / "items.json"
+    path.write_text(json.dumps(items, indent=2))
+    assert list(iter_json_array(path, chunk_size=3)) == items
+
+    path.write_text("[]")
+    assert list(iter_json_array(path)) == []
+
+    path.write_text('{"not": "an array"}')
+    with pytest.raises(ValueError):
+        list(iter_json_array(path))
+
+@pytest.mark.django_db
+def test_import_content_creates_everything(content_dir, admin_user):
+    report = import_content(content_dir, admin_user)
+    plan = report.plan
+    assert plan['subjects']['create'] == 2
+    assert plan['lessons']['create'] == 2
+    assert plan['lessons']['skip'] == 1
+    assert plan['quizzes']['create'] == 2
+    assert plan['questions']['create'] == 5
+    assert plan['choices']['create'] == 10
+    assert 'Astrology' in report.warnings[0]
+    assert set(report.timings) == {'subjects', 'lessons', 'quizzes', 'total'}
+
+    quiz = Quiz.objects.get(title="Motion Quiz")
+    assert quiz.subject.name == "Physics"
+    assert quiz.created_by == admin_user
+    assert quiz.source_hash
+    assert QuizChoice.objects.filter(question__quiz=quiz, is_correct=True).count() == 3
+
+@pytest.mark.django_db
+def test_source_hash_is_not_part_of_the_api(content_dir, teacher_user, teacher_client):
+    import_content(content_dir, teacher_user)
+    quiz = Quiz.objects.get(title="Motion Quiz")
+    digest = quiz.source_hash
+    url = reverse('quiz-detail', kwargs={'pk': quiz.id})
+    # validate() wants the core fields on every write
+    payload = {'title': quiz.title, 'subject': quiz.subject_id, 'due_date': str(quiz.due_date), 'source_hash': "forged"}
+    response = teacher_client.patch(url, payload, format='json')
+    assert response.status_code == 200 and 'source_hash' not in response.data
+    quiz.refresh_from_db()
+    assert quiz.source_hash == digest
+
+@pytest.mark.django_db
+def test_reimport_of_unchanged_content_is_a_noop(content_dir, admin_user, student_user):
+    import_content(content_dir, admin_user)
+    question = QuizQuestion.objects.filter(quiz__title="Motion Quiz").first()
+    StudentAnswer.objects.create(student=student_user, question=question, selected_choice=question.choices.first())
+
+    with CaptureQueriesContext(connection) as queries:
+        report = import_content(content_dir, admin_user)
+    assert report.plan['subjects']['noop'] == 2
+    assert report.plan['lessons']['noop'] == 2
+    assert report.plan['quizzes']['noop'] == 2
+    assert report.changes == []
+    assert not any(q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) for q in queries.captured_queries)
+    assert QuizQuestion.objects.count() == 5
+    assert StudentAnswer.objects.count() == 1
+    assert Quiz.objects.get(title="Motion Quiz").content_version == 0
+
+@pytest.mark.django_db
+def test_changed_quiz_is_diffed_per_question(content_dir, admin_user, student_user):
+    import_content(content_dir, admin_user)
+    kept = QuizQuestion.objects.get(quiz__title="Motion Quiz", text="Q0")
+    StudentAnswer.objects.create(student=student_user, question=kept, selected_choice=kept.choices.first())
+
+    quiz = sample_quiz("Motion Quiz", "Physics", 3)
+    quiz["questions"][1]["choices"] = [{"text": "yes"}, {"text": "no", "is_correct": True}, {"text": "maybe"}]
+    del quiz["questions"][2]
+    quiz["questions"].append({"text": "Brand new", "choices": [{"text": "ok", "is_correct": True}]})
+    lessons = [{"subjectName": "Physics", "title": "Motion", "content": "# Motion, revised"}]
+    write_content(content_dir, [{"name": "Physics", "description": "Forces"}], lessons, [quiz])
+
+    dry = import_content(content_dir, admin_user, dry_run=True)
+    assert dry.plan['questions'] == {'create': 1, 'update': 1, 'delete': 1, 'noop': 1, 'skip': 0}
+    assert QuizQuestion.objects.filter(quiz__title="Motion Quiz", text="Brand new").count() == 0
+    assert Lesson.objects.get(title="Motion").content == "# Motion"
+
+    report = import_content(content_dir, admin_user)
+    assert report.plan == dry.plan
+    assert report.plan['lessons']['update'] == 1
+    assert report.plan['choices']['update'] == 2
+    assert report.plan['choices']['create'] == 2
+    assert Lesson.objects.get(title="Motion").content == "# Motion, revised"
+    texts = set(QuizQuestion.objects.filter(quiz__title="Motion Quiz").values_list('text', flat=True))
+    assert texts == {"Q0", "Q1", "Brand new"}
+    q1 = QuizQuestion.objects.get(quiz__title="Motion Quiz", text="Q1")
+    assert list(q1.choices.filter(is_correct=True).values_list('text', flat=True)) == ["no"]
+    assert q1.choices.count() == 3
+    assert StudentAnswer.objects.filter(question=kept).exists()
+    assert Quiz.objects.get(title="Motion Quiz").content_version == 1
+
+    assert import_content(content_dir, admin_user).changes == []
+
+@pytest.mark.django_db
+def test_failed_import_leaves_no_partial_state(content_dir, admin_user):
+    broken = sample_quiz("Broken", "Physics")
+    del broken["questions"][1]["text"]
+    (content_dir / 'quizzes.json').write_text(json.dumps([broken]))
+    with pytest.raises(KeyError):
+        import_content(content_dir, admin_user)
+    assert not Subject.objects.exists()
+    assert not Lesson.objects.exists()
+
+@pytest.mark.django_db
+def test_bulkupload_command_and_view_import_shipped_content(admin_user, admin_client):
+    call_command('bulkupload')
+    assert Quiz.objects.exists()
+    subjects = Subject.objects.count()
+
+    response = admin_client.post(reverse('bulk-upload'))
+    assert response.status_code == 201
+    assert response.data['report']['plan']['subjects']['noop'] == subjects
+
+    response = admin_client.post(reverse('bulk-upload') + '?dry_run=1')
+    assert response.status_code == 200
+    assert response.data['report']['dry_run'] is True
+    assert Subject.objects.count() == subjects
@@ -0,0 +1,58 @@
+import json
+import os
+from scripts.generate_lessons_json import build, split_front_matter
+from users.importer import ContentImporter
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+
+def quiet(*args):
+    pass
+
+def test_split_front_matter():
+    meta, body = split_front_matter("---\nsubject: Physics\ntitle: 'Motion'\n---\n\n# Heading\n")
+    assert meta == {'subject': 'Physics', 'title': 'Motion'}
+    assert body == "# Heading\n"
+    assert split_front_matter("# No front matter\n") == ({}, "# No front matter\n")
+    assert split_front_matter("---\nunterminated\n")[0] == {}
+
+def test_build_discovers_lessons_and_only_reparses_changes(tmp_path):
+    lessons = tmp_path / 'lessons'
+    write(lessons / 'maths.md', "---\nsubject: Mathematics\n---\n# Complex Numbers\nbody")
+    write(lessons / 'Biology' / 'cells.md', "# Cells\n")
+    write(lessons / 'Biology' / 'deep' / 'untitled-notes.md', "no heading")
+    write(lessons / 'orphan.md', "# Nobody's\n")
+
+    summary = build(lessons, log=quiet)
+    assert summary['parsed'] == 4
+    records = json.loads((tmp_path / 'lessons.json').read_text())
+    assert [(r['subjectName'], r['title']) for r in records] == [
+        ('Biology', 'Cells'),
+        ('Biology', 'Untitled Notes'),
+        ('Mathematics', 'Complex Numbers'),
+    ]
+    assert records[2]['content'] == "# Complex Numbers\nbody"
+
+    summary = build(lessons, log=quiet)
+    assert summary == dict(summary, parsed=0, reused=4, written=False)
+
+    # Touching a file without editing it is not a change
+    os.utime(lessons / 'maths.md')
+    assert build(lessons, log=quiet)['written'] is False
+
+    write(lessons / 'Biology' / 'cells.md', "# Cells, revised\n")
+    (lessons / 'orphan.md').unlink()
+    summary = build(lessons, log=quiet)
+    assert summary == dict(summary, parsed=1, reused=2, removed=1, written=True)
+    records = json.loads((tmp_path / 'lessons.json').read_text())
+    assert records[0]['title'] == 'Cells, revised'
+
+def test_ndjson_output_is_read_by_importer(tmp_path):
+    write(tmp_path / 'lessons' / 'Physics' / 'motion.md', "# Motion\n")
+    build(tmp_path / 'lessons', fmt='ndjson', log=quiet)
+    assert not (tmp_path / 'lessons.json').exists()
+    importer = ContentImporter(tmp_path, user=None)
+    assert list(importer.records('lessons.json')) == [
+        {'subjectName': 'Physics', 'title': 'Motion', 'content': "# Motion\n"},
+    ]
@@ -0,0 +1,110 @@
+import gzip
+import json
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users.importer import import_content
+from users.lessons import cache_key, fingerprint, pick_encoding, render_markdown
+from users.models import User, Lesson
+
+
+def test_render_markdown():
+    text = (
+        "# Motion\n\nObjects *keep* moving, see **Newton** and `F = ma`.\n"
+        "- first\n- second\n  continued\n\n1. one\n2. two\n\n> quoted\n\n---\n"
+        "```python\nprint('<hi>')\n```\n[docs](https://example.com/a?b=1&c=2) ![chart](/img/c.png)"
+    )
+    assert render_markdown(text) == (
+        "<h1>Motion</h1>\n"
+        "<p>Objects <em>keep</em> moving, see <strong>Newton</strong> and <code>F = ma</code>.</p>\n"
+        "<ul><li>first</li><li>second continued</li></ul>\n"
+        "<ol><li>one</li><li>two</li></ol>\n"
+        "<blockquote><p>quoted</p></blockquote>\n"
+        "<hr>\n"
+        "<pre><code class=\"language-python\">print(&#x27;&lt;hi&gt;&#x27;)</code></pre>\n"
+        "<p><a href=\"https://example.com/a?b=1&amp;c=2\">docs</a> <img src=\"/img/c.png\" alt=\"chart\"></p>"
+    )
+
+
+def test_render_markdown_never_passes_markup_through():
+    rendered = render_markdown('<script>alert(1)</script>\n[x](javascript:alert(1)) [y](" onmouseover="z)')
+    assert '<script>' not in rendered and '<a ' not in rendered and 'onmouseover="' not in rendered
+    assert '&lt;script&gt;' in rendered
+
+
+def test_pick_encoding():
+    assert pick_encoding('gzip, deflate') == 'gzip'
+    assert pick_encoding('gzip;q=0, identity') == 'identity'
+    assert pick_encoding('*') in ('br', 'gzip')
+    assert pick_encoding('') == 'identity'
+
+
+@pytest.mark.django_db
+def test_lesson_list_is_a_summary(teacher_client, subject, teacher_user):
+    lesson = Lesson.objects.create(subject=subject, title="Motion", content="# Motion\n" + "x" * 5000,
+                                   created_by=teacher_user)
+    response = teacher_client.get(reverse('lesson-list'))
+    assert response.data == [{'id': lesson.id, 'title': "Motion", 'subject': subject.id, 'size': 5009,
+                              'version': fingerprint(lesson.content)['content_hash'][:16]}]
+    detail = teacher_client.get(reverse('lesson-detail', kwargs={'pk': lesson.id}))
+    assert detail.data['content'] == lesson.content
+
+
+@pytest.mark.django_db(transaction=True)
+def test_body_is_prerendered_and_served_compressed(teacher_client, enrolled_client, subject):
+    response = teacher_client.post(reverse('lesson-list'), {'subject': subject.id, 'title': "Motion", 'content': "# Motion"})
+    lesson = Lesson.objects.get(pk=response.data['id'])
+    assert cache.get(cache_key(lesson.content_hash)) is not None
+
+    url = reverse('lesson-body', kwargs={'pk': lesson.id})
+    plain = enrolled_client.get(url)
+    assert plain.status_code == 200 and plain['Content-Type'] == 'text/html; charset=utf-8'
+    assert plain.content == b"<h1>Motion</h1>"
+    assert 'Accept-Encoding' in plain['Vary']
+
+    zipped = enrolled_client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+    assert zipped['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.content) == b"<h1>Motion</h1>"
+    assert zipped['ETag'] != plain['ETag']
+    assert enrolled_client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=zipped['ETag']).status_code == 304
+
+    teacher_client.patch(reverse('lesson-detail', kwargs={'pk': lesson.id}), {'content': "# Forces"})
+    lesson.refresh_from_db()
+    assert cache.get(cache_key(lesson.content_hash)) is not None
+    changed = enrolled_client.get(url, HTTP_IF_NONE_MATCH=plain['ETag'])
+    assert changed.status_code == 200 and changed.content == b"<h1>Forces</h1>"
+
+
+@pytest.mark.django_db
+def test_body_renders_on_a_cache_miss(enrolled_client, subject, teacher_user):
+    lesson = Lesson.objects.create(subject=subject, title="Cells", content="Cells *divide*", created_by=teacher_user)
+    assert cache.get(cache_key(lesson.content_hash)) is None
+    assert enrolled_client.get(reverse('lesson-body', kwargs={'pk': lesson.id})).content == b"<p>Cells <em>divide</em></p>"
+    assert cache.get(cache_key(lesson.content_hash)) is not None
+
+
+@pytest.mark.django_db
+def test_body_follows_lesson_visibility(subject, teacher_user):
+    lesson = Lesson.objects.create(subject=subject, title="Cells", content="x", created_by=teacher_user)
+    client = APIClient()
+    client.force_authenticate(user=User.objects.create(username='bob', role='student'))
+    assert client.get(reverse('lesson-body', kwargs={'pk': lesson.id})).status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_importer_fingerprints_and_renders_lessons(tmp_path, admin_user):
+    (tmp_path / 'subjects.json').write_text(json.dumps([{"name": "Physics"}]))
+    (tmp_path / 'quizzes.json').write_text('[]')
+    lessons_file = tmp_path / 'lessons.json'
+    lessons_file.write_text(json.dumps([{"subjectName": "Physics", "title": "Motion", "content": "# Motion"}]))
+    import_content(str(tmp_path), admin_user)
+    lesson = Lesson.objects.get(title="Motion")
+    assert (lesson.content_hash, lesson.content_size) == tuple(fingerprint("# Motion").values())
+    assert cache.get(cache_key(lesson.content_hash))['identity'] == b"<h1>Motion</h1>"
+
+    lessons_file.write_text(json.dumps([{"subjectName": "Physics", "title": "Motion", "content": "# Moving"}]))
+    import_content(str(tmp_path), admin_user)
+    lesson.refresh_from_db()
+    assert lesson.content_hash == fingerprint("# Moving")['content_hash']
+    assert cache.get(cache_key(lesson.content_hash))['identity'] == b"<h1>Moving</h1>"
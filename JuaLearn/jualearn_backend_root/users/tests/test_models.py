@@ -1,5 +1,5 @@
 import pytest
-from users.models import User, Subject, Assignment, Quiz
+from users.models import User, Subject, Assignment, AssignmentSubmission, Quiz
 
 @pytest.mark.django_db
 def test_user_creation():
@@ -23,12 +23,13 @@ def test_assignment_creation(teacher_user, student_user, subject):
         title="Test Assignment",
         subject=subject,
         created_by=teacher_user,
-        assigned_to=student_user,
         due_date="2025-12-31"
     )
+    submission = AssignmentSubmission.objects.create(assignment=assignment, student=student_user)
     assert assignment.title == "Test Assignment"
     assert assignment.subject == subject
-    assert assignment.assigned_to == student_user
+    assert list(assignment.submissions.all()) == [submission]
+    assert submission.grade is None
     assert not assignment.published
 
 @pytest.mark.django_db
@@ -42,3 +43,77 @@ def test_quiz_creation(teacher_user, subject):
     assert quiz.title == "Test Quiz"
     assert quiz.subject == subject
     assert not quiz.published
+
+@pytest.mark.django_db(transaction=True)
+def test_migration_folds_assignment_copies_into_submissions():
+    from django.db import connection
+    from django.db.migrations.executor import MigrationExecutor
+    executor = MigrationExecutor(connection)
+    executor.migrate([('users', '0027_assignmentsubmission')])
+    apps = executor.loader.project_state([('users', '0027_assignmentsubmission')]).apps
+    OldUser = apps.get_model('users', 'User')
+    OldSubject = apps.get_model('users', 'Subject')
+    OldAssignment = apps.get_model('users', 'Assignment')
+    teacher = OldUser.objects.create(username='teacher', role='teacher')
+    alice = OldUser.objects.create(username='alice', role='student')
+    bob = OldUser.objects.create(username='bob', role='student')
+    subject = OldSubject.objects.create(name='Maths', created_by=teacher)
+    fields = dict(title="Essay", subject=subject, created_by=teacher, due_date="2030-01-31")
+    base = OldAssignment.objects.create(**fields)
+    OldAssignment.objects.create(**fields, assigned_to=alice, grade=90, published=True)
+    OldAssignment.objects.create(**fields, assigned_to=bob, published=True)
+    OldAssignment.objects.create(**dict(fields, title="Other"), assigned_to=bob, grade=40)
+
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate([('users', '0029_remove_assignment_clone_fields')])
+    apps = executor.loader.project_state([('users', '0029_remove_assignment_clone_fields')]).apps
+    NewAssignment = apps.get_model('users', 'Assignment')
+    NewSubmission = apps.get_model('users', 'AssignmentSubmission')
+    assert NewAssignment.objects.count() == 2
+    essay = NewAssignment.objects.get(title="Essay")
+    assert essay.id == base.id and essay.published
+    assert sorted(NewSubmission.objects.filter(assignment=essay).values_list('student__username', 'grade')) == [
+        ('alice', 90), ('bob', None),
+    ]
+    assert NewSubmission.objects.get(assignment__title="Other").grade == 40
+
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate(executor.loader.graph.leaf_nodes())
+
+@pytest.mark.django_db(transaction=True)
+def test_migration_deletes_placeholder_quiz_results():
+    from django.db import connection
+    from django.db.migrations.executor import MigrationExecutor
+    executor = MigrationExecutor(connection)
+    executor.migrate([('users', '0029_remove_assignment_clone_fields')])
+    apps = executor.loader.project_state([('users', '0029_remove_assignment_clone_fields')]).apps
+    OldUser = apps.get_model('users', 'User')
+    OldSubject = apps.get_model('users', 'Subject')
+    OldQuiz = apps.get_model('users', 'Quiz')
+    OldQuestion = apps.get_model('users', 'QuizQuestion')
+    OldChoice = apps.get_model('users', 'QuizChoice')
+    OldResult = apps.get_model('users', 'QuizResult')
+    OldAnswer = apps.get_model('users', 'StudentAnswer')
+    teacher = OldUser.objects.create(username='teacher', role='teacher')
+    students = [OldUser.objects.create(username=f'student{i}', role='student') for i in range(3)]
+    subject = OldSubject.objects.create(name='Maths', created_by=teacher)
+    quiz = OldQuiz.objects.create(title="Quiz", subject=subject, created_by=teacher, due_date="2030-01-31")
+    question = OldQuestion.objects.create(quiz=quiz, text="1 + 1?")
+    choice = OldChoice.objects.create(question=question, text="2", is_correct=True)
+    OldResult.objects.create(student=students[0], quiz=quiz)
+    OldResult.objects.create(student=students[1], quiz=quiz, grade=100)
+    OldResult.objects.create(student=students[2], quiz=quiz)
+    OldAnswer.objects.create(student=students[2], question=question, selected_choice=choice)
+
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate([('users', '0030_delete_placeholder_quiz_results')])
+    apps = executor.loader.project_state([('users', '0030_delete_placeholder_quiz_results')]).apps
+    NewResult = apps.get_model('users', 'QuizResult')
+    assert sorted(NewResult.objects.values_list('student__username', flat=True)) == ['student1', 'student2']
+
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate(executor.loader.graph.leaf_nodes())
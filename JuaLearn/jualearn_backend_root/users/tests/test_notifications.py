@@ -0,0 +1,249 @@
+import pytest
+from unittest import mock
+from django.db import connection
+from django.utils import timezone
+from django.db.migrations.executor import MigrationExecutor
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users.models import User, Enrollment, Notification, NotificationJob, NotificationTemplate, Quiz
+from users.notifications import (
+    STALE_AFTER, enqueue_fanout, notify, resume_abandoned_jobs, run_job, run_job_with_retries, run_pending_jobs,
+)
+
+@pytest.fixture
+def students(db):
+    return [
+        User.objects.create_user(username=f"pupil{i}", password="testpass123", role="student")
+        for i in range(5)
+    ]
+
+@pytest.mark.django_db
+def test_subject_publish_queues_job_instead_of_writing(teacher_client, subject, students):
+    url = reverse('subject-publish', kwargs={'pk': subject.id})
+    response = teacher_client.post(url)
+    assert response.status_code == 200
+    assert Notification.objects.count() == 0
+
+    job = NotificationJob.objects.get(pk=response.data['job_id'])
+    assert job.status == 'pending'
+
+    assert run_pending_jobs() == 1
+    job.refresh_from_db()
+    assert job.status == 'done'
+    assert job.total == job.sent == 5
+    assert Notification.objects.filter(template__type='subject_published').count() == 5
+
+@pytest.mark.django_db
+def test_quiz_destroy_notifies_enrolled_students_only(teacher_client, teacher_user, subject, students):
+    for student in students[:2]:
+        Enrollment.objects.create(student=student, subject=subject)
+    quiz = Quiz.objects.create(title="Doomed", subject=subject, created_by=teacher_user, due_date="2025-12-31")
+
+    response = teacher_client.delete(reverse('quiz-detail', kwargs={'pk': quiz.id}))
+    assert response.status_code == 204
+    run_pending_jobs()
+    recipients = set(Notification.objects.filter(template__type='quiz_delete').values_list('recipient_id', flat=True))
+    assert recipients == {students[0].id, students[1].id}
+
+@pytest.mark.django_db
+def test_job_resumes_after_failure_without_duplicates(settings, students):
+    settings.NOTIFICATION_FANOUT_CHUNK_SIZE = 2
+    job = enqueue_fanout('all_students', title="Hello")
+    real_bulk_create = Notification.objects.bulk_create
+    calls = []
+
+    def flaky_bulk_create(objs, *args, **kwargs):
+        calls.append(len(objs))
+        if len(calls) == 2:
+            raise RuntimeError("database went away")
+        return real_bulk_create(objs, *args, **kwargs)
+
+    with mock.patch.object(Notification.objects, 'bulk_create', side_effect=flaky_bulk_create):
+        assert run_job(job.id) is False
+    job.refresh_from_db()
+    assert job.status == 'pending'
+    assert job.sent == 2
+    assert 'went away' in job.error
+
+    assert run_job(job.id) is True
+    job.refresh_from_db()
+    assert job.status == 'done'
+    assert job.sent == 5
+    assert Notification.objects.values('recipient').distinct().count() == 5
+    assert Notification.objects.count() == 5
+
+@pytest.mark.django_db
+def test_job_is_marked_failed_after_max_attempts(students):
+    job = enqueue_fanout('all_students', title="Hello")
+    with mock.patch.object(Notification.objects, 'bulk_create', side_effect=RuntimeError("boom")):
+        for _ in range(3):
+            run_job(job.id)
+    job.refresh_from_db()
+    assert job.status == 'failed'
+    assert job.attempts == 3
+    assert run_job(job.id) is False
+
+@pytest.mark.django_db
+def test_thread_mode_retries_with_backoff(students):
+    job = enqueue_fanout('all_students', title="Hello")
+    real_bulk_create = Notification.objects.bulk_create
+    failures = iter([RuntimeError("boom"), RuntimeError("boom again")])
+
+    def flaky_bulk_create(objs, *args, **kwargs):
+        error = next(failures, None)
+        if error:
+            raise error
+        return real_bulk_create(objs, *args, **kwargs)
+
+    with mock.patch.object(Notification.objects, 'bulk_create', side_effect=flaky_bulk_create), \
+            mock.patch('users.notifications.time.sleep') as sleep:
+        assert run_job_with_retries(job.id) is True
+    assert [c.args[0] for c in sleep.call_args_list] == [5, 10]
+    job.refresh_from_db()
+    assert (job.status, job.attempts, job.sent) == ('done', 3, 5)
+
+    job = enqueue_fanout('all_students', title="Never")
+    with mock.patch.object(Notification.objects, 'bulk_create', side_effect=RuntimeError("boom")), \
+            mock.patch('users.notifications.time.sleep'):
+        assert run_job_with_retries(job.id) is False
+    job.refresh_from_db()
+    assert (job.status, job.attempts) == ('failed', 3)
+
+@pytest.mark.django_db
+def test_thread_mode_resumes_abandoned_jobs(students):
+    long_ago = timezone.now() - STALE_AFTER * 2
+    died = enqueue_fanout('all_students', title="Thread died")
+    never_started = enqueue_fanout('all_students', title="Never started")
+    fresh = enqueue_fanout('all_students', title="Starting now")
+    NotificationJob.objects.filter(pk=died.pk).update(status='running', started_at=long_ago, created_at=long_ago)
+    NotificationJob.objects.filter(pk=never_started.pk).update(created_at=long_ago)
+
+    assert resume_abandoned_jobs(STALE_AFTER) == 2
+    assert dict(NotificationJob.objects.values_list('id', 'status')) == {
+        died.id: 'done', never_started.id: 'done', fresh.id: 'pending',
+    }
+
+@pytest.mark.django_db
+def test_notification_jobs_endpoint_is_scoped_to_creator(teacher_client, teacher_user, subject):
+    enqueue_fanout('all_students', title="Mine", created_by=teacher_user)
+    enqueue_fanout('all_students', title="Someone else's")
+    response = teacher_client.get(reverse('notification-jobs-list'))
+    assert response.status_code == 200
+    assert [job['title'] for job in response.data] == ["Mine"]
+
+@pytest.mark.django_db
+def test_fanout_shares_one_template_between_recipients(students):
+    job = enqueue_fanout('all_students', title="Shared", message="Same text for everyone")
+    run_job(job.id)
+    assert NotificationTemplate.objects.count() == 1
+    assert Notification.objects.filter(template=job.template).count() == 5
+
+@pytest.mark.django_db
+def test_notification_list_keeps_flat_json_shape(students):
+    client = APIClient()
+    client.force_authenticate(user=students[0])
+    notify(students[0], "Quiz Graded", message="Your score: 80%", url="/student/quizzes/1/results", type="quiz_graded")
+    response = client.get(reverse('notifications-list'))
+    assert response.status_code == 200
+    item = response.data['results'][0]
+    assert set(item) == {'id', 'title', 'message', 'url', 'created_at', 'is_read', 'type'}
+    assert item['title'] == "Quiz Graded"
+    assert item['type'] == "quiz_graded"
+
+    response = client.patch(reverse('notifications-detail', kwargs={'pk': item['id']}), {'is_read': True})
+    assert response.status_code == 200
+    assert response.data['is_read'] is True
+    assert response.data['message'] == "Your score: 80%"
+
+@pytest.mark.django_db(transaction=True)
+def test_migration_moves_notification_text_into_templates():
+    executor = MigrationExecutor(connection)
+    executor.migrate([('users', '0021_notificationtemplate')])
+    apps = executor.loader.project_state([('users', '0021_notificationtemplate')]).apps
+    OldUser = apps.get_model('users', 'User')
+    OldNotification = apps.get_model('users', 'Notification')
+    alice = OldUser.objects.create(username='alice', role='student')
+    bob = OldUser.objects.create(username='bob', role='student')
+    for recipient in (alice, bob):
+        OldNotification.objects.create(recipient=recipient, title="Course Published", message="Go", type="subject_published")
+    OldNotification.objects.create(recipient=alice, title="Quiz Graded", message="80%", type="quiz_graded")
+
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate([('users', '0023_remove_notification_text_fields')])
+    apps = executor.loader.project_state([('users', '0023_remove_notification_text_fields')]).apps
+    NewTemplate = apps.get_model('users', 'NotificationTemplate')
+    NewNotification = apps.get_model('users', 'Notification')
+    assert NewTemplate.objects.count() == 2
+    published = NewTemplate.objects.get(type='subject_published')
+    assert NewNotification.objects.filter(template=published).count() == 2
+
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate(executor.loader.graph.leaf_nodes())
+
+@pytest.mark.django_db
+def test_notification_inbox_pages_with_cursor(students):
+    student = students[0]
+    for i in range(5):
+        notify(student, f"Notice {i}")
+    client = APIClient()
+    client.force_authenticate(user=student)
+
+    seen = []
+    url = reverse('notifications-list') + '?page_size=2'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert len(response.data['results']) <= 2
+        seen.extend(item['title'] for item in response.data['results'])
+        url = response.data['next']
+    assert seen == [f"Notice {i}" for i in reversed(range(5))]
+
+    response = client.get(reverse('notifications-list') + '?cursor=garbage')
+    assert response.status_code == 404
+
+@pytest.mark.django_db
+def test_unread_counter_tracks_reads_and_fanout(students):
+    student = students[0]
+    client = APIClient()
+    client.force_authenticate(user=student)
+    count_url = reverse('notifications-unread-count')
+
+    first = notify(student, "One")
+    notify(student, "Two")
+    run_job(enqueue_fanout('all_students', title="Everyone").id)
+    assert client.get(count_url).data['unread_count'] == 3
+
+    client.patch(reverse('notifications-detail', kwargs={'pk': first.id}), {'is_read': True})
+    assert client.get(count_url).data['unread_count'] == 2
+
+    response = client.post(reverse('notifications-mark-all-read'))
+    assert response.data['updated'] == 2
+    assert client.get(count_url).data['unread_count'] == 0
+    assert not Notification.objects.filter(recipient=student, is_read=False).exists()
+    student.refresh_from_db()
+    assert student.unread_notifications == 0
+    assert User.objects.get(pk=students[1].pk).unread_notifications == 1
+
+@pytest.mark.django_db
+def test_unread_counter_survives_racing_requests(students, monkeypatch):
+    from users.views import NotificationViewSet
+    student = students[0]
+    client = APIClient()
+    client.force_authenticate(user=student)
+    first, second, _ = notify(student, "One"), notify(student, "Two"), notify(student, "Three")
+
+    def race(notification, method):
+        # This request loads the row, then another one marks it read before it writes
+        stale = Notification.objects.get(pk=notification.pk)
+        url = reverse('notifications-detail', kwargs={'pk': notification.id})
+        client.patch(url, {'is_read': True})
+        with monkeypatch.context() as patched:
+            patched.setattr(NotificationViewSet, 'get_object', lambda self: stale)
+            assert getattr(client, method)(url, {'is_read': True}).status_code in (200, 204)
+
+    race(first, 'patch')
+    race(second, 'delete')
+    student.refresh_from_db()
+    assert student.unread_notifications == 1
@@ -0,0 +1,137 @@
+import pytest
+from datetime import date
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users.models import (
+    User, Enrollment, QuizResult, Assignment, AssignmentSubmission, SubjectProgress, DashboardSnapshot,
+)
+from users.utils import grade_quiz
+
+
+@pytest.fixture
+def essay(teacher_user, subject):
+    return Assignment.objects.create(title="Essay", subject=subject, created_by=teacher_user,
+                                     due_date=date(2030, 2, 1), published=True)
+
+
+def enroll(subject, username):
+    student = User.objects.create(username=username, role='student')
+    Enrollment.objects.create(student=student, subject=subject)
+    return student
+
+
+def progress_of(student, subject):
+    row = SubjectProgress.objects.get(student=student, subject=subject)
+    return row.quizzes_taken, row.assignments_graded, row.average_grade
+
+
+@pytest.mark.django_db
+def test_progress_follows_enrollment_and_grading(teacher_client, subject, quiz, essay, answers_for):
+    alice = enroll(subject, 'alice')
+    assert progress_of(alice, subject) == (0, 0, None)
+
+    grade_quiz(alice, quiz, answers_for(quiz, 1))
+    assert progress_of(alice, subject) == (1, 0, 50)
+
+    response = teacher_client.post(reverse('assignments-grade', kwargs={'pk': essay.id}),
+                                   {'student': alice.id, 'grade': 90})
+    assert response.status_code == 200
+    assert progress_of(alice, subject) == (1, 1, 70)
+    row = SubjectProgress.objects.get(student=alice, subject=subject)
+    assert row.last_activity == AssignmentSubmission.objects.get(student=alice).graded_at
+
+    # Resubmitting replaces the quiz grade rather than adding another
+    grade_quiz(alice, quiz, answers_for(quiz, 2))
+    assert progress_of(alice, subject) == (1, 1, 95)
+
+    QuizResult.objects.filter(student=alice).delete()
+    assert progress_of(alice, subject) == (0, 1, 90)
+
+    Enrollment.objects.filter(student=alice).delete()
+    assert not SubjectProgress.objects.filter(student=alice).exists()
+
+
+@pytest.mark.django_db
+def test_progress_is_written_in_the_grading_transaction(subject, quiz, answers_for):
+    alice = enroll(subject, 'alice')
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            grade_quiz(alice, quiz, answers_for(quiz, 2))
+            raise RuntimeError("rolled back")
+    assert progress_of(alice, subject) == (0, 0, None)
+
+
+@pytest.mark.django_db
+def test_deleting_a_quiz_recounts_its_students(subject, quiz, answers_for):
+    alice = enroll(subject, 'alice')
+    grade_quiz(alice, quiz, answers_for(quiz, 2))
+    quiz.delete()
+    assert progress_of(alice, subject) == (0, 0, None)
+
+
+@pytest.mark.django_db
+def test_cascading_deletes_are_handled_set_wise(subject, quiz, essay, django_assert_max_num_queries):
+    students = [enroll(subject, f'student{i}') for i in range(50)]
+    QuizResult.objects.bulk_create([QuizResult(student=student, quiz=quiz, grade=100) for student in students])
+    AssignmentSubmission.objects.create(assignment=essay, student=students[0], grade=60)
+    call_command('rebuild_progress')
+    DashboardSnapshot.objects.bulk_create([DashboardSnapshot(student=student, recent_grades_stale=False)
+                                           for student in students])
+
+    # Not one query per result, as per-row receivers would take
+    with django_assert_max_num_queries(25):
+        quiz.delete()
+    assert progress_of(students[0], subject) == (0, 1, 60)
+    assert progress_of(students[1], subject) == (0, 0, None)
+    assert not DashboardSnapshot.objects.filter(recent_grades_stale=False).exists()
+
+    with django_assert_max_num_queries(30):
+        subject.delete()
+    assert not SubjectProgress.objects.exists()
+
+
+@pytest.mark.django_db
+def test_leaderboard(teacher_client, subject, quiz, essay, answers_for):
+    scores = {'alice': 2, 'bob': 0, 'carol': 1}
+    students = {name: enroll(subject, name) for name in (*scores, 'dave')}
+    for name, correct in scores.items():
+        grade_quiz(students[name], quiz, answers_for(quiz, correct))
+    AssignmentSubmission.objects.create(assignment=essay, student=students['bob'], grade=100)
+
+    url = reverse('subject-leaderboard', kwargs={'pk': subject.id})
+    with CaptureQueriesContext(connection) as queries:
+        response = teacher_client.get(url)
+    assert response.status_code == 200
+    assert not any(QuizResult._meta.db_table in q['sql'] for q in queries.captured_queries)
+    assert [(r['rank'], r['student']['username'], r['average_grade'], r['completion']) for r in response.data] == [
+        (1, 'alice', 100, 50), (2, 'bob', 50, 100), (3, 'carol', 50, 50),
+    ]
+    assert len(teacher_client.get(url, {'limit': 1}).data) == 1
+    assert teacher_client.get(url, {'limit': 'x'}).status_code == 400
+
+    subject.published = True
+    subject.save()
+    client = APIClient()
+    client.force_authenticate(user=students['dave'])
+    assert client.get(url).status_code == 200
+    client.force_authenticate(user=User.objects.create(username='eve', role='student'))
+    assert client.get(url).status_code == 403
+
+
+@pytest.mark.django_db
+def test_rebuild_command_matches_incremental_updates(subject, quiz, essay, answers_for):
+    alice, bob = enroll(subject, 'alice'), enroll(subject, 'bob')
+    grade_quiz(alice, quiz, answers_for(quiz, 1))
+    AssignmentSubmission.objects.create(assignment=essay, student=alice, grade=80)
+    AssignmentSubmission.objects.create(assignment=essay, student=bob)
+    expected = sorted(SubjectProgress.objects.values_list(
+        'student_id', 'subject_id', 'quizzes_taken', 'assignments_graded', 'average_grade', 'last_activity'))
+
+    SubjectProgress.objects.all().delete()
+    call_command('rebuild_progress')
+    assert sorted(SubjectProgress.objects.values_list(
+        'student_id', 'subject_id', 'quizzes_taken', 'assignments_graded', 'average_grade', 'last_activity')) == expected
+    assert progress_of(bob, subject) == (0, 0, None)
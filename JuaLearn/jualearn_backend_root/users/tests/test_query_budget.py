@@ -0,0 +1,209 @@
+"""
+Query budget for every GET endpoint in users/urls.py.
+
+Each endpoint is called as an admin, a teacher and a student against a seeded
+dataset, then again after the dataset has grown. A case fails when the
+endpoint runs more queries than its budget, or when its query count grows
+with the number of rows returned (an N+1). Counts and timings are printed in
+the terminal summary.
+"""
+import json
+import time
+from datetime import date
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from rest_framework.test import APIClient
+from users.models import (
+    User, Subject, Enrollment, Quiz, QuizQuestion, QuizChoice, QuizResult,
+    Assignment, AssignmentSubmission, Lesson, NotificationJob,
+)
+from users.notifications import notify
+
+ROLES = ('admin', 'teacher', 'student')
+
+DEFAULT_BUDGET = 6
+
+# Endpoints that legitimately need more than DEFAULT_BUDGET queries
+BUDGETS = {
+    # The head and the events, then a query per synced kind
+    'sync': 9,
+}
+
+# Parent ids for nested routes, taken from the first row of these lists
+PARENT_LISTS = {
+    'quiz_pk': ('quiz-list', {}),
+    'question_pk': ('quiz-questions-list', {'quiz_pk'}),
+    'subject_id': ('subject-list', {}),
+}
+
+# Known N+1s by test id, tracked here until the endpoints are fixed. Strict
+# xfail, so fixing one fails the suite until it is taken off the list.
+KNOWN_N_PLUS_ONE = set()
+
+
+def handles_get(callback):
+    actions = getattr(callback, 'actions', None)
+    if actions is not None:
+        return 'get' in actions
+    view_class = getattr(callback, 'view_class', None) or getattr(callback, 'cls', None)
+    return view_class is not None and hasattr(view_class, 'get')
+
+
+def get_routes():
+    """
+    (name, url kwargs, basename) of every GET route, once per distinct kwargs.
+    """
+    routes = {}
+
+    def walk(patterns, kwargs):
+        for pattern in patterns:
+            names = kwargs | set(pattern.pattern.regex.groupindex)
+            if hasattr(pattern, 'url_patterns'):
+                walk(pattern.url_patterns, names)
+            elif pattern.name and 'format' not in names and handles_get(pattern.callback):
+                basename = getattr(pattern.callback, 'initkwargs', {}).get('basename')
+                routes.setdefault((pattern.name, frozenset(names)), basename)
+
+    walk(get_resolver('users.urls').url_patterns, set())
+    return [(name, kwargs, basename) for (name, kwargs), basename in routes.items()]
+
+
+def route_cases():
+    # A list, so pytest can count and re-read the cases
+    cases = []
+    for name, kwargs, basename in get_routes():
+        for role in ROLES:
+            label = f"{role}:{name}" + (f"[{','.join(sorted(kwargs))}]" if kwargs else '')
+            marks = []
+            if label in KNOWN_N_PLUS_ONE:
+                marks.append(pytest.mark.xfail(reason="known N+1", strict=True))
+            cases.append(pytest.param(role, name, kwargs, basename, id=label, marks=marks))
+    return cases
+
+
+class Dataset:
+    """
+    A school that can be grown step by step. Each step adds a subject with
+    students, a quiz with questions and results, assignments, a lesson and
+    notifications, all visible to the three role users, and one more question
+    to the first quiz.
+    """
+
+    def __init__(self):
+        self.admin = User.objects.create(username='qb-admin', role='admin', is_staff=True)
+        self.teacher = User.objects.create(username='qb-teacher', role='teacher')
+        self.student = User.objects.create(username='qb-student', role='student', first_name='Sam', last_name='Ng')
+        self.steps = 0
+
+    def grow(self, steps=1):
+        for _ in range(steps):
+            self.steps += 1
+            n = self.steps
+            subject = Subject.objects.create(name=f"Subject {n}", created_by=self.teacher, published=True)
+            classmates = User.objects.bulk_create([
+                User(username=f"qb-pupil-{n}-{i}", role='student', first_name='Pupil', last_name=str(i))
+                for i in range(2)
+            ])
+            students = [self.student, *classmates]
+            Enrollment.objects.bulk_create([Enrollment(student=s, subject=subject) for s in students])
+
+            quiz = Quiz.objects.create(
+                title=f"Quiz {n}", subject=subject, created_by=self.teacher,
+                due_date=date(2030, 1, 1), published=True,
+            )
+            questions = [QuizQuestion(quiz=quiz, text=f"Question {i}") for i in range(3)]
+            first_quiz = Quiz.objects.order_by('id').first()
+            if first_quiz != quiz:
+                # The first quiz gets longer too, so question lists grow with the data
+                questions.append(QuizQuestion(quiz=first_quiz, text=f"Extra question {n}"))
+            QuizQuestion.objects.bulk_create(questions)
+            QuizChoice.objects.bulk_create([
+                QuizChoice(question=q, text=f"Choice {i}", is_correct=i == 0)
+                for q in questions for i in range(3)
+            ])
+            QuizResult.objects.bulk_create([QuizResult(student=s, quiz=quiz, grade=70) for s in students])
+
+            assignment = Assignment.objects.create(title=f"Assignment {n}", subject=subject, created_by=self.teacher,
+                                                   due_date=date(2030, 1, 1), published=True)
+            AssignmentSubmission.objects.bulk_create([
+                AssignmentSubmission(assignment=assignment, student=s, grade=80) for s in students
+            ])
+            Lesson.objects.create(subject=subject, title=f"Lesson {n}", content="# Lesson", created_by=self.teacher)
+            for user in (self.admin, self.teacher, self.student):
+                notify(user, f"Notice {n}")
+            template = notify(self.teacher, f"Job {n}").template
+            NotificationJob.objects.create(audience='subject_students', subject=subject,
+                                           template=template, created_by=self.teacher)
+
+
+def first_id(response):
+    if response.status_code != 200:
+        return None
+    # Cached catalog lists come back as plain JSON responses without .data
+    data = response.data if hasattr(response, 'data') else json.loads(response.content)
+    if isinstance(data, dict):
+        data = data.get('results', [])
+    return data[0]['id'] if data else None
+
+
+def resolve_kwargs(client, names, basename):
+    kwargs = {}
+    for name in ('quiz_pk', 'question_pk', 'subject_id'):
+        if name in names:
+            list_name, parents = PARENT_LISTS[name]
+            kwargs[name] = first_id(client.get(reverse(list_name, kwargs={k: kwargs[k] for k in parents})))
+    if 'pk' in names:
+        parents = {k: v for k, v in kwargs.items() if k != 'subject_id'}
+        kwargs['pk'] = first_id(client.get(reverse(f'{basename}-list', kwargs=parents)))
+    unknown = names - {'pk', *PARENT_LISTS}
+    assert not unknown, f"don't know how to fill {unknown}; add them to PARENT_LISTS"
+    return kwargs
+
+
+def measure(client, url):
+    with CaptureQueriesContext(connection) as ctx:
+        started = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - started
+    sql_time = sum(float(q['time']) for q in ctx.captured_queries)
+    return response, len(ctx), elapsed, sql_time
+
+
+def test_every_get_route_is_covered():
+    names = {name for name, _, _ in get_routes()}
+    assert {'subject-list', 'enrollments-list', 'quiz-questions-list', 'quiz-results-list',
+            'notifications-list', 'search', 'enrolled-students'} <= names
+    assert 'bulk-upload' not in names
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('role, name, names, basename', route_cases())
+def test_query_budget(role, name, names, basename, query_log):
+    data = Dataset()
+    data.grow(2)
+    client = APIClient()
+    client.force_authenticate(user=getattr(data, role))
+
+    kwargs = resolve_kwargs(client, names, basename)
+    if None in kwargs.values():
+        pytest.skip(f"{role} cannot see any object for {name}")
+    url = reverse(name, kwargs=kwargs)
+
+    # Also warms up per-process caches
+    if client.get(url).status_code == 403:
+        pytest.skip(f"{role} may not use {name}")
+    # Grow before both measurements, so endpoints served from stored
+    # snapshots are measured rebuilding them each time
+    data.grow(1)
+    response, small, _, _ = measure(client, url)
+    assert response.status_code == 200, f"{name} as {role} answered {response.status_code}"
+    data.grow(4)
+    response, large, elapsed, sql_time = measure(client, url)
+    query_log.append((f"{role}:{name}", response.status_code, small, large, elapsed, sql_time))
+    assert response.status_code == 200, f"{name} as {role} answered {response.status_code}"
+
+    budget = BUDGETS.get(name, DEFAULT_BUDGET)
+    assert large <= budget, f"{name} as {role} ran {large} queries (budget {budget})"
+    assert large <= small, f"{name} as {role} went from {small} to {large} queries as the data grew"
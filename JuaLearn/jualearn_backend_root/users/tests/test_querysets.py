@@ -0,0 +1,40 @@
+import pytest
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users.models import Enrollment, Notification
+from users.notifications import notify
+from users.querysets import build_plan, eager_load
+from users.serializers import EnrollmentSerializer, NotificationSerializer, QuizQuestionSerializer
+
+def test_plan_follows_nested_and_dotted_sources():
+    plan = build_plan(EnrollmentSerializer())
+    assert plan.select == {'student', 'subject'}
+    only = plan.only_fields()
+    # StudentSerializer has a method field, so every student column is kept
+    assert 'student__password' in only
+    assert 'subject__name' in only and 'subject__content' not in only
+
+    plan = build_plan(NotificationSerializer())
+    assert plan.select == {'template'}
+    assert set(plan.only_fields()) == {
+        'id', 'recipient', 'template', 'created_at', 'is_read',
+        'template__id', 'template__title', 'template__message', 'template__url', 'template__type',
+    }
+
+    plan = build_plan(QuizQuestionSerializer())
+    assert list(plan.prefetch) == ['choices']
+
+@pytest.mark.django_db
+def test_eager_load_renders_the_same_data(student_user, subject):
+    Enrollment.objects.create(student=student_user, subject=subject)
+    notify(student_user, "Hello", message="World")
+    client = APIClient()
+    client.force_authenticate(user=student_user)
+
+    response = client.get(reverse('enrollments-list'))
+    assert response.data[0]['subject']['name'] == "Mathematics"
+    assert response.data[0]['student']['id'] == student_user.id
+
+    queryset = eager_load(Notification.objects.all(), NotificationSerializer(), select_related=['recipient'])
+    assert NotificationSerializer(queryset, many=True).data[0]['message'] == "World"
+    assert queryset[0].recipient.username == student_user.username
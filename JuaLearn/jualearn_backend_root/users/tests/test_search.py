@@ -0,0 +1,186 @@
+import json
+import pytest
+from datetime import date
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users import search
+from users.models import User, Subject, Enrollment, Lesson, Quiz, QuizQuestion, Assignment, SearchDocument
+from users.importer import import_content
+
+
+@pytest.fixture
+def school(teacher_user, student_user):
+    admin = User.objects.create(username='boss', role='admin', is_staff=True)
+    other_teacher = User.objects.create(username='teacher2', role='teacher')
+    algebra = Subject.objects.create(name='Algebra', description="Equations and polynomials",
+                                     created_by=admin, published=True)
+    chemistry = Subject.objects.create(name='Chemistry', description="Molecules and reactions",
+                                       created_by=other_teacher, published=True)
+    Enrollment.objects.create(student=student_user, subject=algebra)
+    Lesson.objects.create(subject=algebra, title="Quadratic equations", created_by=teacher_user,
+                          content="A quadratic equation has the form ax^2 + bx + c = 0 and is solved by factoring.")
+    Lesson.objects.create(subject=chemistry, title="Balancing equations", created_by=other_teacher,
+                          content="Chemical equations keep the number of atoms the same on both sides.")
+    quiz = Quiz.objects.create(title="Polynomials check", subject=algebra, created_by=teacher_user,
+                               due_date=date(2030, 1, 1), published=True)
+    QuizQuestion.objects.create(quiz=quiz, text="Factor the quadratic x^2 - 1")
+    Assignment.objects.create(title="Factoring worksheet", subject=algebra, created_by=teacher_user,
+                              due_date=date(2030, 1, 1), published=False)
+    return {'admin': admin, 'algebra': algebra, 'chemistry': chemistry, 'quiz': quiz}
+
+
+def search_as(user, q, **params):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client.get(reverse('search'), {'q': q, **params})
+
+
+@pytest.mark.django_db
+def test_sqlite_uses_fts5_backend():
+    assert isinstance(search.get_backend(), search.SQLiteSearchBackend)
+
+
+@pytest.mark.django_db
+def test_documents_follow_saves_and_deletes(school):
+    quiz = school['quiz']
+    assert SearchDocument.objects.filter(kind='quiz', object_id=quiz.id, body__contains='quadratic').exists()
+
+    QuizQuestion.objects.create(quiz=quiz, text="Expand (x + 2)^2")
+    assert 'Expand' in SearchDocument.objects.get(kind='quiz', object_id=quiz.id).body
+
+    quiz.title = "Polynomial drill"
+    quiz.save()
+    assert SearchDocument.objects.get(kind='quiz', object_id=quiz.id).title == "Polynomial drill"
+    assert [doc.object_id for doc, _, _ in search.search(school['admin'], "drill", 10)] == [quiz.id]
+
+    quiz.delete()
+    assert not SearchDocument.objects.filter(kind='quiz', object_id=quiz.id).exists()
+    assert search.search(school['admin'], "drill", 10) == []
+
+
+@pytest.mark.django_db
+def test_subject_delete_drops_its_documents_set_wise(school, teacher_user):
+    algebra = school['algebra']
+    Lesson.objects.bulk_create(Lesson(subject=algebra, title=f"Lesson {i}", created_by=teacher_user)
+                               for i in range(20))
+    search.index('lesson', Lesson.objects.filter(subject=algebra).values_list('id', flat=True))
+    with CaptureQueriesContext(connection) as queries:
+        algebra.delete()
+    touching = [q['sql'] for q in queries.captured_queries if SearchDocument._meta.db_table in q['sql']]
+    # One read and one delete for the children, one delete for the subject's own document
+    assert len(touching) <= 4
+    assert not SearchDocument.objects.filter(subject_id=algebra.pk).exists()
+    assert SearchDocument.objects.filter(kind='lesson', title="Balancing equations").exists()
+
+
+@pytest.mark.django_db
+def test_search_ranks_title_matches_first_and_highlights(school):
+    response = search_as(school['admin'], "equations")
+    assert response.status_code == 200
+    results = response.data['results']
+    # Both lessons match in the title, the subject only in its description
+    assert {r['title'] for r in results[:2]} == {"Balancing equations", "Quadratic equations"}
+    assert results[2]['title'] == "Algebra"
+    assert results[0]['rank'] >= results[1]['rank'] > results[2]['rank']
+    assert '<mark>' in next(r['snippet'] for r in results if r['type'] == 'Lesson')
+    subject = next(r for r in results if r['type'] == 'Subject')
+    assert subject['name'] == "Algebra"
+
+
+@pytest.mark.django_db
+def test_search_matches_stems_and_prefixes(school):
+    response = search_as(school['admin'], "factor")
+    # "factoring" and "Factor" both stem to factor
+    assert {r['title'] for r in response.data['results']} == {"Quadratic equations", "Polynomials check", "Factoring worksheet"}
+    response = search_as(school['admin'], "polyno")
+    assert {r['title'] for r in response.data['results']} == {"Algebra", "Polynomials check"}
+
+
+@pytest.mark.django_db
+def test_search_results_follow_role_visibility(school, teacher_user, student_user):
+    def found(user, q):
+        return {(r['type'], r['title']) for r in search_as(user, q).data['results']}
+
+    # Students: published subjects, plus published content of the subjects they are enrolled in
+    assert found(student_user, "equations") == {('Subject', "Algebra"), ('Lesson', "Quadratic equations")}
+    assert found(student_user, "worksheet") == set()
+    # Teachers: their own content, plus published subjects created by admins
+    assert found(teacher_user, "equations") == {('Subject', "Algebra"), ('Lesson', "Quadratic equations")}
+    assert found(teacher_user, "worksheet") == {('Assignment', "Factoring worksheet")}
+    assert found(teacher_user, "molecules") == set()
+    assert found(school['admin'], "molecules") == {('Subject', "Chemistry")}
+
+
+@pytest.mark.django_db
+def test_search_pages_without_counting(school):
+    for i in range(5):
+        Lesson.objects.create(subject=school['algebra'], title=f"Linear equations {i}", content="Lines")
+    response = search_as(school['admin'], "equations", page_size=3)
+    first = [r['title'] for r in response.data['results']]
+    assert len(first) == 3 and response.data['previous'] is None
+    assert 'page=2' in response.data['next']
+
+    seen = first
+    url = response.data['next']
+    client = APIClient()
+    client.force_authenticate(user=school['admin'])
+    while url:
+        response = client.get(url)
+        seen.extend(r['title'] for r in response.data['results'])
+        url = response.data['next']
+    assert len(seen) == len(set(seen)) == 8
+
+    assert search_as(school['admin'], "equations", page='x').status_code == 400
+    assert search_as(school['admin'], "").data['results'] == []
+    assert search_as(school['admin'], '"AND (*').status_code == 200
+
+
+@pytest.mark.django_db
+def test_snippets_escape_html(school):
+    Lesson.objects.create(subject=school['algebra'], title="Markup", content="<script>alert(1)</script> vectors")
+    snippet = search_as(school['admin'], "vectors").data['results'][0]['snippet']
+    assert '<script>' not in snippet
+    assert '&lt;script&gt;' in snippet and '<mark>vectors</mark>' in snippet
+
+
+@pytest.mark.django_db
+def test_search_over_the_time_budget_returns_503(school, settings):
+    settings.SEARCH_TIMEOUT_MS = 0
+    response = search_as(school['admin'], "equations")
+    assert response.status_code == 503
+
+
+@pytest.mark.django_db
+def test_simple_backend_matches_like_fts(school):
+    backend = search.SimpleSearchBackend()
+    hits = backend.search(search.visible_documents(school['admin']), "quadratic equation", 10)
+    assert [doc.title for doc, _, _ in hits][0] == "Quadratic equations"
+    assert search.MATCH_START in hits[0][2]
+
+
+@pytest.mark.django_db
+def test_users_without_a_role_find_nothing(school):
+    nobody = User.objects.create(username='nobody')
+    assert search.search(nobody, "equations", 10) == []
+
+
+@pytest.mark.django_db
+def test_bulk_import_and_rebuild_index_documents(tmp_path):
+    admin_user = User.objects.create(username='boss', role='admin', is_staff=True)
+    (tmp_path / 'subjects.json').write_text(json.dumps([{"name": "Physics", "description": "Forces"}]))
+    (tmp_path / 'lessons.json').write_text(json.dumps([
+        {"subjectName": "Physics", "title": "Newton's laws", "content": "Inertia and momentum"},
+    ]))
+    (tmp_path / 'quizzes.json').write_text(json.dumps([
+        {"subjectName": "Physics", "title": "Forces quiz", "due_date": "2030-01-01",
+         "questions": [{"text": "What is momentum?", "choices": [{"text": "mv", "is_correct": True}]}]},
+    ]))
+    import_content(str(tmp_path), admin_user)
+    assert {d.title for d in SearchDocument.objects.all()} == {"Physics", "Newton's laws", "Forces quiz"}
+    assert {doc.title for doc, _, _ in search.search(admin_user, "momentum", 10)} == {"Newton's laws", "Forces quiz"}
+
+    SearchDocument.objects.all().delete()
+    assert search.rebuild() == 3
+    assert {doc.title for doc, _, _ in search.search(admin_user, "momentum", 10)} == {"Newton's laws", "Forces quiz"}
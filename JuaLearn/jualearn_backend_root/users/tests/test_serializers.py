@@ -30,3 +30,59 @@ def test_quiz_serializer_validation(subject, teacher_user):
     valid_data = {'title': 'Quiz 1', 'subject': subject.id, 'due_date': '2025-12-31'}
     serializer = QuizSerializer(data=valid_data)
     assert serializer.is_valid()
+
+@pytest.mark.django_db
+def test_fields_and_omit_trim_the_response_and_the_query(teacher_client, teacher_user, subject):
+    from datetime import date
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from users.models import Enrollment, Quiz
+    Quiz.objects.create(title="Quiz 1", subject=subject, created_by=teacher_user, due_date=date(2030, 1, 1))
+
+    with CaptureQueriesContext(connection) as queries:
+        response = teacher_client.get('/api/quizzes/?fields=id,title')
+    assert response.status_code == 200
+    assert response.data[0] == {'id': response.data[0]['id'], 'title': "Quiz 1"}
+    sql = queries[-1]['sql']
+    assert '"description"' not in sql and '"due_date"' not in sql
+
+    response = teacher_client.get('/api/quizzes/?omit=description,assigned_to')
+    assert 'description' not in response.data[0] and 'assigned_to' not in response.data[0]
+    assert response.data[0]['title'] == "Quiz 1"
+
+    # Dotted names trim nested serializers, and an omitted relation is not joined
+    student = User.objects.create_user(username='pupil', password='x', role='student')
+    Enrollment.objects.create(student=student, subject=subject)
+    with CaptureQueriesContext(connection) as queries:
+        response = teacher_client.get('/api/enrollments/?fields=id,subject.name&omit=student')
+    assert response.data[0] == {'id': response.data[0]['id'], 'subject': {'name': "Mathematics"}}
+    sql = queries[-1]['sql']
+    assert '"users_user"' not in sql and '"description"' not in sql
+
+@pytest.mark.django_db
+def test_expand_nests_declared_relations(teacher_client, teacher_user, subject):
+    from datetime import date
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from users.models import Assignment
+    for i in range(3):
+        Assignment.objects.create(title=f"A{i}", subject=subject, created_by=teacher_user, due_date=date(2030, 1, 1))
+
+    response = teacher_client.get('/api/assignments/')
+    assert response.data[0]['subject'] == subject.id
+
+    with CaptureQueriesContext(connection) as queries:
+        response = teacher_client.get('/api/assignments/?expand=subject,created_by,grade&fields=id,subject.name,created_by')
+    assert response.data[0]['subject'] == {'name': "Mathematics"}
+    assert response.data[0]['created_by'] == {
+        'id': teacher_user.id, 'username': 'teacher1', 'first_name': '', 'last_name': '',
+    }
+    # Joined into the list query rather than loaded per row
+    assert len([q for q in queries if 'users_assignment' in q['sql']]) == 1
+
+@pytest.mark.django_db
+def test_writes_ignore_the_field_selection(teacher_client, subject):
+    response = teacher_client.post('/api/assignments/?fields=id&expand=subject',
+                                   {'title': "Essay", 'subject': subject.id, 'due_date': '2030-01-01'})
+    assert response.status_code == 201
+    assert response.data['title'] == "Essay" and response.data['subject'] == subject.id
@@ -46,3 +46,74 @@ def test_quiz_creation_and_publish(teacher_client, subject):
     response = teacher_client.post(publish_url)
     assert response.status_code == 200
     assert 'students notified' in response.data['detail'].lower()
+
+@pytest.mark.django_db
+def test_assignment_is_one_row_per_subject_with_per_student_grades(teacher_client, subject):
+    from rest_framework.test import APIClient
+    from users.models import User, Enrollment, Assignment, Notification
+    alice = User.objects.create(username='alice', role='student', first_name='Alice', last_name='A')
+    bob = User.objects.create(username='bob', role='student', first_name='Bob', last_name='B')
+    outsider = User.objects.create(username='carol', role='student')
+    for student in (alice, bob):
+        Enrollment.objects.create(student=student, subject=subject)
+
+    response = teacher_client.post(reverse('assignments-list'), {
+        "title": "Essay", "subject": subject.id, "due_date": "2030-01-31",
+    })
+    assignment_id = response.data['id']
+    teacher_client.post(reverse('assignments-publish', kwargs={'pk': assignment_id}))
+    assert Assignment.objects.count() == 1
+
+    grade_url = reverse('assignments-grade', kwargs={'pk': assignment_id})
+    response = teacher_client.post(grade_url, {"student": alice.id, "grade": 85})
+    assert response.status_code == 200
+    assert response.data['grade'] == 85
+    assert Notification.objects.filter(recipient=alice, template__type='assignment_graded').exists()
+    assert teacher_client.post(grade_url, {"student": outsider.id, "grade": 50}).status_code == 400
+    assert teacher_client.post(grade_url, {"student": bob.id, "grade": 101}).status_code == 400
+
+    response = teacher_client.get(reverse('assignments-submissions', kwargs={'pk': assignment_id}))
+    assert [(s['id'], s['grade']) for s in response.data] == [(alice.id, 85), (bob.id, None)]
+
+    client = APIClient()
+    client.force_authenticate(user=bob)
+    response = client.post(reverse('submit-assignment', kwargs={'assignment_id': assignment_id}))
+    assert response.status_code == 200
+    response = client.get(reverse('assignments-list'))
+    assert [(a['id'], a['grade']) for a in response.data] == [(assignment_id, None)]
+    assert response.data[0]['submitted_at'] is not None
+    assert client.get(reverse('student-assignment-grades')).data == []
+
+    client.force_authenticate(user=alice)
+    response = client.get(reverse('student-assignment-grades'))
+    assert [(a['id'], a['grade']) for a in response.data] == [(assignment_id, 85)]
+
+    client.force_authenticate(user=outsider)
+    assert client.get(reverse('assignments-list')).data == []
+    response = client.post(reverse('submit-assignment', kwargs={'assignment_id': assignment_id}))
+    assert response.status_code == 404
+
+@pytest.mark.django_db
+def test_quiz_results_are_created_on_submission(teacher_client, subject):
+    from rest_framework.test import APIClient
+    from users.models import User, Enrollment, QuizResult
+    alice = User.objects.create(username='alice', role='student', first_name='Alice', last_name='A')
+    bob = User.objects.create(username='bob', role='student', first_name='Bob', last_name='B')
+    Enrollment.objects.create(student=alice, subject=subject)
+
+    response = teacher_client.post(reverse('quiz-list'), {"title": "Quiz", "subject": subject.id, "due_date": "2030-01-31"})
+    quiz_id = response.data['id']
+    teacher_client.post(reverse('quiz-publish', kwargs={'pk': quiz_id}))
+    assert not QuizResult.objects.exists()
+
+    # Students who enroll after the quiz was created count too
+    Enrollment.objects.create(student=bob, subject=subject)
+    pending_url = reverse('quiz-pending', kwargs={'pk': quiz_id})
+    assert [s['id'] for s in teacher_client.get(pending_url).data] == [alice.id, bob.id]
+
+    client = APIClient()
+    client.force_authenticate(user=bob)
+    assert client.post(reverse('quiz-submit', kwargs={'pk': quiz_id}), {'answers': []}, format='json').status_code == 200
+    assert QuizResult.objects.get(quiz_id=quiz_id).student == bob
+    assert [s['id'] for s in teacher_client.get(pending_url).data] == [alice.id]
+    assert client.get(pending_url).status_code == 403
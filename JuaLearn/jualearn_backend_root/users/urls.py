@@ -6,8 +6,8 @@ from .views import (
     RegisterStudentView, TeacherRegisterView,
     MeView, MyProfileView, SearchView,
     AdminLoginView, NotificationViewSet, QuizViewSet, StudentListViewSet, EnrollmentViewSet, StudentAssignmentGradesView, StudentQuizGradesView,
-    SubmitQuizView, StudentQuizViewSet, StudentEnrollmentViewSet, EnrolledStudentsList, LessonViewSet, bulk_upload, SubmitAssignmentView,
-    QuizQuestionViewSet, QuizChoiceViewSet
+    SubmitQuizView, StudentQuizViewSet, StudentEnrollmentViewSet, EnrolledStudentsList, LessonViewSet, bulk_upload, SubmitAssignmentView, AutocompleteView, StudentDashboardView,
+    QuizQuestionViewSet, QuizChoiceViewSet, AnswerKeyCacheStatsView, NotificationJobViewSet, SyncView
 )
 
 router = DefaultRouter()
@@ -16,6 +16,7 @@ router.register(r'subjects', SubjectViewSet)
 router.register(r'users', UserViewSet)
 router.register(r'quizzes', QuizViewSet, basename='quiz')
 router.register(r'notifications', NotificationViewSet, basename='notifications')
+router.register(r'notification-jobs', NotificationJobViewSet, basename='notification-jobs')
 router.register(r'students', StudentListViewSet, basename='students')
 router.register(r'enrollments', EnrollmentViewSet, basename='enrollments')
 router.register(r'quiz-results', QuizResultViewSet, basename='quiz-results')
@@ -38,14 +39,18 @@ urlpatterns = [
     path('me/', MeView.as_view(), name='me'),
     path('profile/', MyProfileView.as_view(), name='my-profile'),
     path('search/', SearchView.as_view(), name="search"),
+    path('search/autocomplete/', AutocompleteView.as_view(), name="search-autocomplete"),
+    path('sync/', SyncView.as_view(), name="sync"),
     path('auth/admin-login/', AdminLoginView.as_view(), name='admin_login'),
     path('api/', include(router.urls)),
     path('student/grades/assignments/', StudentAssignmentGradesView.as_view(), name='student-assignment-grades'),
     path('student/grades/quizzes/', StudentQuizGradesView.as_view(), name='student-quiz-grades'),
+    path('student/dashboard/', StudentDashboardView.as_view(), name='student-dashboard'),
     path('quizzes/<int:quiz_id>/submit/', SubmitQuizView.as_view(), name='submit-quiz'),
       path('assignments/<int:assignment_id>/submit/', SubmitAssignmentView.as_view(), name='submit-assignment'),
     path('subjects/<int:subject_id>/enrolled_students/', EnrolledStudentsList.as_view(), name='enrolled-students'),
     path('bulk-upload/', bulk_upload, name='bulk-upload'),
+    path('cache/answer-keys/', AnswerKeyCacheStatsView.as_view(), name='answer-key-cache-stats'),
 ]
 
 urlpatterns += quizzes_router.urls
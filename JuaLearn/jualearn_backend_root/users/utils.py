@@ -1,28 +1,72 @@
-from .models import QuizQuestion, QuizChoice, StudentAnswer, QuizResult
+from django.db import transaction
+from .models import StudentAnswer, QuizResult
+from .answer_keys import answer_key_cache
 
-def grade_quiz(student, quiz, answers):
-    total_questions = quiz.questions.count()
+
+def load_answer_key(quiz):
+    """
+    Load the answer key of a quiz in a single query.
+
+    Returns a dict mapping every question id of the quiz to a dict of
+    {choice_id: is_correct} for that question. Questions without choices
+    are included with an empty dict so they still count towards the total.
+    """
+    answer_key = {}
+    rows = quiz.questions.values_list('id', 'choices__id', 'choices__is_correct')
+    for question_id, choice_id, is_correct in rows:
+        choices = answer_key.setdefault(question_id, {})
+        if choice_id is not None:
+            choices[choice_id] = is_correct
+    return answer_key
+
+
+def score_answers(answer_key, answers):
+    """
+    Validate and score an answer payload against an answer key in memory.
+
+    Answers referring to unknown questions, or to choices that do not belong
+    to their question, are ignored. Only the first answer per question counts.
+    Returns (valid_answers, correct_count) where valid_answers is a list of
+    (question_id, choice_id) tuples.
+    """
+    valid_answers = []
+    answered = set()
     correct_count = 0
 
     for ans in answers:
         try:
-            question = QuizQuestion.objects.get(id=ans['question_id'], quiz=quiz)
-            choice = QuizChoice.objects.get(id=ans['choice_id'], question=question)
-            StudentAnswer.objects.create(
-                student=student,
-                question=question,
-                selected_choice=choice
-            )
-            if choice.is_correct:
-                correct_count += 1
-        except (QuizQuestion.DoesNotExist, QuizChoice.DoesNotExist):
+            question_id = int(ans['question_id'])
+            choice_id = int(ans['choice_id'])
+        except (KeyError, TypeError, ValueError):
             continue
+        choices = answer_key.get(question_id)
+        if choices is None or choice_id not in choices or question_id in answered:
+            continue
+        answered.add(question_id)
+        valid_answers.append((question_id, choice_id))
+        if choices[choice_id]:
+            correct_count += 1
+
+    return valid_answers, correct_count
+
+
+def grade_quiz(student, quiz, answers):
+    answer_key = answer_key_cache.get(quiz, load_answer_key)
+    valid_answers, correct_count = score_answers(answer_key, answers)
 
+    total_questions = len(answer_key)
     grade = int((correct_count / total_questions) * 100) if total_questions else 0
 
-    quiz_result, created = QuizResult.objects.update_or_create(
-        student=student,
-        quiz=quiz,
-        defaults={'grade': grade}
-    )
+    with transaction.atomic():
+        # A resubmission replaces the student's answers, so analytics count each student once
+        StudentAnswer.objects.filter(student=student, question_id__in=list(answer_key)).delete()
+        StudentAnswer.objects.bulk_create([
+            StudentAnswer(student=student, question_id=question_id, selected_choice_id=choice_id)
+            for question_id, choice_id in valid_answers
+        ])
+        quiz_result, created = QuizResult.objects.update_or_create(
+            student=student,
+            quiz=quiz,
+            defaults={'grade': grade}
+        )
     return quiz_result
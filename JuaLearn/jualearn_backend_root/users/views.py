@@ -2,25 +2,36 @@ from rest_framework import viewsets, permissions, status, serializers
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Exists, F, FilteredRelation, OuterRef, Q
+from django.utils import timezone
 from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.decorators import action, api_view, permission_classes
 from django.contrib.auth import get_user_model, authenticate
-from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Assignment, Subject, User, Notification, Quiz, Enrollment, QuizResult, Lesson, QuizQuestion, QuizChoice
+from .models import Assignment, AssignmentSubmission, Subject, User, Notification, Quiz, Enrollment, QuizResult, Lesson, QuizQuestion, QuizChoice, NotificationJob
 from .serializers import (
     AssignmentSerializer, SubjectSerializer, MyTokenObtainPairSerializer,
     UserSerializer, UserProfileSerializer, UserRegisterSerializer, StudentSerializer, TeacherRegisterSerializer,
-    NotificationSerializer, QuizSerializer, EnrollmentSerializer, QuizResultSerializer, LessonSerializer, QuizQuestionSerializer, QuizChoiceSerializer)
+    NotificationSerializer, QuizSerializer, EnrollmentSerializer, QuizResultSerializer, LessonSerializer, LessonSummarySerializer, QuizQuestionSerializer, QuizChoiceSerializer,
+    NotificationJobSerializer, AssignmentStudentSerializer, AssignmentGradeSerializer)
 from rest_framework import generics
 from .permissions import IsAdminTeacherOrReadOnlyForStudent
 from .utils import grade_quiz 
+from .answer_keys import answer_key_cache, bump_quiz_version
+from .authentication import full_user
+from .notifications import enqueue_fanout, notify, adjust_unread, mark_all_read
+from .pagination import KeysetPagination
+from .querysets import EagerLoadingMixin, eager_load
+from .importer import import_content
+from . import analytics, autocomplete, bundles, catalog, changes, dashboard, lessons, progress, search
+from .catalog import CatalogCacheMixin
+from django.http import HttpResponse, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
 from django.conf import settings
-import json
-import os
 
 
 User = get_user_model()
@@ -38,7 +49,7 @@ class TeacherRegisterView(generics.CreateAPIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 # --------- STUDENT LIST VIEW ---------
-class StudentListViewSet(viewsets.ReadOnlyModelViewSet):
+class StudentListViewSet(EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = UserSerializer
 
@@ -46,7 +57,7 @@ class StudentListViewSet(viewsets.ReadOnlyModelViewSet):
         return User.objects.filter(role='student')
 
 # --------- ASSIGNMENT ---------
-class AssignmentViewSet(viewsets.ModelViewSet):
+class AssignmentViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Assignment.objects.all()
     serializer_class = AssignmentSerializer
     permission_classes = [IsAdminTeacherOrReadOnlyForStudent]
@@ -54,7 +65,11 @@ class AssignmentViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.role == 'student':
-            return Assignment.objects.filter(assigned_to=user, published=True)
+            # Every published assignment of the student's subjects, with their own submission joined in
+            return (Assignment.objects
+                    .filter(subject__enrollment__student=user, published=True)
+                    .annotate(mine=FilteredRelation('submissions', condition=Q(submissions__student=user)))
+                    .annotate(grade=F('mine__grade'), submitted_at=F('mine__submitted_at')))
         elif user.role == 'teacher':
             return Assignment.objects.filter(created_by=user)
         elif user.role == 'admin':
@@ -64,61 +79,35 @@ class AssignmentViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         if self.request.user.role not in ['teacher', 'admin']:
             raise PermissionDenied("Only teachers or admins can create assignments.")
-
-        validated_data = serializer.validated_data
-        title = validated_data['title']
-        subject = validated_data['subject']
-        due_date = validated_data['due_date']
-
-        # Create base assignment
-        base_assignment = Assignment.objects.create(
-            title=title,
-            subject=subject,
-            due_date=due_date,
-            created_by=self.request.user,
-            assigned_to=None,
-            grade=None,
-            published=False
-        )
-
-        # Bulk create for enrolled students
-        enrolled_students = Enrollment.objects.filter(subject=subject).values_list('student', flat=True)
-        assignments = [
-            Assignment(
-                title=base_assignment.title,
-                subject=base_assignment.subject,
-                created_by=base_assignment.created_by,
-                due_date=base_assignment.due_date,
-                assigned_to_id=student_id,
-                grade=None,
-                published=False
-            ) for student_id in enrolled_students
-        ]
-        Assignment.objects.bulk_create(assignments)
-
-        # Inject base_assignment into serializer._instance
-        serializer.instance = base_assignment
+        # One row for the whole subject; submissions are created when students submit or get graded
+        serializer.save(created_by=self.request.user, published=False)
 
         # Notifications are sent only when published, not on create
 
     def perform_update(self, serializer):
         assignment = serializer.save()
-        Notification.objects.create(
-            recipient=assignment.assigned_to,
-            title=f"Assignment Updated: {assignment.title}",
-            message=f"Your assignment in {assignment.subject.name} was updated.",
-            url=f"/student/assignments/{assignment.id}/",
-            type="assignment_update"
-        )
+        if assignment.published:
+            enqueue_fanout(
+                'subject_students',
+                title=f"Assignment Updated: {assignment.title}",
+                message=f"Your assignment in {assignment.subject.name} was updated.",
+                url=f"/student/assignments/{assignment.id}/",
+                type="assignment_update",
+                subject=assignment.subject,
+                created_by=self.request.user,
+            )
 
     def perform_destroy(self, instance):
-        Notification.objects.create(
-            recipient=instance.assigned_to,
-            title=f"Assignment Deleted: {instance.title}",
-            message=f"Your assignment in {instance.subject.name} was deleted.",
-            url="",
-            type="assignment_delete"
-        )
+        if instance.published:
+            enqueue_fanout(
+                'subject_students',
+                title=f"Assignment Deleted: {instance.title}",
+                message=f"Your assignment in {instance.subject.name} was deleted.",
+                url="",
+                type="assignment_delete",
+                subject=instance.subject,
+                created_by=self.request.user,
+            )
         instance.delete()
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
@@ -130,26 +119,68 @@ class AssignmentViewSet(viewsets.ModelViewSet):
         assignment.published = True
         assignment.save()
 
-        enrolled_students = Enrollment.objects.filter(subject=assignment.subject).values_list('student', flat=True)
-        notifications = [
-            Notification(
-                recipient_id=student_id,
-                title=f"Assignment Published: {assignment.title}",
-                message=f"A new assignment '{assignment.title}' has been published in {assignment.subject.name}.",
+        job = enqueue_fanout(
+            'subject_students',
+            title=f"Assignment Published: {assignment.title}",
+            message=f"A new assignment '{assignment.title}' has been published in {assignment.subject.name}.",
+            url=f"/student/assignments/{assignment.id}/",
+            type="assignment_published",
+            subject=assignment.subject,
+            created_by=user,
+        )
+        return Response({'detail': 'Assignment published and students notified.', 'job_id': job.id})
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def submissions(self, request, pk=None):
+        """
+        Every student enrolled in the subject, with their submission and grade if they have one.
+        """
+        assignment = self.get_object()
+        if request.user.role == 'student':
+            raise PermissionDenied("Only teachers or admins can view submissions.")
+        students = (User.objects
+                    .filter(enrollment__subject=assignment.subject_id)
+                    .annotate(submission=FilteredRelation(
+                        'assignment_submissions', condition=Q(assignment_submissions__assignment=assignment)))
+                    .annotate(submission_id=F('submission__id'), submitted_at=F('submission__submitted_at'),
+                              grade=F('submission__grade'))
+                    .order_by('last_name', 'first_name', 'id'))
+        return Response(AssignmentStudentSerializer(students, many=True).data)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def grade(self, request, pk=None):
+        assignment = self.get_object()
+        user = request.user
+        if not (user.role == 'admin' or (user.role == 'teacher' and assignment.created_by_id == user.id)):
+            raise PermissionDenied("Not authorized to grade this assignment.")
+        serializer = AssignmentGradeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        student = serializer.validated_data['student']
+        if not Enrollment.objects.filter(student=student, subject=assignment.subject_id).exists():
+            raise serializers.ValidationError({"student": "Student is not enrolled in this subject."})
+
+        with transaction.atomic():
+            submission, _ = AssignmentSubmission.objects.update_or_create(
+                assignment=assignment, student=student,
+                defaults={'grade': serializer.validated_data['grade'], 'graded_at': timezone.now()},
+            )
+            notify(
+                recipient=student,
+                title=f"Assignment Graded: {assignment.title}",
+                message=f"Your assignment in {assignment.subject.name} has been graded. Your grade: {submission.grade}",
                 url=f"/student/assignments/{assignment.id}/",
-                type="assignment_published"
+                type="assignment_graded",
             )
-            for student_id in enrolled_students
-        ]
-        Notification.objects.bulk_create(notifications)
-        return Response({'detail': 'Assignment published and students notified.'})
+        return Response({'student': student.id, 'grade': submission.grade, 'graded_at': submission.graded_at})
 
         
 # --------- SUBJECT ---------
-class SubjectViewSet(viewsets.ModelViewSet):
+class SubjectViewSet(CatalogCacheMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
     permission_classes = [IsAdminTeacherOrReadOnlyForStudent]
+    # Students all see the same published subjects
+    catalog_scope = 'published'
     def get_queryset(self):
         user = self.request.user
         if user.role == 'teacher':
@@ -164,19 +195,19 @@ class SubjectViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         subject = serializer.save(created_by=self.request.user)
-        
-        students = User.objects.filter(role='student')
-        notifications = [
-            Notification(
-                recipient=student,
-                title=f"New Subject Added: {subject.name}",
-                message=f"A new subject '{subject.name}' has been added. Check it out!",
-                url=f"/student/subject/{subject.id}/",
-                type="subject"
-            )
-            for student in students
-        ]
-        Notification.objects.bulk_create(notifications)
+        enqueue_fanout(
+            'all_students',
+            title=f"New Subject Added: {subject.name}",
+            message=f"A new subject '{subject.name}' has been added. Check it out!",
+            url=f"/student/subject/{subject.id}/",
+            type="subject",
+            subject=subject,
+            created_by=self.request.user,
+        )
+
+    def perform_update(self, serializer):
+        subject = serializer.save()
+        catalog.bump(subject.id)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def publish(self, request, pk=None):
@@ -188,25 +219,82 @@ class SubjectViewSet(viewsets.ModelViewSet):
 
         subject.published = True
         subject.save()
+        catalog.bump(subject.id)
+
+        job = enqueue_fanout(
+            'all_students',
+            title=f"Course Published: {subject.name}",
+            message=f"The course '{subject.name}' is now published and open for enrollment.",
+            url=f"/student/subject/{subject.id}",
+            type="subject_published",
+            subject=subject,
+            created_by=user,
+        )
 
-        students = User.objects.filter(role='student')
-        notifications = [
-            Notification(
-                recipient=student,
-                title=f"Course Published: {subject.name}",
-                message=f"The course '{subject.name}' is now published and open for enrollment.",
-                url=f"/student/subject/{subject.id}",
-                type="subject_published"
-            )
-            for student in students
-        ]
-        Notification.objects.bulk_create(notifications)
+        return Response({'detail': 'Subject published and students notified.', 'job_id': job.id})
 
-        return Response({'detail': 'Subject published and students notified.'})
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def gradebook(self, request, pk=None):
+        """
+        Grades of every enrolled student in the subject's quizzes and assignments.
+        Teachers see the columns for the ones they created.
+        """
+        subject = self.get_object()
+        user = request.user
+        if user.role not in ('teacher', 'admin'):
+            raise PermissionDenied("Only teachers or admins can view the gradebook.")
+        return Response(analytics.subject_gradebook(subject, teacher=user if user.role == 'teacher' else None))
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def leaderboard(self, request, pk=None):
+        """
+        The subject's top students by average grade (?limit=), for its
+        teachers and admins and for the students enrolled in it.
+        """
+        subject = self.get_object()
+        user = request.user
+        if user.role == 'student' and not Enrollment.objects.filter(student=user, subject=subject).exists():
+            raise PermissionDenied("Only students enrolled in this subject can view its leaderboard.")
+        try:
+            limit = min(max(int(request.GET.get("limit", settings.LEADERBOARD_SIZE)), 1), settings.LEADERBOARD_MAX_SIZE)
+        except ValueError:
+            raise serializers.ValidationError({"limit": "Must be a number."})
+        return Response(progress.leaderboard(subject, limit))
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def bundle(self, request, pk=None):
+        """
+        The subject's offline bundle, or with ?since=<version> only what changed
+        since that version (see users/bundles.py).
+        """
+        subject = self.get_object()
+        user = request.user
+        if user.role == 'student' and not Enrollment.objects.filter(student=user, subject=subject).exists():
+            raise PermissionDenied("Only students enrolled in this subject can download it.")
+        try:
+            since = int(request.GET['since']) if request.GET.get('since') else None
+        except ValueError:
+            raise serializers.ValidationError({"since": "Must be a bundle version."})
+
+        bundle, base, encoded = bundles.encoded_delta(subject, since)
+        encoding = lessons.pick_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        etag = f'"{bundle.digest[:32]}-{base if base is not None else "full"}"'
+        if encoding != 'identity':
+            etag = f'{etag[:-1]}-{encoding}"'
+        if catalog.not_modified(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(encoded[encoding], content_type='application/json')
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Accept-Encoding', 'Authorization'])
+        return response
 
 # --------- QUIZ ---------
 
-class QuizViewSet(viewsets.ModelViewSet):
+class QuizViewSet(CatalogCacheMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Quiz.objects.all()
     serializer_class = QuizSerializer
     permission_classes = [IsAdminTeacherOrReadOnlyForStudent]
@@ -233,18 +321,18 @@ class QuizViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         if self.request.user.role != 'teacher':
             raise PermissionDenied("Only teachers can create quizzes.")
-        # Save quiz as unpublished initially
+        # Save quiz as unpublished initially. Results are created when students
+        # submit; the pending action lists who hasn't yet.
         quiz = serializer.save(created_by=self.request.user, assigned_to=None, published=False)
-
-        enrolled_students = Enrollment.objects.filter(subject=quiz.subject).values_list('student', flat=True)
-        quiz_results = [QuizResult(student_id=student_id, quiz=quiz) for student_id in enrolled_students]
-        QuizResult.objects.bulk_create(quiz_results)
+        catalog.bump(quiz.subject_id)
 
         # Notifications will be sent on publish, not on create
 
     def perform_update(self, serializer):
+        previous_subject_id = serializer.instance.subject_id
         quiz = serializer.save()
-        Notification.objects.create(
+        catalog.bump(previous_subject_id, quiz.subject_id)
+        notify(
             recipient=quiz.created_by,
             title=f"Quiz Updated: {quiz.title}",
             message=f"A quiz in {quiz.subject.name} was updated.",
@@ -253,16 +341,17 @@ class QuizViewSet(viewsets.ModelViewSet):
         )
 
     def perform_destroy(self, instance):
-        enrolled_students = Enrollment.objects.filter(subject=instance.subject).values_list('student', flat=True)
-        for student_id in enrolled_students:
-            Notification.objects.create(
-                recipient_id=student_id,
-                title=f"Quiz Deleted: {instance.title}",
-                message=f"A quiz in {instance.subject.name} was deleted.",
-                url="",
-                type="quiz_delete"
-            )
+        enqueue_fanout(
+            'subject_students',
+            title=f"Quiz Deleted: {instance.title}",
+            message=f"A quiz in {instance.subject.name} was deleted.",
+            url="",
+            type="quiz_delete",
+            subject=instance.subject,
+            created_by=self.request.user,
+        )
         instance.delete()
+        catalog.bump(instance.subject_id)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def publish(self, request, pk=None):
@@ -272,28 +361,51 @@ class QuizViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'Not authorized to publish this quiz.'}, status=403)
         quiz.published = True
         quiz.save()
+        catalog.bump(quiz.subject_id)
+
+        job = enqueue_fanout(
+            'subject_students',
+            title=f"Quiz Published: {quiz.title}",
+            message=f"A new quiz '{quiz.title}' has been published in {quiz.subject.name}.",
+            url=f"/student/quizzes/{quiz.id}/",
+            type="quiz_published",
+            subject=quiz.subject,
+            created_by=user,
+        )
+        return Response({'detail': 'Quiz published and students notified.', 'job_id': job.id})
 
-        enrolled_students = Enrollment.objects.filter(subject=quiz.subject).values_list('student', flat=True)
-        notifications = [
-            Notification(
-                recipient_id=student_id,
-                title=f"Quiz Published: {quiz.title}",
-                message=f"A new quiz '{quiz.title}' has been published in {quiz.subject.name}.",
-                url=f"/student/quizzes/{quiz.id}/",
-                type="quiz_published"
-            )
-            for student_id in enrolled_students
-        ]
-        Notification.objects.bulk_create(notifications)
-        return Response({'detail': 'Quiz published and students notified.'})
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def analytics(self, request, pk=None):
+        """
+        Score distribution, summary statistics, per-question difficulty and choice frequencies.
+        """
+        quiz = self.get_object()
+        if request.user.role not in ('teacher', 'admin'):
+            raise PermissionDenied("Only teachers or admins can view quiz analytics.")
+        return Response(analytics.quiz_analytics(quiz))
 
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def questions(self, request, pk=None):
         quiz = self.get_object()
-        questions = quiz.questions.all()
+        questions = eager_load(quiz.questions.all(), QuizQuestionSerializer())
         serializer = QuizQuestionSerializer(questions, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def pending(self, request, pk=None):
+        """
+        Students enrolled in the quiz's subject who have no result for it yet.
+        """
+        quiz = self.get_object()
+        if request.user.role == 'student':
+            raise PermissionDenied("Only teachers or admins can see who hasn't submitted.")
+        submitted = QuizResult.objects.filter(quiz=quiz, student=OuterRef('pk'))
+        students = (User.objects
+                    .filter(enrollment__subject=quiz.subject_id)
+                    .filter(~Exists(submitted))
+                    .order_by('last_name', 'first_name', 'id'))
+        return Response(StudentSerializer(students, many=True).data)
+
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def submit(self, request, pk=None):
         quiz = self.get_object()
@@ -304,7 +416,7 @@ class QuizViewSet(viewsets.ModelViewSet):
         quiz_result = grade_quiz(student, quiz, answers)
 
         # Notify teacher about submission to grade
-        Notification.objects.create(
+        notify(
             recipient=quiz.created_by,
             title=f"Quiz Submitted: {quiz.title}",
             message=f"{student.username} submitted the quiz '{quiz.title}'. Please grade it.",
@@ -313,7 +425,7 @@ class QuizViewSet(viewsets.ModelViewSet):
         )
 
         # Notify student of their graded quiz
-        Notification.objects.create(
+        notify(
             recipient=student,
             title=f"Quiz Graded: {quiz.title}",
             message=f"Your quiz in {quiz.subject.name} has been graded. Your score: {quiz_result.grade}%",
@@ -325,17 +437,58 @@ class QuizViewSet(viewsets.ModelViewSet):
 
 
 # --------- NOTIFICATIONS ---------
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
-        print(f"[NotificationViewSet] User: {user}, role: {getattr(user, 'role', None)}")
         return Notification.objects.filter(recipient=user)
 
     def perform_update(self, serializer):
-        serializer.save()
+        is_read = serializer.validated_data.get('is_read')
+        with transaction.atomic():
+            # Only the request whose UPDATE flips the row moves the counter, however many race
+            flipped = is_read is not None and Notification.objects.filter(
+                pk=serializer.instance.pk, is_read=not is_read).update(is_read=is_read)
+            notification = serializer.save()
+            if flipped:
+                adjust_unread(notification.recipient_id, -1 if is_read else 1)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # Same for deletes: marking it read first tells whether this request took it off the count
+            was_unread = Notification.objects.filter(pk=instance.pk, is_read=False).update(is_read=True)
+            instance.delete()
+            if was_unread:
+                adjust_unread(instance.recipient_id, -1)
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        count = User.objects.filter(pk=request.user.pk).values_list('unread_notifications', flat=True).first()
+        return Response({'unread_count': count or 0})
+
+    @action(detail=False, methods=['post'])
+    def mark_all_read(self, request):
+        updated = mark_all_read(request.user)
+        return Response({'updated': updated})
+
+
+class NotificationJobViewSet(EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Progress and failure reporting for notification fan-out jobs.
+    """
+    serializer_class = NotificationJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.role == 'admin' or user.is_staff:
+            return NotificationJob.objects.all()
+        elif user.role == 'teacher':
+            return NotificationJob.objects.filter(created_by=user)
+        return NotificationJob.objects.none()
 
 # --------- AUTH/JWT ---------
 class MyTokenObtainPairView(TokenObtainPairView):
@@ -352,7 +505,7 @@ class AdminLoginView(APIView):
         user = authenticate(username=username, password=password)
         print(f"[AdminLoginView] Authenticated user: {user}, role: {getattr(user, 'role', None) if user else None}")
         if user is not None and (getattr(user, "role", None) == "admin" or user.is_staff or user.is_superuser):
-            refresh = RefreshToken.for_user(user)
+            refresh = MyTokenObtainPairSerializer.get_token(user)
             return Response({
                 "id": user.id,
                 "username": user.username,
@@ -375,7 +528,7 @@ class RegisterStudentView(generics.CreateAPIView):
         serializer.save(role='student')
 
 # --------- USER MANAGEMENT ---------
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
@@ -391,36 +544,95 @@ class MyProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        return full_user(self.request.user)
 
 class MeView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        return Response(UserSerializer(request.user).data)
+        return Response(UserSerializer(full_user(request.user)).data)
 
 # --------- SEARCH ---------
 class SearchView(APIView):
+    """
+    Ranked full-text search over the subjects, lessons, quizzes and
+    assignments the user can see, one page at a time (?q=&page=&page_size=).
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        q = request.GET.get("q", "")
-        subjects = Subject.objects.filter(name__icontains=q)
-        assignments = Assignment.objects.filter(title__icontains=q)
+        q = request.GET.get("q", "").strip()
+        try:
+            page = max(int(request.GET.get("page", 1)), 1)
+            page_size = min(max(int(request.GET.get("page_size", settings.SEARCH_PAGE_SIZE)), 1), settings.SEARCH_MAX_PAGE_SIZE)
+        except ValueError:
+            raise serializers.ValidationError({"detail": "page and page_size must be numbers."})
+        if not q:
+            return Response({"results": [], "next": None, "previous": None})
+
+        try:
+            # One extra row tells whether there is a next page without counting every match
+            hits = search.search(request.user, q, page_size + 1, (page - 1) * page_size)
+        except search.SearchTimeout:
+            return Response({"detail": "Search took too long, try a more specific query."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
         data = []
-        data.extend([
-            {"id": s.id, "name": s.name, "type": "Subject"}
-            for s in subjects
-        ])
-        data.extend([
-            {"id": a.id, "title": a.title, "type": "Assignment"}
-            for a in assignments
-        ])
-        return Response({"results": data})
+        for doc, rank, snippet in hits[:page_size]:
+            item = {"id": doc.object_id, "type": doc.get_kind_display(), "title": doc.title,
+                    "subject": doc.subject_id, "snippet": snippet, "rank": rank}
+            if doc.kind == 'subject':
+                item["name"] = doc.title
+            data.append(item)
+        url = request.build_absolute_uri()
+        return Response({
+            "results": data,
+            "next": replace_query_param(url, 'page', page + 1) if len(hits) > page_size else None,
+            "previous": replace_query_param(url, 'page', page - 1) if page > 1 else None,
+        })
+
+
+class AutocompleteView(APIView):
+    """
+    Title suggestions for the search box (?q=&limit=), answered from the
+    in-memory prefix index rather than the database.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        q = request.GET.get("q", "")
+        try:
+            limit = min(max(int(request.GET.get("limit", settings.AUTOCOMPLETE_LIMIT)), 1), settings.AUTOCOMPLETE_MAX_LIMIT)
+        except ValueError:
+            raise serializers.ValidationError({"detail": "limit must be a number."})
+        entries = autocomplete.suggest(request.user, q, limit) if q.strip() else []
+        return Response({"results": [
+            {"id": e.object_id, "type": e.kind.title(), "title": e.title, "subject": e.subject_id}
+            for e in entries
+        ]})
+
+
+# --------- SYNC ---------
+class SyncView(APIView):
+    """
+    Everything the caller can see that changed after ?cursor= (0 for
+    everything), one entry per row, deletions as tombstones. Pass the
+    returned cursor to the next call; has_more means call again straight away.
+    Subjects listed in resync should be fetched again from their bundle.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            cursor = max(int(request.GET.get("cursor", 0)), 0)
+            limit = min(max(int(request.GET.get("limit", settings.SYNC_PAGE_SIZE)), 1), settings.SYNC_MAX_PAGE_SIZE)
+        except ValueError:
+            raise serializers.ValidationError({"detail": "cursor and limit must be numbers."})
+        return Response(changes.feed(request.user, cursor, limit))
 
 
 # --------- ENROLLMENT ---------
-class EnrollmentViewSet(viewsets.ModelViewSet):
+class EnrollmentViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = EnrollmentSerializer
 
@@ -442,7 +654,7 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
 
         teacher = enrollment.subject.created_by
         if teacher is not None:
-            Notification.objects.create(
+            notify(
                 recipient=teacher,
                 title=f"New Enrollment: {enrollment.student.username}",
                 message=f"{enrollment.student.username} enrolled in {enrollment.subject.name}.",
@@ -456,7 +668,7 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
 
 
 # ------------Quiz Result------------
-class QuizResultViewSet(viewsets.ModelViewSet):
+class QuizResultViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = QuizResult.objects.all()
     serializer_class = QuizResultSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -465,7 +677,10 @@ class QuizResultViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if user.role == 'student':
             return QuizResult.objects.filter(student=user)
-        elif user.role in ['teacher', 'admin']:
+        elif user.role == 'teacher':
+            # Only the results of their own quizzes
+            return QuizResult.objects.filter(quiz__created_by=user)
+        elif user.role == 'admin':
             return QuizResult.objects.all()
         return QuizResult.objects.none()
 
@@ -480,17 +695,19 @@ class QuizResultViewSet(viewsets.ModelViewSet):
         
 
 # --------- STUDENT ASSIGNMENT AND QUIZ GRADES ---------
-class StudentAssignmentGradesView(generics.ListAPIView):
+class StudentAssignmentGradesView(EagerLoadingMixin, generics.ListAPIView):
     serializer_class = AssignmentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
-        # Only assignments assigned to the student with a grade (not null)
-        return Assignment.objects.filter(assigned_to=user).exclude(grade__isnull=True)
+        # Only assignments the student has a grade for, read through their submission
+        return (Assignment.objects
+                .filter(submissions__student=user, submissions__grade__isnull=False)
+                .annotate(grade=F('submissions__grade'), submitted_at=F('submissions__submitted_at')))
 
 
-class StudentQuizGradesView(generics.ListAPIView):
+class StudentQuizGradesView(EagerLoadingMixin, generics.ListAPIView):
     serializer_class = QuizResultSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -499,6 +716,23 @@ class StudentQuizGradesView(generics.ListAPIView):
         return QuizResult.objects.filter(student=user).exclude(grade__isnull=True)
 
 
+# --------- STUDENT DASHBOARD ---------
+class StudentDashboardView(APIView):
+    """
+    Everything the student dashboard shows in one response, served from the
+    student's snapshot (see users/dashboard.py).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if request.user.role != 'student':
+            raise PermissionDenied("Only students have a dashboard.")
+        student = full_user(request.user)
+        data = dashboard.get_dashboard(student)
+        data['unread_notifications'] = student.unread_notifications
+        return Response(data)
+
+
 # --------- SUBMIT QUIZ ---------
 class SubmitQuizView(APIView):
     permission_classes = [IsAuthenticated]
@@ -515,7 +749,7 @@ class SubmitQuizView(APIView):
     
 
 # --------- STUDENT QUIZ VIEW ---------
-class StudentQuizViewSet(viewsets.ReadOnlyModelViewSet):
+class StudentQuizViewSet(CatalogCacheMixin, EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
     """
     Viewset for students to see quizzes they are enrolled in.
     """
@@ -530,19 +764,19 @@ class StudentQuizViewSet(viewsets.ReadOnlyModelViewSet):
         return Quiz.objects.filter(subject_id__in=enrolled_subject_ids)
     
 
-class StudentEnrollmentViewSet(viewsets.ReadOnlyModelViewSet):
+class StudentEnrollmentViewSet(EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = EnrollmentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'student':
-            return Enrollment.objects.filter(student=user).select_related('subject')
+            return Enrollment.objects.filter(student=user)
         return Enrollment.objects.none()
     
     
 # --------- ENROLLED STUDENTS---------
-class EnrolledStudentsList(generics.ListAPIView):
+class EnrolledStudentsList(EagerLoadingMixin, generics.ListAPIView):
     serializer_class = StudentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -562,24 +796,67 @@ class EnrolledStudentsList(generics.ListAPIView):
 
 
 # --------- LESSONS ---------
-class LessonViewSet(viewsets.ModelViewSet):
+class LessonViewSet(CatalogCacheMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return LessonSummarySerializer
+        return LessonSerializer
+
     def perform_create(self, serializer):
-        serializer.save(created_by=self.request.user)
+        lesson = serializer.save(created_by=self.request.user)
+        catalog.bump(lesson.subject_id)
+        lessons.prerender([lesson.id])
+
+    def perform_update(self, serializer):
+        previous_subject_id = serializer.instance.subject_id
+        lesson = serializer.save()
+        catalog.bump(previous_subject_id, lesson.subject_id)
+        lessons.prerender([lesson.id])
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        catalog.bump(instance.subject_id)
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'teacher':
-            return Lesson.objects.filter(created_by=user)
+            queryset = Lesson.objects.filter(created_by=user)
         elif user.role == 'student':
             enrolled_subjects = Enrollment.objects.filter(student=user).values_list('subject', flat=True)
-            return Lesson.objects.filter(subject__in=enrolled_subjects)
+            queryset = Lesson.objects.filter(subject__in=enrolled_subjects)
         elif user.role == 'admin':
-            return Lesson.objects.all()
-        return Lesson.objects.none()
+            queryset = Lesson.objects.all()
+        else:
+            return Lesson.objects.none()
+        if self.action == 'list':
+            # Summaries only; lesson bodies can be megabytes
+            queryset = queryset.defer('content')
+        return queryset
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def body(self, request, pk=None):
+        """
+        The lesson rendered to HTML, compressed as the client's Accept-Encoding allows.
+        """
+        lesson = self.get_object()
+        content_hash, encoded = lessons.rendered_body(lesson)
+        encoding = lessons.pick_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        # Each encoding is a different byte sequence, so each gets its own strong ETag
+        etag = f'"{content_hash[:32]}"' if encoding == 'identity' else f'"{content_hash[:32]}-{encoding}"'
+        if catalog.not_modified(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(encoded[encoding], content_type='text/html; charset=utf-8')
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Accept-Encoding', 'Authorization'])
+        return response
 
 
 # --------- BULK UPLOAD ENDPOINT ---------
@@ -590,98 +867,17 @@ def bulk_upload(request):
     if base_path is None:
         return Response({"detail": "Content folder path not configured."}, status=400)
 
+    dry_run = str(request.query_params.get('dry_run', '')).lower() in ('1', 'true', 'yes')
     try:
-        with open(os.path.join(base_path, 'subjects.json'), 'r') as f:
-            subjects_data = json.load(f)
-        with open(os.path.join(base_path, 'lessons.json'), 'r') as f:
-            lessons_data = json.load(f)
-        with open(os.path.join(base_path, 'quizzes.json'), 'r') as f:
-            quizzes_data = json.load(f)
-
-        from .models import Subject, Lesson, Quiz, QuizQuestion, QuizChoice
-
-        created_subjects = {}
-
-        # Create Subjects
-        for subj in subjects_data:
-            subject_obj, _ = Subject.objects.get_or_create(
-                name=subj['name'],
-                defaults={
-                    'description': subj.get('description', ''),
-                    'created_by': request.user
-                }
-            )
-            created_subjects[subj['name']] = subject_obj
-
-        # Create Lessons
-        for lesson in lessons_data:
-            subj_obj = created_subjects.get(lesson['subjectName'])
-            if subj_obj:
-                Lesson.objects.get_or_create(
-                    subject=subj_obj,
-                    title=lesson['title'],
-                    defaults={
-                        'content': lesson['content'],
-                        'created_by': request.user
-                    }
-                )
-
-        # Create Quizzes and their Questions + Choices
-        for quiz in quizzes_data:
-            subj_obj = created_subjects.get(quiz['subjectName'])
-            if not subj_obj:
-                continue
-
-            quiz_obj, _ = Quiz.objects.get_or_create(
-                title=quiz['title'],
-                subject=subj_obj,
-                defaults={
-                    'description': quiz.get('description', ''),
-                    'due_date': quiz.get('due_date'),
-                    'created_by': request.user,
-                }
-            )
-            quiz_obj.questions.all().delete()
-
-            for q in quiz.get('questions', []):
-                question_obj = QuizQuestion.objects.create(
-                    quiz=quiz_obj,
-                    text=q['text'],
-                    type=q.get('type', 'multiple-choice'),
-                )
-                for choice in q.get('choices', []):
-                    QuizChoice.objects.create(
-                        question=question_obj,
-                        text=choice['text'],
-                        is_correct=choice.get('is_correct', False),
-                    )
-
-        return Response({"detail": "Bulk upload successful."}, status=status.HTTP_201_CREATED)
-
+        report = import_content(base_path, request.user, dry_run=dry_run)
     except Exception as e:
         return Response({"detail": f"Bulk upload failed: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
+    if dry_run:
+        return Response({"detail": "Dry run: no changes were written.", "report": report.as_dict()}, status=status.HTTP_200_OK)
+    return Response({"detail": "Bulk upload successful.", "report": report.as_dict()}, status=status.HTTP_201_CREATED)
 
-# --------- ASSIGNMENT SUBMISSION ---------
-class SubmitAssignmentView(APIView):
-    permission_classes = [IsAuthenticated]
 
-    def post(self, request, assignment_id):
-        student = request.user
-        assignment = get_object_or_404(Assignment, id=assignment_id, assigned_to=student)
-
-        # Save submission info here if you want
-
-        Notification.objects.create(
-            recipient=assignment.created_by,
-            title=f"Assignment Submitted: {assignment.title}",
-            message=f"{student.username} has submitted the assignment.",
-            url=f"/teacher/assignments/{assignment.id}/grade",
-            type="assignment_submitted"
-        )
-        return Response({"detail": "Assignment submitted successfully."}, status=status.HTTP_200_OK)
-    
-    
 # --------- SUBMIT QUIZ VIEW ---------
 class SubmitQuizView(APIView):
     permission_classes = [IsAuthenticated]
@@ -693,7 +889,7 @@ class SubmitQuizView(APIView):
         from .utils import grade_quiz
         quiz_result = grade_quiz(student, quiz, answers)
 
-        Notification.objects.create(
+        notify(
             recipient=quiz.created_by,
             title=f"Quiz Submitted: {quiz.title}",
             message=f"{student.username} has submitted the quiz.",
@@ -704,7 +900,7 @@ class SubmitQuizView(APIView):
     
     
 # --- QuizQuestion Viewset for managing questions within a quiz ---
-class QuizQuestionViewSet(viewsets.ModelViewSet):
+class QuizQuestionViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     serializer_class = QuizQuestionSerializer
     permission_classes = [IsAuthenticated]
 
@@ -716,11 +912,21 @@ class QuizQuestionViewSet(viewsets.ModelViewSet):
         quiz_id = self.kwargs.get('quiz_pk')
         quiz = get_object_or_404(Quiz, id=quiz_id)
         serializer.save(quiz=quiz)
+        bump_quiz_version(quiz.id)
+
+    def perform_update(self, serializer):
+        question = serializer.save()
+        bump_quiz_version(question.quiz_id)
+
+    def perform_destroy(self, instance):
+        quiz_id = instance.quiz_id
+        instance.delete()
+        bump_quiz_version(quiz_id)
 
 
 
 # --- QuizChoice Viewset for managing choices within a question ---
-class QuizChoiceViewSet(viewsets.ModelViewSet):
+class QuizChoiceViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     serializer_class = QuizChoiceSerializer
     permission_classes = [IsAuthenticated]
 
@@ -730,7 +936,17 @@ class QuizChoiceViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         question_id = self.kwargs.get('question_pk')
-        serializer.save(question_id=question_id)
+        choice = serializer.save(question_id=question_id)
+        bump_quiz_version(choice.question.quiz_id)
+
+    def perform_update(self, serializer):
+        choice = serializer.save()
+        bump_quiz_version(choice.question.quiz_id)
+
+    def perform_destroy(self, instance):
+        quiz_id = instance.question.quiz_id
+        instance.delete()
+        bump_quiz_version(quiz_id)
 
 # --- SubmitAssignmentView for students submitting assignments ---
 class SubmitAssignmentView(APIView):
@@ -738,11 +954,14 @@ class SubmitAssignmentView(APIView):
 
     def post(self, request, assignment_id):
         student = request.user
-        assignment = get_object_or_404(Assignment, id=assignment_id, assigned_to=student)
-
-        # Optional: Add logic to save submission data here
+        assignment = get_object_or_404(
+            Assignment, id=assignment_id, published=True, subject__enrollment__student=student,
+        )
+        AssignmentSubmission.objects.update_or_create(
+            assignment=assignment, student=student, defaults={'submitted_at': timezone.now()},
+        )
 
-        Notification.objects.create(
+        notify(
             recipient=assignment.created_by,
             title=f"Assignment Submitted: {assignment.title}",
             message=f"{student.username} has submitted the assignment.",
@@ -762,11 +981,21 @@ class SubmitQuizView(APIView):
 
         quiz_result = grade_quiz(student, quiz, answers)
 
-        Notification.objects.create(
+        notify(
             recipient=quiz.created_by,
             title=f"Quiz Submitted: {quiz.title}",
             message=f"{student.username} has submitted the quiz.",
             url=f"/teacher/quizzes/{quiz.id}/grade",
             type="quiz_submitted"
         )
-        return Response({'grade': quiz_result.grade}, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response({'grade': quiz_result.grade}, status=status.HTTP_200_OK)
+
+# --------- ANSWER KEY CACHE STATS ---------
+class AnswerKeyCacheStatsView(APIView):
+    """
+    Hit/miss counters of the answer-key cache of the worker serving the request.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(answer_key_cache.stats())
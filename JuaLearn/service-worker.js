@@ -1,5 +1,7 @@
 const CACHE_NAME = 'jualearn-cache-v1';
 const OFFLINE_URL = '/offline.html';
+// Subject bundles downloaded for offline study, kept across app shell updates
+const BUNDLE_CACHE = 'jualearn-bundles-v1';
 
 const FILES_TO_CACHE = [
   '/',
@@ -23,7 +25,7 @@ self.addEventListener('activate', event => {
     caches.keys().then(keys =>
       Promise.all(
         keys.map(key => {
-          if (key !== CACHE_NAME) {
+          if (key !== CACHE_NAME && key !== BUNDLE_CACHE) {
             return caches.delete(key);
           }
         })
@@ -46,3 +48,42 @@ self.addEventListener('fetch', event => {
     caches.match(event.request).then(response => response || fetch(event.request))
   );
 });
+
+// Offline subjects: the page posts {type: 'SYNC_SUBJECT', subjectId, apiBase, token}
+// and the worker downloads only what changed since the bundle it already has
+async function syncSubject({ subjectId, apiBase, token }) {
+  const cache = await caches.open(BUNDLE_CACHE);
+  const cacheKey = `/offline/subjects/${subjectId}.json`;
+  const stored = await cache.match(cacheKey);
+  const bundle = stored ? await stored.json() : null;
+
+  const url = `${apiBase}subjects/${subjectId}/bundle/${bundle ? `?since=${bundle.version}` : ''}`;
+  const response = await fetch(url, { headers: { Authorization: `Bearer ${token}` } });
+  if (!response.ok) {
+    throw new Error(`Bundle download failed with status ${response.status}`);
+  }
+  const delta = await response.json();
+
+  // base is null when the server sent the whole bundle
+  const entries = bundle && delta.base !== null ? { ...bundle.entries } : {};
+  delta.removed.forEach(key => delete entries[key]);
+  Object.assign(entries, delta.entries);
+  const merged = { subject: delta.subject, version: delta.version, digest: delta.digest, entries };
+  await cache.put(cacheKey, new Response(JSON.stringify(merged), {
+    headers: { 'Content-Type': 'application/json' },
+  }));
+  return merged;
+}
+
+self.addEventListener('message', event => {
+  if (!event.data || event.data.type !== 'SYNC_SUBJECT') {
+    return;
+  }
+  const reply = message => event.source && event.source.postMessage(message);
+  event.waitUntil(
+    syncSubject(event.data).then(
+      bundle => reply({ type: 'SUBJECT_SYNCED', subjectId: bundle.subject, version: bundle.version }),
+      error => reply({ type: 'SUBJECT_SYNC_FAILED', subjectId: event.data.subjectId, error: String(error) })
+    )
+  );
+});
@@ -18,7 +18,8 @@ type Lesson = {
   id: number;
   title: string;
   subject: { id: number; name: string };
-  content: string;
+  size: number;
+  version: string;
 };
 
 const AdminLessons: React.FC = () => {
@@ -64,11 +65,17 @@ const AdminLessons: React.FC = () => {
     setModalOpen(true);
   };
 
-  const openEditModal = (lesson: Lesson) => {
-    setEditLesson(lesson);
-    setForm({ title: lesson.title, subject: lesson.subject.id.toString(), content: lesson.content });
-    setError(null);
-    setModalOpen(true);
+  const openEditModal = async (lesson: Lesson) => {
+    // Lists only carry summaries; the markdown comes from the lesson itself
+    try {
+      const res = await api.get(`/lessons/${lesson.id}/`);
+      setEditLesson(lesson);
+      setForm({ title: res.data.title, subject: res.data.subject.toString(), content: res.data.content });
+      setError(null);
+      setModalOpen(true);
+    } catch {
+      alert('Failed to load lesson');
+    }
   };
 
   const handleDelete = async (id: number) => {
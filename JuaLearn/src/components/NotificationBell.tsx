@@ -39,7 +39,7 @@ const NotificationBell: React.FC = () => {
       setLoading(true);
       axios
         .get("/notifications/")
-        .then((res) => setNotifications(res.data))
+        .then((res) => setNotifications(res.data.results))
         .catch(console.error)
         .finally(() => setLoading(false));
     }
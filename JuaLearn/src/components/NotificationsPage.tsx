@@ -28,7 +28,7 @@ const NotificationsPage: React.FC = () => {
     setLoading(true);
     try {
       const res = await axios.get("/notifications/");
-      setNotifications(res.data);
+      setNotifications(res.data.results);
       setError(null);
     } catch (e: any) {
       setError(e.message || "Failed to load notifications.");
@@ -64,7 +64,7 @@ const TopBar: React.FC = () => {
       }
       setSearchLoading(true);
       axios
-        .get(`/search/?q=${encodeURIComponent(e.target.value.trim())}`)
+        .get(`/search/autocomplete/?q=${encodeURIComponent(e.target.value.trim())}`)
         .then((res) => {
           setSearchResults(res.data?.results || []);
           setSearchLoading(false);